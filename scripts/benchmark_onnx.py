@@ -0,0 +1,163 @@
+"""Parity check + throughput benchmark: PyTorch vs ONNX Runtime int8.
+
+So sánh output của backend "torch" và "onnx" cho embedding model (bge-m3)
+và cross-encoder (bge-reranker-v2-m3) trên CPU, rồi đo throughput.
+
+Usage:
+    # Cả embedding và reranker, dùng câu hỏi trong golden dataset + chunks.json
+    python scripts/benchmark_onnx.py
+
+    # Chỉ reranker, 64 samples, 4 threads
+    python scripts/benchmark_onnx.py --target reranker --limit 64 --threads 4
+
+Ngưỡng parity mặc định:
+    - embedding: cosine(torch, onnx) trung bình ≥ 0.99
+    - reranker:  Spearman rank correlation ≥ 0.95
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.core.config import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%H:%M:%S",
+)
+logger = logging.getLogger("benchmark_onnx")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Parity + throughput: PyTorch vs ONNX Runtime int8",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--target", choices=["all", "embedding", "reranker"], default="all")
+    parser.add_argument("--limit", type=int, default=32, help="Số samples (default: 32)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần lặp khi đo throughput")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = auto)")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-spearman", type=float, default=0.95)
+    return parser.parse_args()
+
+
+def load_samples(limit: int) -> tuple[list[str], list[str]]:
+    """Lấy queries từ golden dataset và passages từ chunks.json."""
+    with open("data/evaluation/golden_dataset.json", encoding="utf-8") as f:
+        queries = [s["question"] for s in json.load(f)["samples"]]
+
+    with open(settings.chunks_json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    chunks = data.get("chunks", []) if isinstance(data, dict) else data
+    passages = [c.get("content", "")[:400] for c in chunks if c.get("content")]
+
+    return queries[:limit], passages[:limit]
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    """Spearman rank correlation (không cần scipy)."""
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def throughput(fn, n_items: int, repeat: int) -> float:
+    """Items / giây (bỏ lần chạy đầu làm warmup)."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return n_items * repeat / (time.perf_counter() - start)
+
+
+def bench_embedding(texts: list[str], args: argparse.Namespace) -> bool:
+    from sentence_transformers import SentenceTransformer
+
+    from src.core.onnx_backend import load_sentence_transformer
+
+    torch_model = SentenceTransformer(settings.embedding_model, device="cpu")
+    onnx_model = load_sentence_transformer(settings.embedding_model)
+
+    def encode(model):
+        return model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True)
+
+    ref, out = encode(torch_model), encode(onnx_model)
+    cosines = np.sum(ref * out, axis=1)
+    ok = float(cosines.mean()) >= args.min_cosine
+
+    torch_tps = throughput(lambda: encode(torch_model), len(texts), args.repeat)
+    onnx_tps = throughput(lambda: encode(onnx_model), len(texts), args.repeat)
+
+    logger.info(
+        f"[embedding] cosine mean={cosines.mean():.4f} min={cosines.min():.4f} "
+        f"→ {'PASS' if ok else 'FAIL'}"
+    )
+    logger.info(
+        f"[embedding] torch={torch_tps:.1f} texts/s, onnx={onnx_tps:.1f} texts/s "
+        f"(x{onnx_tps / torch_tps:.2f})"
+    )
+    return ok
+
+
+def bench_reranker(queries: list[str], passages: list[str], args: argparse.Namespace) -> bool:
+    from sentence_transformers import CrossEncoder
+
+    from src.core.onnx_backend import load_cross_encoder
+
+    pairs = [(q, p) for q in queries[:4] for p in passages]
+
+    torch_model = CrossEncoder(settings.cross_encoder_model, max_length=512, device="cpu")
+    onnx_model = load_cross_encoder(settings.cross_encoder_model, max_length=512)
+
+    def predict(model):
+        return np.asarray(model.predict(pairs, batch_size=args.batch_size))
+
+    ref, out = predict(torch_model), predict(onnx_model)
+    rho = spearman(ref, out)
+    ok = rho >= args.min_spearman
+
+    torch_pps = throughput(lambda: predict(torch_model), len(pairs), args.repeat)
+    onnx_pps = throughput(lambda: predict(onnx_model), len(pairs), args.repeat)
+
+    logger.info(
+        f"[reranker] spearman={rho:.4f} max|Δ|={np.abs(ref - out).max():.3f} "
+        f"→ {'PASS' if ok else 'FAIL'}"
+    )
+    logger.info(
+        f"[reranker] torch={torch_pps:.1f} pairs/s, onnx={onnx_pps:.1f} pairs/s "
+        f"(x{onnx_pps / torch_pps:.2f})"
+    )
+    return ok
+
+
+def main() -> int:
+    args = parse_args()
+    if args.threads:
+        settings.onnx_intra_op_threads = args.threads
+
+    queries, passages = load_samples(args.limit)
+    logger.info(f"Samples: {len(queries)} queries, {len(passages)} passages")
+
+    ok = True
+    if args.target in ("all", "embedding"):
+        ok &= bench_embedding(queries + passages, args)
+    if args.target in ("all", "reranker"):
+        ok &= bench_reranker(queries, passages, args)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
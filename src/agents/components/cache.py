@@ -1,33 +1,270 @@
-"""Semantic caching mechanism for RAG — hybrid RAM + Redis backend."""
+"""Semantic caching mechanism for RAG — hybrid RAM + Redis backend.
 
+Redis entries are hashes (key ``tsbot:cache:<corpus>:<md5>``):
+
+    q     query text (utf-8)
+    emb   embedding, raw float16 bytes
+    resp  response, zlib-compressed msgpack
+    ts    insert time, epoch seconds
+
+Exact-match hits only fetch ``ts`` + ``resp``; ``emb`` is read during warmup.
+
+Entries are namespaced by corpus: Redis keys (and Qdrant payloads for the
+shared backend) carry the corpus fingerprint, and RAM slots are dropped when
+the local corpus version changes. A reindex/upload therefore invalidates
+every answer built from the old corpus without scanning.
+"""
+
+import asyncio
 import hashlib
+import heapq
 import json
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
+import msgpack
 import numpy as np
 
+from src.agents.components.eviction import make_policy
 from src.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 
 class SemanticCache:
-    """Hybrid semantic cache: exact hash lookup via Redis + cosine similarity in RAM."""
+    """Hybrid semantic cache: exact hash lookup via Redis + cosine similarity in RAM.
+
+    RAM entries live in fixed slots: embeddings are rows of one preallocated
+    matrix, with parallel arrays for expiry time. Lookup is one matrix-vector
+    product plus a masked argmax (or an HNSW query once the cache grows past
+    ``cache_ann_threshold`` and hnswlib is installed).
+
+    Capacity is bounded by entry count and by bytes (embedding + serialized
+    response). Expired entries are dropped via a TTL min-heap; when full, the
+    configured eviction policy (LRU / LFU / W-TinyLFU) picks a victim.
+    """
 
-    def __init__(self):
-        self._cache: List[Dict[str, Any]] = []
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self._capacity = max_entries or settings.cache_max_entries
+        self._max_bytes = max_bytes or settings.cache_max_memory_mb * 1024 * 1024
         self._ttl_hours = settings.cache_ttl_hours
+        self._ram_ttl_seconds = self._ttl_hours * 3600  # TTL của RAM slots
         self._threshold = settings.cache_similarity_threshold
         self._redis: Optional[Any] = None  # redis.asyncio.Redis, lazy init
         self._redis_initialized = False
 
+        self._corpus_version: Optional[int] = None
+        self._reset_slots()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "inserts": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "rejected": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._capacity - len(self._free)
+
+    # ── Slot storage ───────────────────────────────────────────────────────
+
+    def _reset_slots(self):
+        """(Re)allocate empty slot storage."""
+        # Matrix allocated on first add, khi biết dimension
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dim) float32
+        self._expires_at = np.zeros(self._capacity, dtype=np.float64)  # epoch s; 0 = slot trống
+        self._sizes = np.zeros(self._capacity, dtype=np.int64)  # bytes / slot
+        self._generation = np.zeros(self._capacity, dtype=np.int64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * self._capacity
+        self._free: List[int] = list(range(self._capacity - 1, -1, -1))
+        self._ttl_heap: List[Tuple[float, int, int]] = []  # (expires_at, slot, generation)
+        self._bytes = 0
+        self._policy = make_policy(settings.cache_eviction_policy, self._capacity)
+
+        # Optional ANN index (hnswlib), label = slot
+        self._ann: Optional[Any] = None
+
+    def _check_corpus(self):
+        """Bỏ toàn bộ RAM slots khi corpus được load lại (reindex/upload)."""
+        from src.agents.components.vector_store import get_corpus_version
+
+        version = get_corpus_version()
+        if version != self._corpus_version:
+            if len(self):
+                logger.info(f"Corpus version {self._corpus_version} → {version}: dropping {len(self)} cached answers")
+                self._reset_slots()
+            self._corpus_version = version
+
+    def _valid_mask(self, now: float) -> np.ndarray:
+        return self._expires_at > now
+
+    @staticmethod
+    def _entry_size(query_text: str, vec: np.ndarray, response: Dict) -> int:
+        """Ước lượng bytes của một entry (embedding + query + response JSON)."""
+        payload = json.dumps(response, ensure_ascii=False, default=str)
+        return vec.nbytes + len(query_text.encode()) + len(payload.encode())
+
+    def _clear_slot(self, slot: int):
+        self._bytes -= int(self._sizes[slot])
+        self._expires_at[slot] = 0.0
+        self._sizes[slot] = 0
+        self._entries[slot] = None
+        self._free.append(slot)
+        self._policy.on_remove(slot)
+        if self._ann is not None:
+            try:
+                self._ann.mark_deleted(slot)
+            except Exception:
+                pass
+
+    def _expire(self, now: Optional[float] = None):
+        """Pop hết entries đã hết hạn khỏi TTL heap (lazy: bỏ qua bản ghi cũ)."""
+        now = now or time.time()
+        while self._ttl_heap and self._ttl_heap[0][0] <= now:
+            _, slot, generation = heapq.heappop(self._ttl_heap)
+            if self._entries[slot] is not None and self._generation[slot] == generation:
+                self._clear_slot(slot)
+                self._stats["expirations"] += 1
+
+    def _occupied(self) -> np.ndarray:
+        return self._expires_at > 0
+
+    def _make_room(self, key: str, size: int) -> bool:
+        """Giải phóng slot/bytes cho entry mới. False nếu policy từ chối admit."""
+        while not self._free or self._bytes + size > self._max_bytes:
+            if len(self) == 0:
+                break
+            victim = self._policy.victim(self._occupied())
+            victim_key = self.get_cache_key(self._entries[victim]["query_text"])
+            if not self._policy.admit(key, victim_key):
+                self._stats["rejected"] += 1
+                return False
+            self._clear_slot(victim)
+            self._stats["evictions"] += 1
+        return bool(self._free) and size <= self._max_bytes
+
+    def _store_entry(
+        self,
+        query_text: str,
+        query_embedding: np.ndarray,
+        response: Dict,
+        timestamp: datetime,
+    ) -> int:
+        """Ghi entry vào một slot; trả về slot index (-1 nếu không được admit)."""
+        self._check_corpus()
+        vec = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        if self._matrix is None:
+            self._matrix = np.zeros((self._capacity, vec.shape[0]), dtype=np.float32)
+
+        expires_at = timestamp.timestamp() + self._ram_ttl_seconds
+        self._expire()
+        if expires_at <= time.time():
+            return -1
+
+        key = self.get_cache_key(query_text)
+        size = self._entry_size(query_text, vec, response)
+        if not self._make_room(key, size):
+            return -1
+
+        slot = self._free.pop()
+        self._matrix[slot] = vec
+        self._expires_at[slot] = expires_at
+        self._sizes[slot] = size
+        self._generation[slot] += 1
+        self._bytes += size
+        self._entries[slot] = {
+            "query_text": query_text,
+            "response": response,
+            "timestamp": timestamp,
+        }
+        heapq.heappush(self._ttl_heap, (expires_at, slot, int(self._generation[slot])))
+        self._policy.on_insert(slot, key)
+        self._stats["inserts"] += 1
+        self._ann_add(slot)
+        return slot
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate, evictions, memory usage của RAM cache."""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self._capacity,
+            "memory_bytes": self._bytes,
+            "max_memory_bytes": self._max_bytes,
+            "policy": self._policy.name,
+            "backend": settings.cache_backend,
+        }
+
+    # ── Optional ANN index ─────────────────────────────────────────────────
+
+    def _ann_add(self, slot: int):
+        """Cập nhật ANN index (build lần đầu khi vượt ngưỡng)."""
+        threshold = settings.cache_ann_threshold
+        if not threshold:
+            return
+
+        if self._ann is None:
+            if len(self) < threshold:
+                return
+            try:
+                import hnswlib
+            except ImportError:
+                return
+            ann = hnswlib.Index(space="ip", dim=self._matrix.shape[1])
+            ann.init_index(max_elements=self._capacity, ef_construction=200, M=16)
+            ann.set_ef(64)
+            slots = np.flatnonzero(self._expires_at)
+            ann.add_items(self._matrix[slots], slots)
+            self._ann = ann
+            logger.info(f"Semantic cache ANN index built ({slots.size} entries)")
+            return
+
+        try:
+            self._ann.unmark_deleted(slot)
+        except Exception:
+            pass
+        self._ann.add_items(self._matrix[slot:slot + 1], [slot])
+
+    def _best_match(self, query_vec: np.ndarray, now: float) -> Tuple[int, float]:
+        """(slot, similarity) của entry còn hạn gần nhất; slot = -1 nếu không có."""
+        valid = self._valid_mask(now)
+        if not valid.any():
+            return -1, -1.0
+
+        if self._ann is not None:
+            try:
+                k = min(8, int(valid.sum()))
+                labels, distances = self._ann.knn_query(query_vec, k=k)
+                for label, dist in zip(labels[0], distances[0]):
+                    if valid[label]:
+                        return int(label), 1.0 - float(dist)  # space="ip": dist = 1 - dot
+            except Exception as e:
+                logger.debug(f"ANN query failed, falling back to brute force: {e}")
+
+        sims = np.where(valid, self._matrix @ query_vec, -np.inf)
+        slot = int(np.argmax(sims))
+        return slot, float(sims[slot])
+
     # ── Helpers ────────────────────────────────────────────────────────────
 
+    @staticmethod
+    def namespace() -> str:
+        """Corpus namespace của cache keys (fingerprint của corpus đang load)."""
+        from src.agents.components.vector_store import get_corpus_fingerprint
+
+        return get_corpus_fingerprint() or "default"
+
     def get_cache_key(self, query: str) -> str:
-        """Generate MD5 hash key cho Redis."""
-        return f"tsbot:cache:{hashlib.md5(query.lower().strip().encode()).hexdigest()}"
+        """Generate MD5 hash key cho Redis (trong namespace của corpus hiện tại)."""
+        digest = hashlib.md5(query.lower().strip().encode()).hexdigest()
+        return f"tsbot:cache:{self.namespace()}:{digest}"
 
     async def _get_redis(self) -> Optional[Any]:
         """Lazy init Redis connection."""
@@ -46,8 +283,7 @@ class SemanticCache:
             import redis.asyncio as aioredis
             self._redis = aioredis.from_url(
                 redis_url,
-                encoding="utf-8",
-                decode_responses=True,
+                decode_responses=False,  # binary fields (float16, msgpack)
                 socket_connect_timeout=2,
                 socket_timeout=2,
             )
@@ -59,111 +295,145 @@ class SemanticCache:
 
         return self._redis
 
-    async def preload_from_redis(self):
-        """Preload valid cache entries từ Redis vào RAM khi startup."""
+    # ── Redis serialization ────────────────────────────────────────────────
+
+    @staticmethod
+    def _pack_entry(query_text: str, query_embedding: np.ndarray, response: Dict) -> Dict[str, bytes]:
+        """Entry → Redis hash fields (float16 embedding, compressed msgpack response)."""
+        vec = np.asarray(query_embedding, dtype=np.float16).reshape(-1)
+        return {
+            "q": query_text.encode(),
+            "emb": vec.tobytes(),
+            "resp": zlib.compress(msgpack.packb(response, use_bin_type=True, default=str)),
+            "ts": str(time.time()).encode(),
+        }
+
+    @staticmethod
+    def _unpack_response(blob: bytes) -> Dict:
+        return msgpack.unpackb(zlib.decompress(blob), raw=False)
+
+    @staticmethod
+    def _unpack_embedding(blob: bytes) -> np.ndarray:
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+    def _is_fresh(self, ts: Optional[bytes]) -> bool:
+        return ts is not None and time.time() - float(ts) <= self._ttl_hours * 3600
+
+    async def preload_from_redis(
+        self,
+        max_entries: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+    ):
+        """Preload valid cache entries từ Redis vào RAM.
+
+        Dùng SCAN (không block Redis như KEYS) + pipeline HMGET theo từng batch,
+        dừng khi đủ ``max_entries`` hoặc hết ``timeout_seconds``. Được chạy
+        background lúc startup nên không làm chậm readiness.
+        """
         r = await self._get_redis()
         if not r:
             return
 
+        max_entries = max_entries or settings.cache_warmup_max_entries or self._capacity
+        timeout_seconds = timeout_seconds or settings.cache_warmup_timeout_seconds
+        batch_size = settings.cache_warmup_batch_size
+        deadline = time.monotonic() + timeout_seconds
+        scanned = loaded = 0
+
         try:
-            keys = await r.keys("tsbot:cache:*")
-            loaded = 0
-            current_time = datetime.now(timezone.utc)
-
-            for key in keys:
-                raw = await r.get(key)
-                if not raw:
-                    continue
-                try:
-                    entry = json.loads(raw)
-                except Exception:
-                    continue
-
-                # Parse timestamp
-                ts_str = entry.get("timestamp")
-                try:
-                    ts = datetime.fromisoformat(ts_str)
-                    if ts.tzinfo is None:
-                        ts = ts.replace(tzinfo=timezone.utc)
-                except Exception:
-                    continue
-
-                if (current_time - ts) > timedelta(hours=self._ttl_hours):
-                    continue
-
-                # Reconstruct embedding từ list
-                emb_list = entry.get("query_embedding")
-                if not emb_list:
-                    continue
-                query_embedding = np.array(emb_list, dtype=np.float32)
-
-                self._cache.append({
-                    "query_text": entry["query_text"],
-                    "query_embedding": query_embedding,
-                    "response": entry["response"],
-                    "timestamp": ts,
-                })
-                loaded += 1
-
-            logger.info(f"Preloaded {loaded}/{len(keys)} entries from Redis into RAM cache")
+            cursor = 0
+            while True:
+                cursor, keys = await r.scan(
+                    cursor, match=f"tsbot:cache:{self.namespace()}:*", count=batch_size, _type="hash"
+                )
+                if keys:
+                    scanned += len(keys)
+                    pipe = r.pipeline(transaction=False)
+                    for key in keys:
+                        pipe.hmget(key, "q", "emb", "resp", "ts")
+                    for query_text, emb, resp, ts in await pipe.execute():
+                        if not (query_text and emb and resp) or not self._is_fresh(ts):
+                            continue
+                        try:
+                            response = self._unpack_response(resp)
+                            query_embedding = self._unpack_embedding(emb)
+                        except Exception:
+                            continue
+
+                        timestamp = datetime.fromtimestamp(float(ts), tz=timezone.utc)
+                        if self._store_entry(query_text.decode(), query_embedding, response, timestamp) >= 0:
+                            loaded += 1
+
+                if cursor == 0 or loaded >= max_entries:
+                    break
+                if time.monotonic() > deadline:
+                    logger.info(f"Redis cache warmup stopped: budget of {timeout_seconds}s reached")
+                    break
+                await asyncio.sleep(0)  # nhường event loop cho requests khác
+
+            logger.info(f"Preloaded {loaded} entries from Redis into RAM cache ({scanned} keys scanned)")
         except Exception as e:
             logger.warning(f"Redis preload failed: {e}")
 
     # ── Sync lookup (kept for backward compat in rag_agent) ────────────────
 
-    def lookup(self, query_embedding: np.ndarray, threshold: Optional[float] = None) -> Optional[Dict]:
-        """Cosine similarity lookup trong RAM (sync)."""
-        if not self._cache:
-            return None
-
-        effective_threshold = threshold or self._threshold
-        current_time = datetime.now(timezone.utc)
-
-        if query_embedding.ndim == 1:
-            query_vec = query_embedding.reshape(1, -1)
-        else:
-            query_vec = query_embedding
-
-        best_match = None
-        max_sim = -1.0
+    def lookup(
+        self,
+        query_embedding: np.ndarray,
+        threshold: Optional[float] = None,
+        query_text: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """Cosine similarity lookup trong RAM (sync).
 
-        for entry in self._cache:
-            if (current_time - entry["timestamp"]) > timedelta(hours=self._ttl_hours):
-                continue
+        ``query_text`` (nếu có) được ghi nhận vào sketch tần suất của W-TinyLFU.
+        """
+        if query_text:
+            self._policy.record_request(self.get_cache_key(query_text))
 
-            cached_vec = entry["query_embedding"]
-            if cached_vec.ndim == 1:
-                cached_vec = cached_vec.reshape(1, -1)
+        self._check_corpus()
+        if self._matrix is None:
+            self._stats["misses"] += 1
+            return None
 
-            similarity = np.dot(cached_vec, query_vec.T).item()
-            if similarity > max_sim:
-                max_sim = similarity
-                best_match = entry
+        now = time.time()
+        self._expire(now)
+        effective_threshold = threshold or self._threshold
+        query_vec = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
 
-        if len(self._cache) > 1000:
-            self.cleanup()
+        slot, max_sim = self._best_match(query_vec, now)
 
-        if best_match and max_sim >= effective_threshold:
+        if slot >= 0 and max_sim >= effective_threshold:
+            entry = self._entries[slot]
+            self._policy.on_hit(slot)
+            self._stats["hits"] += 1
             logger.info(f"Cache Hit (RAM cosine)! Similarity: {max_sim:.4f}")
             return {
-                "response": best_match["response"],
+                "response": entry["response"],
                 "similarity": max_sim,
-                "original_query": best_match["query_text"],
+                "original_query": entry["query_text"],
             }
 
+        self._stats["misses"] += 1
         return None
 
     def add(self, query_text: str, query_embedding: np.ndarray, response: Dict):
-        """Add vào RAM cache (sync)."""
-        if len(self._cache) >= 200:
-            self._cache.pop(0)
-
-        self._cache.append({
-            "query_text": query_text,
-            "query_embedding": query_embedding,
-            "response": response,
-            "timestamp": datetime.now(timezone.utc),
-        })
+        """Add vào RAM cache (sync).
+
+        Tần suất của key đã được ghi nhận lúc ``lookup`` — không đếm lại ở đây.
+        """
+        self._store_entry(query_text, query_embedding, response, datetime.now(timezone.utc))
+
+    def _promote(self, query_text: str, query_embedding: np.ndarray, response: Dict, ts: bytes):
+        """Redis exact hit → đưa entry vào RAM (hoặc tính hit cho slot đã có)."""
+        self._check_corpus()
+        if self._matrix is not None:
+            query_vec = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            slot, max_sim = self._best_match(query_vec, time.time())
+            if slot >= 0 and max_sim >= self._threshold:
+                self._policy.on_hit(slot)
+                return
+        timestamp = datetime.fromtimestamp(float(ts), tz=timezone.utc)
+        self._store_entry(query_text, query_embedding, response, timestamp)
 
     # ── Async lookup/add (dùng trong process_stream) ───────────────────────
 
@@ -179,25 +449,23 @@ class SemanticCache:
         if r:
             try:
                 key = self.get_cache_key(query_text)
-                raw = await r.get(key)
-                if raw:
-                    entry = json.loads(raw)
-                    ts_str = entry.get("timestamp")
-                    ts = datetime.fromisoformat(ts_str)
-                    if ts.tzinfo is None:
-                        ts = ts.replace(tzinfo=timezone.utc)
-                    if (datetime.now(timezone.utc) - ts) <= timedelta(hours=self._ttl_hours):
-                        logger.info("Cache Hit (Redis exact)!")
-                        return {
-                            "response": entry["response"],
-                            "similarity": 1.0,
-                            "original_query": entry["query_text"],
-                        }
+                query, resp, ts = await r.hmget(key, "q", "resp", "ts")
+                if resp and self._is_fresh(ts):
+                    response = self._unpack_response(resp)
+                    self._policy.record_request(key)
+                    self._stats["hits"] += 1
+                    self._promote(query_text, query_embedding, response, ts)
+                    logger.info("Cache Hit (Redis exact)!")
+                    return {
+                        "response": response,
+                        "similarity": 1.0,
+                        "original_query": query.decode() if query else query_text,
+                    }
             except Exception as e:
                 logger.debug(f"Redis lookup error: {e}")
 
         # 2. Cosine similarity in RAM
-        return self.lookup(query_embedding, threshold)
+        return self.lookup(query_embedding, threshold, query_text=query_text)
 
     async def add_async(
         self,
@@ -214,14 +482,11 @@ class SemanticCache:
         if r:
             try:
                 key = self.get_cache_key(query_text)
-                payload = {
-                    "query_text": query_text,
-                    "query_embedding": query_embedding.tolist(),
-                    "response": response,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                }
-                ttl_seconds = int(self._ttl_hours * 3600)
-                await r.setex(key, ttl_seconds, json.dumps(payload, ensure_ascii=False))
+                pipe = r.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.hset(key, mapping=self._pack_entry(query_text, query_embedding, response))
+                pipe.expire(key, int(self._ttl_hours * 3600))
+                await pipe.execute()
             except Exception as e:
                 logger.debug(f"Redis add error: {e}")
 
@@ -229,8 +494,173 @@ class SemanticCache:
 
     def cleanup(self):
         """Remove expired entries from RAM."""
-        current_time = datetime.now(timezone.utc)
-        self._cache = [
-            entry for entry in self._cache
-            if (current_time - entry["timestamp"]) <= timedelta(hours=self._ttl_hours)
-        ]
+        self._expire()
+
+    async def evict(self, query_text: str, query_embedding: Optional[np.ndarray] = None) -> int:
+        """Xóa entry của một câu hỏi (vd. user báo câu trả lời sai).
+
+        Xóa exact key, và nếu có embedding thì mọi RAM entries đủ giống để
+        được trả cho câu hỏi này (cùng ngưỡng similarity với lookup).
+
+        Returns:
+            Số entries đã xóa (RAM + Redis).
+        """
+        query_texts = {query_text}
+        removed = 0
+
+        if query_embedding is not None and self._matrix is not None:
+            query_vec = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            sims = np.where(self._valid_mask(time.time()), self._matrix @ query_vec, -np.inf)
+            for slot in np.flatnonzero(sims >= self._threshold):
+                query_texts.add(self._entries[slot]["query_text"])
+                self._clear_slot(int(slot))
+                removed += 1
+
+        for slot, entry in enumerate(self._entries):
+            if entry is not None and entry["query_text"] in query_texts:
+                self._clear_slot(slot)
+                removed += 1
+
+        r = await self._get_redis()
+        if r:
+            try:
+                removed += await r.unlink(*[self.get_cache_key(q) for q in query_texts])
+            except Exception as e:
+                logger.debug(f"Redis evict error: {e}")
+
+        logger.info(f"Cache evicted {removed} entries for query: {query_text[:80]}")
+        return removed
+
+    async def flush(self) -> Dict[str, int]:
+        """Xóa toàn bộ cache: RAM slots + Redis keys (SCAN + UNLINK)."""
+        ram_entries = len(self)
+        self._reset_slots()
+
+        redis_keys = 0
+        r = await self._get_redis()
+        if r:
+            try:
+                cursor = 0
+                while True:
+                    cursor, keys = await r.scan(
+                        cursor, match="tsbot:cache:*", count=settings.cache_warmup_batch_size
+                    )
+                    if keys:
+                        redis_keys += await r.unlink(*keys)
+                    if cursor == 0:
+                        break
+            except Exception as e:
+                logger.warning(f"Redis cache flush failed: {e}")
+
+        logger.info(f"Semantic cache flushed: {ram_entries} RAM entries, {redis_keys} Redis keys")
+        return {"ram_entries": ram_entries, "redis_keys": redis_keys}
+
+
+class RetrievalCache:
+    """Bounded LRU of retrieval results (context + sources), before generation.
+
+    Steps 3-8 của RAG pipeline chỉ phụ thuộc vào query, intent và corpus, nên
+    khi answer cache miss vẫn có thể bỏ qua retrieval và chỉ gọi LLM. Keyed by
+    (normalized query hash, intent) and scoped to the corpus version: the
+    whole cache is dropped when chunks are reloaded.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 3600.0):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._corpus_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def query_fingerprint(query: str) -> str:
+        """MD5 of the normalized query (lowercase, collapsed whitespace)."""
+        normalized = " ".join(query.lower().split())
+        return hashlib.md5(normalized.encode()).hexdigest()
+
+    def _check_version(self):
+        from src.agents.components.vector_store import get_corpus_version
+
+        version = get_corpus_version()
+        if version != self._corpus_version:
+            if self._entries:
+                self.invalidations += 1
+                logger.info(f"Retrieval cache invalidated (corpus v{self._corpus_version} → v{version})")
+            self._entries.clear()
+            self._corpus_version = version
+
+    def get(self, query: str, intent: str) -> Optional[Dict[str, Any]]:
+        """Cached retrieval result (None = miss)."""
+        self._check_version()
+        key = (self.query_fingerprint(query), intent)
+        item = self._entries.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        result = item[1]
+        return {**result, "sources": list(result.get("sources", []))}
+
+    def put(self, query: str, intent: str, result: Dict[str, Any]):
+        self._check_version()
+        key = (self.query_fingerprint(query), intent)
+        self._entries[key] = (time.monotonic() + self._ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "corpus_version": self._corpus_version,
+        }
+
+
+def create_semantic_cache() -> SemanticCache:
+    """Tạo semantic cache theo ``settings.cache_backend`` (local | qdrant)."""
+    if settings.cache_backend == "qdrant":
+        from src.agents.components.shared_cache import SharedSemanticCache
+
+        return SharedSemanticCache()
+    return SemanticCache()
+
+
+# Global instance (một cache dùng chung cho lifespan warmup + agents)
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Lấy global semantic cache instance."""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = create_semantic_cache()
+    return _semantic_cache
+
+
+_retrieval_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Lấy global retrieval-stage cache."""
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalCache(
+            max_size=settings.retrieval_cache_size,
+            ttl_seconds=settings.retrieval_cache_ttl_seconds,
+        )
+    return _retrieval_cache
@@ -0,0 +1,170 @@
+"""Eviction policies for the slot-based semantic cache.
+
+Policies track per-slot access metadata and pick a victim when the cache is
+full (by entry count or by bytes):
+
+- ``lru``:     least recently used
+- ``lfu``:     least frequently used (ties → least recently used)
+- ``tinylfu``: W-TinyLFU — new entries always enter a small LRU window
+               (~1% of capacity); when the cache is full, the entry leaving
+               the window competes with the main segment's LRU victim and
+               only displaces it if its key has been requested more often
+               (count-min sketch with periodic aging). New questions get a
+               chance in the window, one-off questions can't flush entries
+               that actually repeat.
+"""
+
+import hashlib
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CountMinSketch:
+    """4-row count-min sketch with halving (aging) every ``sample_size`` increments."""
+
+    DEPTH = 4
+
+    def __init__(self, width: int = 4096, sample_size: Optional[int] = None):
+        self._width = width
+        self._table = np.zeros((self.DEPTH, width), dtype=np.uint32)
+        self._sample_size = sample_size or width * 10
+        self._additions = 0
+
+    def _indexes(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.DEPTH).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self._width
+
+    def increment(self, key: str):
+        rows = np.arange(self.DEPTH)
+        self._table[rows, self._indexes(key)] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._table >>= 1
+            self._additions //= 2
+
+    def estimate(self, key: str) -> int:
+        rows = np.arange(self.DEPTH)
+        return int(self._table[rows, self._indexes(key)].min())
+
+
+class EvictionPolicy:
+    """Base policy: LRU on slot access times."""
+
+    name = "lru"
+
+    def __init__(self, capacity: int):
+        self._last_access = np.zeros(capacity, dtype=np.float64)
+        self._hits = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0.0  # logical clock → thứ tự truy cập ổn định
+
+    def _tick(self) -> float:
+        self._clock += 1.0
+        return self._clock
+
+    def on_insert(self, slot: int, key: Optional[str] = None):
+        self._last_access[slot] = self._tick()
+        self._hits[slot] = 0
+
+    def on_hit(self, slot: int):
+        self._last_access[slot] = self._tick()
+        self._hits[slot] += 1
+
+    def on_remove(self, slot: int):
+        self._last_access[slot] = 0.0
+        self._hits[slot] = 0
+
+    def record_request(self, key: str):
+        """Ghi nhận key được yêu cầu (chỉ TinyLFU dùng)."""
+
+    def victim(self, occupied: np.ndarray) -> int:
+        """Slot bị loại trong số các slot đang dùng (mask)."""
+        candidates = np.flatnonzero(occupied)
+        return int(candidates[np.argmin(self._last_access[candidates])])
+
+    def admit(self, key: str, victim_key: Optional[str]) -> bool:
+        """Có cho entry mới thay thế victim không."""
+        return True
+
+
+class LFUPolicy(EvictionPolicy):
+    name = "lfu"
+
+    def victim(self, occupied: np.ndarray) -> int:
+        candidates = np.flatnonzero(occupied)
+        order = np.lexsort((self._last_access[candidates], self._hits[candidates]))
+        return int(candidates[order[0]])
+
+
+class TinyLFUPolicy(EvictionPolicy):
+    """W-TinyLFU: LRU admission window + LRU main segment, TinyLFU giữa hai segment."""
+
+    name = "tinylfu"
+    WINDOW_RATIO = 0.01
+
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        self._sketch = CountMinSketch(width=max(1024, capacity * 8))
+        self._window_size = max(1, int(capacity * self.WINDOW_RATIO))
+        self._in_window = np.zeros(capacity, dtype=bool)
+        self._keys: List[Optional[str]] = [None] * capacity
+
+    def record_request(self, key: str):
+        self._sketch.increment(key)
+
+    def _lru(self, slots: np.ndarray) -> Optional[int]:
+        if slots.size == 0:
+            return None
+        return int(slots[np.argmin(self._last_access[slots])])
+
+    def on_insert(self, slot: int, key: Optional[str] = None):
+        super().on_insert(slot, key)
+        self._keys[slot] = key
+        self._in_window[slot] = True
+        # Window tràn (cache chưa đầy) → entry cũ nhất của window sang main
+        window = np.flatnonzero(self._in_window)
+        while window.size > self._window_size:
+            self._in_window[self._lru(window)] = False
+            window = np.flatnonzero(self._in_window)
+
+    def on_remove(self, slot: int):
+        super().on_remove(slot)
+        self._keys[slot] = None
+        self._in_window[slot] = False
+
+    def victim(self, occupied: np.ndarray) -> int:
+        """Cache đầy: candidate rời window đấu với LRU của main, bên thua bị loại."""
+        candidate = self._lru(np.flatnonzero(occupied & self._in_window))
+        main_victim = self._lru(np.flatnonzero(occupied & ~self._in_window))
+        if candidate is None:
+            return main_victim
+        if main_victim is None:
+            return candidate
+        if np.count_nonzero(occupied & self._in_window) < self._window_size:
+            return main_victim  # window còn chỗ cho entry mới
+
+        candidate_freq = self._sketch.estimate(self._keys[candidate] or "")
+        victim_freq = self._sketch.estimate(self._keys[main_victim] or "")
+        if candidate_freq > victim_freq:
+            self._in_window[candidate] = False  # candidate được admit vào main
+            return main_victim
+        return candidate
+
+
+_POLICIES = {
+    "lru": EvictionPolicy,
+    "lfu": LFUPolicy,
+    "tinylfu": TinyLFUPolicy,
+}
+
+
+def make_policy(name: str, capacity: int) -> EvictionPolicy:
+    """Create eviction policy by name (unknown → LRU)."""
+    policy_cls = _POLICIES.get(name.lower())
+    if policy_cls is None:
+        logger.warning(f"Unknown cache eviction policy '{name}', using LRU")
+        policy_cls = EvictionPolicy
+    return policy_cls(capacity)
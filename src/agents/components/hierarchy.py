@@ -1,6 +1,8 @@
 """Legal hierarchy navigation, smart selection, merging, and context building.
 
 Uses in-memory chunk_map from vector_store for parent/child/sibling navigation.
+Corpus chunks are shared across requests and never mutated here; per-request
+scores and flags are recorded on a RequestOverlay.
 """
 
 import logging
@@ -9,6 +11,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
+from src.agents.components.overlay import RequestOverlay
 from src.core.config import settings
 from src.core.embeddings import get_embedding_service
 
@@ -92,6 +95,66 @@ def _get_section_type(chunk: Dict) -> str:
     return "unknown"
 
 
+# --- Index-time Chunk Features ---
+
+def build_chunk_features(chunk: Dict, chunk_map: Dict) -> Dict[str, Any]:
+    """Precompute per-chunk strings/features used by the reranker.
+
+    Computed once when chunks are loaded (see vector_store._build_chunk_map)
+    so reranking does not re-derive paths, titles and parents per query.
+
+    Args:
+        chunk: Chunk dictionary.
+        chunk_map: Map chunk_id → chunk (for parent lookup).
+
+    Returns:
+        Dict with legal_path, title, content, parent_snippet, section_type,
+        title_tokens, content_len and rich_text (cross-encoder input).
+    """
+    metadata = chunk.get("metadata", {})
+    content = chunk.get("content", "")
+
+    legal_path = build_legal_hierarchy_path(chunk)
+    title = metadata.get("article_title") or metadata.get("section_title") or metadata.get("chapter_title", "")
+
+    parent_snippet = ""
+    parent_id = metadata.get("parent_id")
+    if parent_id and parent_id in chunk_map:
+        parent_snippet = chunk_map[parent_id].get("content", "")[:80]
+
+    # Order: legal path → title → content (main) → parent context (brief).
+    # Content before parent keeps CE attention on the main content.
+    parts = []
+    if legal_path:
+        parts.append(legal_path)
+    if title:
+        parts.append(title[:100])
+    parts.append(content[:400])
+    if parent_snippet:
+        parts.append(parent_snippet)
+
+    title_tokens = tuple(
+        frozenset(t.lower().split())
+        for t in (
+            metadata.get("article_title", ""),
+            metadata.get("chapter_title", ""),
+            metadata.get("section_title", ""),
+        )
+        if t
+    )
+
+    return {
+        "legal_path": legal_path,
+        "title": title[:100] if title else "",
+        "content": content[:400],
+        "parent_snippet": parent_snippet,
+        "section_type": _get_section_type(chunk),
+        "title_tokens": title_tokens,
+        "content_len": len(content),
+        "rich_text": " | ".join(parts),
+    }
+
+
 # --- Graph Navigation ---
 
 def _get_chunk_map() -> Dict:
@@ -218,6 +281,7 @@ def find_smart_descendants(
     query_embedding: np.ndarray,
     max_descendants: int = None,
     min_score: float = None,
+    overlay: Optional[RequestOverlay] = None,
 ) -> List[Dict]:
     """Find relevant descendants using scoring.
 
@@ -227,9 +291,10 @@ def find_smart_descendants(
         query_embedding: Query embedding.
         max_descendants: Max descendants to return.
         min_score: Minimum relevance score.
+        overlay: Request overlay receiving relevance scores.
 
     Returns:
-        List of relevant descendant chunks with scores.
+        List of relevant descendant chunks, best first.
     """
     max_descendants = max_descendants or settings.max_smart_descendants
     min_score = min_score or settings.min_descendant_score
@@ -261,12 +326,13 @@ def find_smart_descendants(
     for desc in descendants:
         score = score_descendant_relevance(desc, query, query_embedding)
         if score >= min_score:
-            desc["_relevance_score"] = score
-            scored.append(desc)
+            scored.append((score, desc))
+            if overlay is not None:
+                overlay.set_relevance(desc, score)
 
     # Sort by score descending
-    scored.sort(key=lambda x: x.get("_relevance_score", 0), reverse=True)
-    return scored[:max_descendants]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [desc for _, desc in scored[:max_descendants]]
 
 
 def find_smart_siblings(
@@ -275,6 +341,7 @@ def find_smart_siblings(
     query_embedding: np.ndarray,
     max_siblings: int = None,
     min_score: float = None,
+    overlay: Optional[RequestOverlay] = None,
 ) -> List[Dict]:
     """Find relevant sibling chunks using scoring.
 
@@ -284,9 +351,10 @@ def find_smart_siblings(
         query_embedding: Query embedding.
         max_siblings: Max siblings to return.
         min_score: Minimum relevance score.
+        overlay: Request overlay receiving relevance scores.
 
     Returns:
-        List of relevant sibling chunks with scores.
+        List of relevant sibling chunks, best first.
     """
     max_siblings = max_siblings or settings.max_smart_siblings
     min_score = min_score or settings.min_sibling_score
@@ -300,11 +368,12 @@ def find_smart_siblings(
     for sib in siblings:
         score = score_descendant_relevance(sib, query, query_embedding)
         if score >= min_score:
-            sib["_relevance_score"] = score
-            scored.append(sib)
+            scored.append((score, sib))
+            if overlay is not None:
+                overlay.set_relevance(sib, score)
 
-    scored.sort(key=lambda x: x.get("_relevance_score", 0), reverse=True)
-    return scored[:max_siblings]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [sib for _, sib in scored[:max_siblings]]
 
 
 # --- Sibling Enrichment ---
@@ -314,6 +383,7 @@ def enrich_with_all_siblings(
     query: str,
     query_embedding: np.ndarray,
     intent: str = "general",
+    overlay: Optional[RequestOverlay] = None,
 ) -> List[Dict]:
     """Enrich retrieved chunks by adding relevant siblings.
 
@@ -328,6 +398,7 @@ def enrich_with_all_siblings(
         query: Search query.
         query_embedding: Query embedding.
         intent: Query intent for adaptive thresholds.
+        overlay: Request overlay; added siblings are flagged there.
 
     Returns:
         Enriched list of chunks.
@@ -355,7 +426,8 @@ def enrich_with_all_siblings(
                 if sib_id in seen_ids or sib_id not in chunk_map:
                     continue
                 sib = chunk_map[sib_id]
-                sib["_is_sibling_enrichment"] = True
+                if overlay is not None:
+                    overlay.mark_sibling(sib)
                 seen_ids.add(sib_id)
                 enriched.append(sib)
 
@@ -366,12 +438,13 @@ def enrich_with_all_siblings(
             min_scr = 0.25 if is_list else 0.35
             siblings = find_smart_siblings(
                 chunk, query, query_embedding,
-                max_siblings=max_sib, min_score=min_scr,
+                max_siblings=max_sib, min_score=min_scr, overlay=overlay,
             )
             for sib in siblings:
                 sib_id = sib.get("id") or sib.get("metadata", {}).get("chunk_id")
                 if sib_id and sib_id not in seen_ids:
-                    sib["_is_sibling_enrichment"] = True
+                    if overlay is not None:
+                        overlay.mark_sibling(sib)
                     seen_ids.add(sib_id)
                     enriched.append(sib)
 
@@ -380,12 +453,13 @@ def enrich_with_all_siblings(
             max_sib = 5 if is_list else 3
             siblings = find_smart_siblings(
                 chunk, query, query_embedding,
-                max_siblings=max_sib, min_score=0.3,
+                max_siblings=max_sib, min_score=0.3, overlay=overlay,
             )
             for sib in siblings:
                 sib_id = sib.get("id") or sib.get("metadata", {}).get("chunk_id")
                 if sib_id and sib_id not in seen_ids:
-                    sib["_is_sibling_enrichment"] = True
+                    if overlay is not None:
+                        overlay.mark_sibling(sib)
                     seen_ids.add(sib_id)
                     enriched.append(sib)
 
@@ -544,6 +618,7 @@ def build_enriched_context(
     query: str,
     query_embedding: np.ndarray,
     context_settings: Dict = None,
+    overlay: Optional[RequestOverlay] = None,
 ) -> str:
     """Build enriched context for a single chunk with hierarchy.
 
@@ -554,6 +629,7 @@ def build_enriched_context(
         query: Search query.
         query_embedding: Query embedding.
         context_settings: Adaptive settings.
+        overlay: Request overlay receiving relevance scores.
 
     Returns:
         Enriched context string.
@@ -586,7 +662,9 @@ def build_enriched_context(
     if section_type != "diem":
         max_desc = cs.get("max_descendants", settings.max_smart_descendants)
         if max_desc > 0:
-            descendants = find_smart_descendants(chunk, query, query_embedding, max_descendants=max_desc)
+            descendants = find_smart_descendants(
+                chunk, query, query_embedding, max_descendants=max_desc, overlay=overlay,
+            )
             if descendants:
                 desc_parts = []
                 for desc in descendants:
@@ -602,7 +680,9 @@ def build_enriched_context(
     if section_type != "diem":
         max_sib = cs.get("max_siblings", settings.max_smart_siblings)
         if max_sib > 0:
-            siblings = find_smart_siblings(chunk, query, query_embedding, max_siblings=max_sib)
+            siblings = find_smart_siblings(
+                chunk, query, query_embedding, max_siblings=max_sib, overlay=overlay,
+            )
             if siblings:
                 sib_parts = []
                 for sib in siblings:
@@ -620,6 +700,7 @@ def build_multi_chunk_context(
     query: str,
     query_embedding: np.ndarray,
     context_settings: Dict = None,
+    overlay: Optional[RequestOverlay] = None,
 ) -> str:
     """Build context from multiple chunks with enrichment.
 
@@ -628,6 +709,7 @@ def build_multi_chunk_context(
         query: Search query.
         query_embedding: Query embedding.
         context_settings: Adaptive settings.
+        overlay: Request overlay receiving relevance scores.
 
     Returns:
         Combined context string.
@@ -637,7 +719,7 @@ def build_multi_chunk_context(
 
     context_parts = []
     for i, chunk in enumerate(chunks, 1):
-        enriched = build_enriched_context(chunk, query, query_embedding, context_settings)
+        enriched = build_enriched_context(chunk, query, query_embedding, context_settings, overlay)
         context_parts.append(f"=== Nguồn {i} ===\n{enriched}")
 
     return "\n\n".join(context_parts)
@@ -0,0 +1,267 @@
+"""Late-interaction (ColBERT-style MaxSim) reranking with bge-m3 token vectors.
+
+Token vectors của mỗi chunk được tính một lần khi load chunks và lưu gọn trên
+đĩa (float16, memory-mapped). Khi rerank chỉ cần encode query một lần rồi
+MaxSim với các ma trận token đã lưu — không cần cross-encoder forward pass
+cho từng cặp (query, passage).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.agents.components.overlay import chunk_key
+from src.agents.components.reranker import HybridReranker, get_reranker_executor
+from src.core.config import settings
+from src.core.embeddings import get_embedding_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _IndexSnapshot:
+    """Một phiên bản index đã load (đổi cả cụm bằng 1 phép gán)."""
+
+    tokens: np.ndarray
+    offsets: np.ndarray
+    positions: Dict[str, int]
+    fingerprint: str
+
+
+class TokenVectorIndex:
+    """Multi-vector index: mọi token vectors nối thành 1 ma trận float16.
+
+    Mỗi lần build ghi ra một thư mục generation mới trong ``index_dir``;
+    file ``CURRENT`` trỏ tới generation đang dùng:
+        tokens.npy   (total_tokens, dim) float16, load bằng mmap
+        offsets.npy  (n_chunks + 1,) int64 — chunk i = tokens[offsets[i]:offsets[i+1]]
+        meta.json    chunk ids + fingerprint nội dung để phát hiện corpus thay đổi
+
+    Files đang được mmap không bao giờ bị ghi đè: generation mới được ghi vào
+    thư mục tạm, ``os.replace`` vào chỗ rồi mới đổi ``CURRENT``. Reader giữ
+    snapshot cũ tới khi xong; generation cũ chỉ bị unlink (mapping vẫn hợp lệ).
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = Path(index_dir or settings.colbert_index_dir)
+        self._snapshot: Optional[_IndexSnapshot] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @staticmethod
+    def fingerprint(chunk_ids: List[str], texts: List[str]) -> str:
+        digest = hashlib.md5()
+        for cid, text in zip(chunk_ids, texts):
+            digest.update(cid.encode())
+            digest.update(b"\0")
+            digest.update(text.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _current_dir(self) -> Path:
+        """Thư mục generation hiện tại (layout cũ: files nằm thẳng trong index_dir)."""
+        pointer = self.index_dir / self.CURRENT_FILE
+        if pointer.exists():
+            return self.index_dir / pointer.read_text(encoding="utf-8").strip()
+        return self.index_dir
+
+    def load(self) -> bool:
+        """Load index từ đĩa (mmap). Trả về False nếu chưa có."""
+        generation_dir = self._current_dir()
+        meta_path = generation_dir / "meta.json"
+        if not meta_path.exists():
+            return False
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            snapshot = _IndexSnapshot(
+                tokens=np.load(generation_dir / "tokens.npy", mmap_mode="r"),
+                offsets=np.load(generation_dir / "offsets.npy"),
+                positions={cid: i for i, cid in enumerate(meta["chunk_ids"])},
+                fingerprint=meta["fingerprint"],
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load token vector index: {e}")
+            return False
+
+        self._snapshot = snapshot
+        logger.info(
+            f"Token vector index loaded: {len(snapshot.positions)} chunks, "
+            f"{snapshot.tokens.shape[0]} tokens ({snapshot.tokens.nbytes / 1e6:.1f} MB float16)"
+        )
+        return True
+
+    def build(self, chunk_ids: List[str], texts: List[str], batch_size: int = 16):
+        """Encode token vectors cho toàn bộ chunks và ghi ra đĩa (generation mới).
+
+        Bỏ qua nếu index trên đĩa đã khớp (cùng ids + nội dung).
+        """
+        fingerprint = self.fingerprint(chunk_ids, texts)
+        if (self.loaded or self.load()) and self._snapshot.fingerprint == fingerprint:
+            logger.info("Token vector index up to date, skip rebuild")
+            return
+
+        logger.info(f"Building token vector index for {len(texts)} chunks...")
+        embedding_service = get_embedding_service()
+        vectors = embedding_service.encode_token_vectors(texts, batch_size=batch_size)
+
+        offsets = np.zeros(len(vectors) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([v.shape[0] for v in vectors])
+        tokens = np.concatenate(vectors, axis=0).astype(np.float16)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        generation = f"gen-{fingerprint[:12]}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = self.index_dir / f".tmp-{generation}"
+        tmp_dir.mkdir()
+        np.save(tmp_dir / "tokens.npy", tokens)
+        np.save(tmp_dir / "offsets.npy", offsets)
+        with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"chunk_ids": chunk_ids, "fingerprint": fingerprint}, f)
+        os.replace(tmp_dir, self.index_dir / generation)
+
+        pointer_tmp = self.index_dir / f".{self.CURRENT_FILE}.tmp"
+        pointer_tmp.write_text(generation, encoding="utf-8")
+        os.replace(pointer_tmp, self.index_dir / self.CURRENT_FILE)
+
+        if self.load():
+            self._prune(keep=generation)
+
+    def _prune(self, keep: str):
+        """Xóa các generation cũ (unlink an toàn với mmap đang mở trên POSIX)."""
+        for path in self.index_dir.glob("gen-*"):
+            if path.name != keep and path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+
+    def maxsim(self, query_vecs: np.ndarray, chunk_ids: List[Optional[str]]) -> List[Optional[float]]:
+        """MaxSim score (mean over query tokens of max doc-token similarity).
+
+        Tất cả candidates được nối lại để tính bằng 1 phép nhân ma trận.
+
+        Returns:
+            Scores aligned với chunk_ids (None nếu chunk không có trong index).
+        """
+        scores: List[Optional[float]] = [None] * len(chunk_ids)
+        snapshot = self._snapshot  # đọc 1 lần: build song song chỉ đổi con trỏ
+        if snapshot is None or len(query_vecs) == 0:
+            return scores
+
+        slices = []
+        found = []
+        for i, cid in enumerate(chunk_ids):
+            pos = snapshot.positions.get(cid) if cid else None
+            if pos is None:
+                continue
+            start, end = int(snapshot.offsets[pos]), int(snapshot.offsets[pos + 1])
+            if end > start:
+                slices.append(snapshot.tokens[start:end])
+                found.append(i)
+
+        if not found:
+            return scores
+
+        doc_tokens = np.concatenate(slices, axis=0).astype(np.float32)
+        starts = np.cumsum([0] + [len(s) for s in slices[:-1]])
+        sim = doc_tokens @ query_vecs.T  # (total_doc_tokens, q_tokens)
+        per_doc = np.maximum.reduceat(sim, starts, axis=0)  # (n_docs, q_tokens)
+        for i, score in zip(found, per_doc.mean(axis=1)):
+            scores[i] = float(score)
+        return scores
+
+
+class LateInteractionReranker(HybridReranker):
+    """HybridReranker với MaxSim trên token vectors thay cho cross-encoder.
+
+    Giữ nguyên cascade, metadata score và ensemble weights; chỉ thay stage
+    chấm điểm (query, passage).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.model_name = f"{settings.embedding_model}#colbert"
+        self.index = get_token_index()
+
+    @property
+    def model(self):
+        return None  # Không dùng CrossEncoder
+
+    def _cross_encoder_scores(self, query: str, chunks: List[Dict]) -> Optional[List[float]]:
+        try:
+            embedding_service = get_embedding_service()
+            query_vecs = embedding_service.encode_token_vectors([query])[0]
+            scores = self.index.maxsim(query_vecs, [chunk_key(c) for c in chunks])
+
+            # Chunks ngoài index (vd. dense-only từ Qdrant payload) → encode tại chỗ
+            missing = [i for i, s in enumerate(scores) if s is None]
+            if missing:
+                doc_vecs = embedding_service.encode_token_vectors(
+                    [self._build_rich_text(chunks[i]) for i in missing]
+                )
+                for i, vecs in zip(missing, doc_vecs):
+                    scores[i] = float((vecs @ query_vecs.T).max(axis=0).mean())
+
+            return [max(0.0, min(1.0, s)) for s in scores]
+        except Exception as e:
+            logger.warning(f"Late-interaction scoring failed: {e}")
+            return None
+
+    async def _across_encoder_scores(self, query: str, chunks: List[Dict]) -> Optional[List[float]]:
+        """MaxSim scoring off the event loop.
+
+        Returns None after ``reranker_timeout_seconds`` (slow query encoding or
+        on-the-fly encoding of chunks outside the index) so the caller falls
+        back to retrieval + metadata scores.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(get_reranker_executor(), self._cross_encoder_scores, query, chunks),
+                timeout=settings.reranker_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Late-interaction scoring timed out after {settings.reranker_timeout_seconds}s "
+                f"({len(chunks)} chunks) — falling back to retrieval scores"
+            )
+            return None
+
+
+# Global instance
+_token_index: Optional[TokenVectorIndex] = None
+
+
+def get_token_index() -> TokenVectorIndex:
+    """Lấy global token vector index (load từ đĩa nếu có)."""
+    global _token_index
+    if _token_index is None:
+        _token_index = TokenVectorIndex()
+        _token_index.load()
+    return _token_index
+
+
+def build_token_index(chunks: List[Dict]):
+    """Build/refresh token vector index cho chunks vừa load (index-time)."""
+    from src.agents.components.vector_store import get_store
+
+    features = get_store()["chunk_features"]
+    chunk_ids, texts = [], []
+    for chunk in chunks:
+        cid = chunk_key(chunk)
+        if cid and cid in features:
+            chunk_ids.append(cid)
+            texts.append(features[cid]["rich_text"])
+
+    if chunk_ids:
+        get_token_index().build(chunk_ids, texts)
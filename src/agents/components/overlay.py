@@ -0,0 +1,125 @@
+"""Per-request score overlay over the shared, read-only chunk corpus.
+
+Chunks in vector_store (``chunks`` / ``chunk_map``) are shared by every request
+and must never be mutated after load. Pipeline stages record their per-request
+state (retrieval score, rerank score, relevance score, sibling flag) here
+instead, in arrays indexed by the chunk's position in the corpus.
+"""
+
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_key(chunk: Dict) -> Optional[str]:
+    """Return the corpus id of a chunk (``id`` or ``metadata.chunk_id``)."""
+    cid = chunk.get("id") or chunk.get("metadata", {}).get("chunk_id")
+    return str(cid) if cid else None
+
+
+class RequestOverlay:
+    """Lightweight per-request scores keyed by corpus position.
+
+    Chunks that are not part of the loaded corpus (e.g. dense-only results
+    built from Qdrant payloads) get a request-local position past the end
+    of the corpus, so every stage can use the same API. Always resolve
+    ``position()`` before indexing the arrays: registering a request-local
+    chunk may reallocate them.
+    """
+
+    def __init__(self, chunk_index: Mapping[str, int], size: int):
+        self._index = chunk_index
+        self._size = size
+        self._local: Dict[int, int] = {}  # id(chunk) -> position (request-local chunks)
+
+        self.retrieval = np.full(size, np.nan, dtype=np.float32)
+        self.rerank = np.full(size, np.nan, dtype=np.float32)
+        self.relevance = np.full(size, np.nan, dtype=np.float32)
+        self.sibling = np.zeros(size, dtype=bool)
+        self.debug: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def for_store(cls) -> "RequestOverlay":
+        """Create an overlay sized for the currently loaded corpus."""
+        from src.agents.components.vector_store import get_store
+
+        store = get_store()
+        return cls(store.get("chunk_index", {}), len(store.get("chunks", [])))
+
+    def _grow(self, size: int):
+        """Extend score arrays to hold request-local positions."""
+        extra = size - len(self.retrieval)
+        if extra <= 0:
+            return
+        extra = max(extra, 8)
+        self.retrieval = np.concatenate([self.retrieval, np.full(extra, np.nan, dtype=np.float32)])
+        self.rerank = np.concatenate([self.rerank, np.full(extra, np.nan, dtype=np.float32)])
+        self.relevance = np.concatenate([self.relevance, np.full(extra, np.nan, dtype=np.float32)])
+        self.sibling = np.concatenate([self.sibling, np.zeros(extra, dtype=bool)])
+
+    def position(self, chunk: Dict) -> int:
+        """Position of a chunk in the score arrays."""
+        cid = chunk_key(chunk)
+        if cid is not None:
+            pos = self._index.get(cid)
+            if pos is not None:
+                return pos
+
+        key = id(chunk)
+        pos = self._local.get(key)
+        if pos is None:
+            pos = self._size + len(self._local)
+            self._local[key] = pos
+            self._grow(pos + 1)
+        return pos
+
+    # ── Retrieval score ────────────────────────────────────────────────────
+
+    def set_retrieval(self, chunk: Dict, score: float):
+        pos = self.position(chunk)
+        self.retrieval[pos] = score
+
+    def retrieval_score(self, chunk: Dict) -> float:
+        """Fused retrieval score (falls back to the chunk's own ``score``)."""
+        pos = self.position(chunk)
+        value = self.retrieval[pos]
+        if np.isnan(value):
+            return float(chunk.get("score", 0.0) or 0.0)
+        return float(value)
+
+    # ── Rerank score ───────────────────────────────────────────────────────
+
+    def set_rerank(self, chunk: Dict, score: float, debug: Optional[Dict[str, Any]] = None):
+        pos = self.position(chunk)
+        self.rerank[pos] = score
+        if debug is not None:
+            self.debug[pos] = debug
+
+    def rerank_score(self, chunk: Dict, default: float = 0.0) -> float:
+        pos = self.position(chunk)
+        value = self.rerank[pos]
+        return default if np.isnan(value) else float(value)
+
+    # ── Relevance score (smart descendants / siblings) ─────────────────────
+
+    def set_relevance(self, chunk: Dict, score: float):
+        pos = self.position(chunk)
+        self.relevance[pos] = score
+
+    def relevance_score(self, chunk: Dict, default: float = 0.0) -> float:
+        pos = self.position(chunk)
+        value = self.relevance[pos]
+        return default if np.isnan(value) else float(value)
+
+    # ── Sibling enrichment flag ────────────────────────────────────────────
+
+    def mark_sibling(self, chunk: Dict):
+        pos = self.position(chunk)
+        self.sibling[pos] = True
+
+    def is_sibling(self, chunk: Dict) -> bool:
+        pos = self.position(chunk)
+        return bool(self.sibling[pos])
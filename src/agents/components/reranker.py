@@ -1,11 +1,17 @@
 """Advanced Hybrid Reranking with Cross-Encoder ensemble and metadata scoring."""
 
+import asyncio
+import hashlib
 import logging
 import re
-from typing import Any, Dict, List, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 from src.core.config import settings
-from src.agents.components.hierarchy import build_legal_hierarchy_path, find_parent_chunks
+from src.agents.components.hierarchy import build_chunk_features
+from src.agents.components.overlay import RequestOverlay, chunk_key
 
 logger = logging.getLogger(__name__)
 
@@ -20,27 +26,191 @@ SECTION_TYPE_WEIGHTS = {
 }
 
 
+class CrossEncoderScoreCache:
+    """Bounded LRU cache of normalized cross-encoder scores.
+
+    Keyed by (normalized query hash, chunk id, model name) and scoped to the
+    corpus version: the whole cache is dropped when chunks are reloaded.
+    """
+
+    def __init__(self, max_size: int = 50_000):
+        self._max_size = max_size
+        self._scores: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._corpus_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def query_fingerprint(query: str) -> str:
+        """MD5 of the normalized query (lowercase, collapsed whitespace)."""
+        normalized = " ".join(query.lower().split())
+        return hashlib.md5(normalized.encode()).hexdigest()
+
+    def _check_version(self):
+        from src.agents.components.vector_store import get_corpus_version
+
+        version = get_corpus_version()
+        if version != self._corpus_version:
+            if self._scores:
+                self.invalidations += 1
+                logger.info(f"CE score cache invalidated (corpus v{self._corpus_version} → v{version})")
+            self._scores.clear()
+            self._corpus_version = version
+
+    def get_many(self, fingerprint: str, chunk_ids: List[Optional[str]], model: str) -> List[Optional[float]]:
+        """Cached scores aligned with chunk_ids (None = miss)."""
+        self._check_version()
+        results: List[Optional[float]] = []
+        for cid in chunk_ids:
+            key = (fingerprint, cid, model)
+            score = self._scores.get(key) if cid is not None else None
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._scores.move_to_end(key)
+            results.append(score)
+        return results
+
+    def put_many(self, fingerprint: str, chunk_ids: List[Optional[str]], model: str, scores: List[float]):
+        self._check_version()
+        for cid, score in zip(chunk_ids, scores):
+            if cid is None:
+                continue
+            self._scores[(fingerprint, cid, model)] = score
+            self._scores.move_to_end((fingerprint, cid, model))
+        while len(self._scores) > self._max_size:
+            self._scores.popitem(last=False)
+
+    def clear(self):
+        self._scores.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._scores),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "corpus_version": self._corpus_version,
+        }
+
+
+class CrossEncoderBatcher:
+    """Micro-batches cross-encoder pairs from concurrent requests.
+
+    Requests submitted within ``max_wait_ms`` of each other (up to
+    ``max_pairs`` pairs) are merged into one ``predict`` call. Pairs are
+    sorted by length to minimize padding, and inference runs on a dedicated
+    thread pool so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[Tuple[str, str]]], List[float]],
+        max_pairs: int = 64,
+        max_wait_ms: int = 5,
+        workers: int = 1,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self._predict_fn = predict_fn
+        self._max_pairs = max_pairs
+        self._max_wait = max_wait_ms / 1000.0
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reranker")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_worker(self) -> asyncio.AbstractEventLoop:
+        """Start the batching task on the running loop (restart if needed)."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        return loop
+
+    async def submit(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        """Score pairs; resolves when the batch containing them finishes."""
+        if not pairs:
+            return []
+        loop = self._ensure_worker()
+        future = loop.create_future()
+        await self._queue.put((list(pairs), future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[List[Tuple[str, str]], asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        total = len(batch[0][0])
+        deadline = loop.time() + self._max_wait
+
+        while total < self._max_pairs:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            total += len(item[0])
+
+        # Requests that timed out / were cancelled while queued are dropped
+        return [(pairs, fut) for pairs, fut in batch if not fut.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            # Flatten and sort by length → similar lengths share a padded batch
+            flat = [
+                (req_idx, pair_idx, pair)
+                for req_idx, (pairs, _) in enumerate(batch)
+                for pair_idx, pair in enumerate(pairs)
+            ]
+            flat.sort(key=lambda item: len(item[2][0]) + len(item[2][1]))
+
+            try:
+                scores = await loop.run_in_executor(
+                    self._executor, self._predict_fn, [item[2] for item in flat]
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            results = [[0.0] * len(pairs) for pairs, _ in batch]
+            for (req_idx, pair_idx, _), score in zip(flat, scores):
+                results[req_idx][pair_idx] = float(score)
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+            logger.debug(f"Cross-encoder batch: {len(batch)} requests, {len(flat)} pairs")
+
+
 class HybridReranker:
     """Advanced reranker using Cross-Encoder + Retrieval Score + Metadata Score."""
 
     def __init__(self):
-        self._model = None
+        self._batcher: Optional[CrossEncoderBatcher] = None
+        self.score_cache = get_score_cache()
         self.weights = settings.reranker_weights
         self.model_name = settings.cross_encoder_model
 
     @property
     def model(self):
-        """Lazy load CrossEncoder."""
-        if self._model is None:
-            try:
-                from sentence_transformers import CrossEncoder
-                logger.info(f"Loading Cross-Encoder: {self.model_name}")
-                self._model = CrossEncoder(self.model_name, max_length=512, device=settings.reranker_device)
-                logger.info("Cross-Encoder loaded successfully")
-            except Exception as e:
-                logger.warning(f"Failed to load CrossEncoder: {e}")
-                self._model = None
-        return self._model
+        """CrossEncoder dùng chung trong process (load lần đầu nếu chưa preload)."""
+        return get_cross_encoder(self.model_name)
 
     def _extract_target_entities(self, query: str) -> dict:
         """Trích xuất các thực thể ngữ cảnh cần khớp trong chunk.
@@ -111,6 +281,22 @@ class HybridReranker:
             "chapter": re.findall(r'(?:chương|Chương)\s+([IVXLCDM]+|\d+)', query, re.IGNORECASE),
         }
 
+    def _get_features(self, chunk: Dict) -> Dict[str, Any]:
+        """Get precomputed reranker features for a chunk.
+
+        Corpus chunks are looked up in the store (computed at load time);
+        chunks outside the corpus are computed on the fly.
+        """
+        from src.agents.components.vector_store import get_store
+
+        store = get_store()
+        cid = chunk_key(chunk)
+        if cid is not None:
+            features = store["chunk_features"].get(cid)
+            if features is not None:
+                return features
+        return build_chunk_features(chunk, store["chunk_map"])
+
     def calculate_metadata_score(self, chunk: Dict, query: str) -> float:
         """Calculate score based on document metadata and structure.
 
@@ -125,27 +311,19 @@ class HybridReranker:
             Metadata score between 0 and 1.
         """
         metadata = chunk.get("metadata", {})
+        features = self._get_features(chunk)
         score = 0.0
 
         # 1. Section type score
-        section_type = self._get_section_type(chunk)
+        section_type = features["section_type"]
         score += SECTION_TYPE_WEIGHTS.get(section_type, 0.4) * 0.5
 
         # 2. Title matching with query
         query_lower = query.lower()
         query_tokens = set(query_lower.split())
 
-        titles = [
-            metadata.get("article_title", ""),
-            metadata.get("chapter_title", ""),
-            metadata.get("section_title", ""),
-        ]
-
         best_overlap = 0.0
-        for title in titles:
-            if not title:
-                continue
-            title_tokens = set(title.lower().split())
+        for title_tokens in features["title_tokens"]:
             if title_tokens and query_tokens:
                 overlap = len(query_tokens & title_tokens) / max(len(query_tokens), 1)
                 best_overlap = max(best_overlap, overlap)
@@ -154,7 +332,7 @@ class HybridReranker:
 
         # 3. Content length bonus (longer content = more informative, up to a point)
         content = chunk.get("content", "")
-        content_len = len(content)
+        content_len = features["content_len"]
         if content_len > 200:
             score += 0.1
         elif content_len > 100:
@@ -180,26 +358,13 @@ class HybridReranker:
 
     def _get_section_type(self, chunk: Dict) -> str:
         """Determine section type of a chunk."""
-        metadata = chunk.get("metadata", {})
-        content = chunk.get("content", "").lower()
-
-        if metadata.get("point") or metadata.get("point_number") or re.match(r"^[a-zđ]\)", content):
-            return "diem"
-        if metadata.get("clause") or metadata.get("clause_number"):
-            return "khoan"
-        if metadata.get("article") or metadata.get("article_number"):
-            return "dieu"
-        if metadata.get("section") or metadata.get("section_number"):
-            return "muc"
-        if metadata.get("chapter") or metadata.get("chapter_number"):
-            return "chuong"
-        return "unknown"
+        return self._get_features(chunk)["section_type"]
 
     def _build_rich_text(self, chunk: Dict) -> str:
-        """Build rich text for cross-encoder scoring.
+        """Rich text for cross-encoder scoring.
 
-        Order: legal path → title → content (main) → parent context (brief).
-        Placing content before parent ensures CE attention focuses on main content.
+        Order: legal path → title → content (main) → parent context (brief),
+        precomputed at load time (see hierarchy.build_chunk_features).
 
         Args:
             chunk: Chunk dictionary.
@@ -207,34 +372,192 @@ class HybridReranker:
         Returns:
             Rich text string for reranking.
         """
-        parts = []
+        return self._get_features(chunk)["rich_text"]
+
+    # ── Cross-encoder scoring ──────────────────────────────────────────────
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Run the cross-encoder on (query, passage) pairs (blocking)."""
+        model = self.model
+        if model is None:
+            raise RuntimeError("Cross-Encoder unavailable")
+        return [float(s) for s in model.predict(pairs)]
+
+    @staticmethod
+    def _normalize_ce(raw_scores: List[float]) -> List[float]:
+        """Normalize raw cross-encoder logits from [-10, 10] to [0, 1]."""
+        return [max(0.0, min(1.0, (float(s) + 10.0) / 20.0)) for s in raw_scores]
+
+    def _cached_scores(self, query: str, chunks: List[Dict]) -> Tuple[str, List[Optional[str]], List[Optional[float]]]:
+        """Look up cached CE scores → (fingerprint, chunk_ids, scores with None for misses)."""
+        fingerprint = CrossEncoderScoreCache.query_fingerprint(query)
+        chunk_ids = [chunk_key(chunk) for chunk in chunks]
+        cached = self.score_cache.get_many(fingerprint, chunk_ids, self.model_name)
+        return fingerprint, chunk_ids, cached
+
+    def _fill_scores(
+        self,
+        fingerprint: str,
+        chunk_ids: List[Optional[str]],
+        cached: List[Optional[float]],
+        missing: List[int],
+        raw_scores: List[float],
+    ) -> List[float]:
+        """Merge fresh scores for the missing positions into the cached list and store them."""
+        fresh = self._normalize_ce(raw_scores)
+        self.score_cache.put_many(fingerprint, [chunk_ids[i] for i in missing], self.model_name, fresh)
+        scores = list(cached)
+        for i, score in zip(missing, fresh):
+            scores[i] = score
+        return scores
+
+    def _cross_encoder_scores(self, query: str, chunks: List[Dict]) -> Optional[List[float]]:
+        """Synchronous cross-encoder scoring (None if unavailable/failed)."""
+        if not settings.use_cross_encoder:
+            return None
+        fingerprint, chunk_ids, cached = self._cached_scores(query, chunks)
+        missing = [i for i, score in enumerate(cached) if score is None]
+        if not missing:
+            return cached
+        if self.model is None:
+            return None
+        try:
+            pairs = [(query, self._build_rich_text(chunks[i])) for i in missing]
+            return self._fill_scores(fingerprint, chunk_ids, cached, missing, self._predict(pairs))
+        except Exception as e:
+            logger.warning(f"Cross-encoder scoring failed: {e}")
+            return None
 
-        # 1. Legal path (short, locates document)
-        legal_path = build_legal_hierarchy_path(chunk)
-        if legal_path:
-            parts.append(legal_path)
+    async def _across_encoder_scores(self, query: str, chunks: List[Dict]) -> Optional[List[float]]:
+        """Cross-encoder scoring through the shared batcher, off the event loop.
 
-        # 2. Title (≤100 chars)
-        metadata = chunk.get("metadata", {})
-        title = metadata.get("article_title") or metadata.get("section_title") or metadata.get("chapter_title", "")
-        if title:
-            parts.append(title[:100])
+        Returns None on failure or after ``reranker_timeout_seconds`` so the
+        caller falls back to retrieval + metadata scores.
+        """
+        if not settings.use_cross_encoder:
+            return None
+        fingerprint, chunk_ids, cached = self._cached_scores(query, chunks)
+        missing = [i for i, score in enumerate(cached) if score is None]
+        if not missing:
+            return cached
+        if self._batcher is None:
+            self._batcher = CrossEncoderBatcher(
+                predict_fn=self._predict,
+                max_pairs=settings.reranker_batch_max_pairs,
+                max_wait_ms=settings.reranker_batch_wait_ms,
+                executor=get_reranker_executor(),
+            )
+        pairs = [(query, self._build_rich_text(chunks[i])) for i in missing]
+        try:
+            raw_scores = await asyncio.wait_for(
+                self._batcher.submit(pairs),
+                timeout=settings.reranker_timeout_seconds,
+            )
+            return self._fill_scores(fingerprint, chunk_ids, cached, missing, raw_scores)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Cross-encoder timed out after {settings.reranker_timeout_seconds}s "
+                f"({len(pairs)} pairs) — falling back to retrieval scores"
+            )
+        except Exception as e:
+            logger.warning(f"Cross-encoder scoring failed: {e}")
+        return None
+
+    # ── Cascade (cheap first stage before the cross-encoder) ───────────────
+
+    def _first_stage_scores(self, query: str, chunks: List[Dict], overlay: RequestOverlay) -> List[float]:
+        """Cheap stage-1 score: 0.7 × fused retrieval + 0.3 × metadata.
+
+        Retrieval scores are min-max normalized per query first: dense cosine
+        and RRF fusion live on very different scales, and the cascade gap /
+        margin thresholds assume scores spread over [0, 1].
+
+        Sibling-enrichment chunks have no retrieval score of their own; they
+        inherit 0.9 × the best retrieval score among retrieved chunks with the
+        same parent so enrichment is not pruned wholesale.
+        """
+        group_best: Dict[str, float] = {}
+        for chunk in chunks:
+            if overlay.is_sibling(chunk):
+                continue
+            parent_id = chunk.get("metadata", {}).get("parent_id")
+            if parent_id:
+                group_best[parent_id] = max(group_best.get(parent_id, 0.0), overlay.retrieval_score(chunk))
+
+        retrieval_scores = []
+        for chunk in chunks:
+            retrieval_score = overlay.retrieval_score(chunk)
+            if overlay.is_sibling(chunk):
+                parent_id = chunk.get("metadata", {}).get("parent_id")
+                retrieval_score = max(retrieval_score, 0.9 * group_best.get(parent_id, 0.0))
+            retrieval_scores.append(retrieval_score)
+
+        low, high = min(retrieval_scores), max(retrieval_scores)
+        spread = high - low
+        normalized = [(score - low) / spread if spread > 1e-9 else 1.0 for score in retrieval_scores]
+        return [
+            0.7 * score + 0.3 * self.calculate_metadata_score(chunk, query)
+            for chunk, score in zip(chunks, normalized)
+        ]
 
-        # 3. Main content FIRST (≤400 chars) — CE attention priority
-        content = chunk.get("content", "")
-        parts.append(content[:400])
+    def _cascade_prune(
+        self,
+        query: str,
+        chunks: List[Dict],
+        top_k: Optional[int],
+        intent: str,
+        overlay: RequestOverlay,
+    ) -> Tuple[List[Dict], bool]:
+        """Prune candidates before the cross-encoder.
+
+        - Budget per intent (``reranker_cascade_budget``), never below top_k.
+        - Inside [top_k, budget], cut at the largest stage-1 score gap if it
+          is at least ``reranker_cascade_gap``.
+        - Skip the cross-encoder entirely when the top candidate leads by
+          ``reranker_cascade_skip_margin`` (not for list/comparison intents,
+          which need several chunks ranked well).
 
-        # 4. Parent context LAST (≤80 chars, reduced from 150)
-        try:
-            parents = find_parent_chunks(chunk, max_levels=1)
-            for parent in parents:
-                parent_content = parent.get("content", "")
-                if parent_content:
-                    parts.append(parent_content[:80])
-        except Exception:
-            pass
+        Returns:
+            (candidates for the cross-encoder, skip_ce flag).
+        """
+        top_k = top_k or settings.reranker_top_k
+        if not settings.reranker_cascade or len(chunks) <= 1:
+            return chunks, False
+
+        stage1 = self._first_stage_scores(query, chunks, overlay)
+        order = sorted(range(len(chunks)), key=lambda i: stage1[i], reverse=True)
+        ranked = [stage1[i] for i in order]
+
+        budget = settings.reranker_cascade_budget.get(intent, settings.reranker_cascade_budget["general"])
+        budget = max(budget, top_k)
+        keep = min(len(chunks), budget)
+
+        # Cut at the largest score gap between top_k and budget
+        gap_cut = None
+        best_gap = 0.0
+        for pos in range(top_k, keep):
+            gap = ranked[pos - 1] - ranked[pos]
+            if gap > best_gap:
+                best_gap, gap_cut = gap, pos
+        if gap_cut is not None and best_gap >= settings.reranker_cascade_gap:
+            keep = gap_cut
+
+        margin = ranked[0] - ranked[1]
+        skip_ce = (
+            intent not in ("list", "comparison")
+            and margin >= settings.reranker_cascade_skip_margin
+        )
 
-        return " | ".join(parts)
+        pruned = [chunks[i] for i in order[:keep]]
+        logger.info(
+            f"[Cascade] intent={intent} in={len(chunks)} kept={len(pruned)} budget={budget} "
+            f"gap={best_gap:.3f}{' (cut)' if keep == gap_cut else ''} "
+            f"margin={margin:.3f} skip_ce={skip_ce} "
+            f"stage1=[{', '.join(f'{x:.3f}' for x in ranked[:keep])}]"
+        )
+        return pruned, skip_ce
+
+    # ── Reranking ──────────────────────────────────────────────────────────
 
     def rerank(
         self,
@@ -243,44 +566,86 @@ class HybridReranker:
         top_k: int = None,
         use_ensemble: bool = True,
         intent: str = "general",
+        overlay: Optional[RequestOverlay] = None,
     ) -> List[Dict]:
-        """Perform hybrid reranking with intent-adaptive weights.
+        """Perform hybrid reranking with intent-adaptive weights (blocking).
+
+        Chunks are not modified: retrieval scores are read from, and rerank
+        scores/debug written to, the request overlay. Async callers should
+        use ``arerank`` to keep the cross-encoder off the event loop.
 
         Args:
             query: User query.
-            chunks: List of chunk dicts (must have 'content', 'metadata', 'score').
+            chunks: List of chunk dicts (must have 'content', 'metadata').
             top_k: Number of chunks to return.
             use_ensemble: Use ensemble scoring (CE + retrieval + metadata).
             intent: Detected query intent for adaptive weight selection.
+            overlay: Request overlay (a fresh one is created if omitted).
 
         Returns:
-            Reranked list of chunks with '_rerank_score' field.
+            Reranked list of chunks, best first.
         """
         if not chunks:
             return []
+        overlay = overlay or RequestOverlay.for_store()
+        chunks, skip_ce = self._cascade_prune(query, chunks, top_k, intent, overlay)
+        ce_scores = None if skip_ce else self._cross_encoder_scores(query, chunks)
+        return self._combine_scores(query, chunks, ce_scores, top_k, use_ensemble, intent, overlay)
 
+    async def arerank(
+        self,
+        query: str,
+        chunks: List[Dict],
+        top_k: int = None,
+        use_ensemble: bool = True,
+        intent: str = "general",
+        overlay: Optional[RequestOverlay] = None,
+    ) -> List[Dict]:
+        """Async hybrid reranking.
+
+        Cross-encoder pairs are micro-batched with concurrent requests and run
+        on a dedicated executor. On timeout, falls back to retrieval + metadata.
+
+        Args:
+            query: User query.
+            chunks: List of chunk dicts (must have 'content', 'metadata').
+            top_k: Number of chunks to return.
+            use_ensemble: Use ensemble scoring (CE + retrieval + metadata).
+            intent: Detected query intent for adaptive weight selection.
+            overlay: Request overlay (a fresh one is created if omitted).
+
+        Returns:
+            Reranked list of chunks, best first.
+        """
+        if not chunks:
+            return []
+        overlay = overlay or RequestOverlay.for_store()
+        chunks, skip_ce = self._cascade_prune(query, chunks, top_k, intent, overlay)
+        ce_scores = None if skip_ce else await self._across_encoder_scores(query, chunks)
+        return self._combine_scores(query, chunks, ce_scores, top_k, use_ensemble, intent, overlay)
+
+    def _combine_scores(
+        self,
+        query: str,
+        chunks: List[Dict],
+        ce_scores: Optional[List[float]],
+        top_k: Optional[int],
+        use_ensemble: bool,
+        intent: str,
+        overlay: Optional[RequestOverlay],
+    ) -> List[Dict]:
+        """Combine CE, retrieval and metadata scores and sort chunks."""
         top_k = top_k or settings.reranker_top_k
+        if overlay is None:
+            overlay = RequestOverlay.for_store()
 
         # Select intent-adaptive weights
         weights = settings.reranker_weights_by_intent.get(intent, settings.reranker_weights)
 
-        # Try cross-encoder scoring
-        ce_scores = None
-        if settings.use_cross_encoder and self.model is not None:
-            try:
-                pairs = [(query, self._build_rich_text(chunk)) for chunk in chunks]
-                raw_scores = self.model.predict(pairs)
-                # Normalize from [-10, 10] to [0, 1]
-                ce_scores = [(float(s) + 10.0) / 20.0 for s in raw_scores]
-                ce_scores = [max(0.0, min(1.0, s)) for s in ce_scores]
-            except Exception as e:
-                logger.warning(f"Cross-encoder scoring failed: {e}")
-                ce_scores = None
-
         # Score each chunk
         scored_chunks = []
         for i, chunk in enumerate(chunks):
-            retrieval_score = chunk.get("score", 0.0)
+            retrieval_score = overlay.retrieval_score(chunk)
             meta_score = self.calculate_metadata_score(chunk, query)
 
             if ce_scores is not None and use_ensemble and settings.reranker_ensemble:
@@ -294,23 +659,93 @@ class HybridReranker:
                 # Fallback: Retrieval 70% + Metadata 30%
                 final_score = 0.7 * retrieval_score + 0.3 * meta_score
 
-            chunk["_rerank_score"] = final_score
-            chunk["_rerank_debug"] = {
+            overlay.set_rerank(chunk, final_score, debug={
                 "ce": round(ce_scores[i], 3) if ce_scores else None,
                 "retrieval": round(retrieval_score, 3),
                 "meta": round(meta_score, 3),
                 "final": round(final_score, 3),
                 "intent": intent,
-            }
-            scored_chunks.append(chunk)
+            })
+            scored_chunks.append((final_score, chunk))
 
-        scored_chunks.sort(key=lambda x: x.get("_rerank_score", 0), reverse=True)
+        scored_chunks.sort(key=lambda x: x[0], reverse=True)
 
-        score_strs = [f"{c.get('_rerank_score', 0):.3f}" for c in scored_chunks[:top_k]]
+        score_strs = [f"{score:.3f}" for score, _ in scored_chunks[:top_k]]
         logger.info(
             f"Reranked {len(chunks)} chunks -> top {top_k}, "
             f"CE={'yes' if ce_scores else 'no'}, "
             f"scores=[{', '.join(score_strs)}]"
         )
 
-        return scored_chunks[:top_k]
+        return [chunk for _, chunk in scored_chunks[:top_k]]
+
+
+# Cross-encoder models — loaded once per process, shared by all HybridReranker instances
+_cross_encoders: Dict[str, Any] = {}
+_cross_encoder_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name: str) -> Optional[Any]:
+    """Lấy CrossEncoder (PyTorch hoặc ONNX int8) đã load; None nếu load lỗi.
+
+    Load là blocking (vài giây) — gọi từ reranker executor, hoặc preload lúc
+    startup bằng ``preload_cross_encoder`` để request đầu không bị timeout.
+    """
+    model = _cross_encoders.get(model_name)
+    if model is not None:
+        return model
+
+    with _cross_encoder_lock:
+        if model_name in _cross_encoders:
+            return _cross_encoders[model_name]
+        try:
+            if settings.reranker_backend == "onnx":
+                from src.core.onnx_backend import load_cross_encoder
+                logger.info(f"Loading Cross-Encoder (ONNX Runtime int8): {model_name}")
+                model = load_cross_encoder(model_name, max_length=512)
+            else:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Loading Cross-Encoder: {model_name}")
+                model = CrossEncoder(model_name, max_length=512, device=settings.reranker_device)
+        except Exception as e:
+            logger.warning(f"Failed to load CrossEncoder: {e}")
+            return None
+        _cross_encoders[model_name] = model
+        logger.info("Cross-Encoder loaded successfully")
+        return model
+
+
+async def preload_cross_encoder(model_name: Optional[str] = None) -> bool:
+    """Load cross-encoder trên reranker executor (gọi trong app lifespan)."""
+    loop = asyncio.get_running_loop()
+    model = await loop.run_in_executor(
+        get_reranker_executor(), get_cross_encoder, model_name or settings.cross_encoder_model
+    )
+    return model is not None
+
+
+# Dedicated thread pool for scoring models — keeps inference off the event loop
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_reranker_executor() -> ThreadPoolExecutor:
+    """Lấy thread pool dùng chung cho cross-encoder / late-interaction scoring."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.reranker_executor_workers,
+            thread_name_prefix="reranker",
+        )
+    return _executor
+
+
+# Global CE score cache — shared by all HybridReranker instances
+_score_cache: Optional[CrossEncoderScoreCache] = None
+
+
+def get_score_cache() -> CrossEncoderScoreCache:
+    """Lấy global cross-encoder score cache."""
+    global _score_cache
+    if _score_cache is None:
+        _score_cache = CrossEncoderScoreCache(max_size=settings.reranker_score_cache_size)
+    return _score_cache
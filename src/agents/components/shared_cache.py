@@ -0,0 +1,191 @@
+"""Cross-worker semantic cache backed by a dedicated Qdrant collection.
+
+Mỗi worker uvicorn có RAM cache riêng, nên câu hỏi tương tự đã trả lời ở
+worker A vẫn miss ở worker B. Backend này lưu entries (embedding + response +
+expires_at) vào collection ``qdrant_cache_collection`` để similarity hits được
+chia sẻ giữa mọi workers/replicas. RAM slots của SemanticCache được giữ làm L1
+với TTL ngắn (``cache_l1_ttl_seconds``) trước Qdrant.
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+
+from src.agents.components.cache import SemanticCache
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_PURGE_INTERVAL_SECONDS = 600
+
+
+class SharedSemanticCache(SemanticCache):
+    """SemanticCache với L2 dùng chung trên Qdrant.
+
+    Lookup: Redis exact → L1 RAM cosine → Qdrant similarity (lọc expires_at).
+    Add: L1 + Redis + upsert Qdrant (point id cố định theo query → ghi đè).
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes)
+        self._ram_ttl_seconds = settings.cache_l1_ttl_seconds
+        self._collection = settings.qdrant_cache_collection
+        self._collection_ready = False
+        self._last_purge = 0.0
+
+    async def _get_qdrant(self):
+        """Qdrant client; tạo collection + payload index expires_at lần đầu."""
+        from src.database.qdrant import get_qdrant_db
+
+        qdrant = get_qdrant_db()
+        if not self._collection_ready:
+            from qdrant_client.http import models as qmodels
+
+            created = await qdrant.create_collection(
+                collection_name=self._collection,
+                vector_size=settings.embedding_dimension,
+            )
+            if created:
+                await qdrant.async_client.create_payload_index(
+                    collection_name=self._collection,
+                    field_name="expires_at",
+                    field_schema=qmodels.PayloadSchemaType.FLOAT,
+                )
+                await qdrant.async_client.create_payload_index(
+                    collection_name=self._collection,
+                    field_name="corpus",
+                    field_schema=qmodels.PayloadSchemaType.KEYWORD,
+                )
+            self._collection_ready = True
+        return qdrant
+
+    def _point_id(self, query_text: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, self.get_cache_key(query_text)))
+
+    async def preload_from_redis(self, *args, **kwargs):
+        """Không cần warmup: L1 ngắn hạn, entries dùng chung nằm trên Qdrant."""
+        return
+
+    async def lookup_async(
+        self,
+        query_text: str,
+        query_embedding: np.ndarray,
+        threshold: Optional[float] = None,
+    ) -> Optional[Dict]:
+        """Async lookup: Redis exact → L1 RAM → Qdrant (shared)."""
+        hit = await super().lookup_async(query_text, query_embedding, threshold)
+        if hit:
+            return hit
+
+        try:
+            qdrant = await self._get_qdrant()
+            results = await qdrant.search_with_filter(
+                collection_name=self._collection,
+                query_vector=np.asarray(query_embedding, dtype=np.float32).tolist(),
+                must_conditions=[
+                    {"key": "expires_at", "range": {"gt": time.time()}},
+                    {"key": "corpus", "match": {"value": self.namespace()}},
+                ],
+                limit=1,
+                score_threshold=threshold or self._threshold,
+            )
+        except Exception as e:
+            logger.debug(f"Shared cache lookup error: {e}")
+            return None
+
+        if not results:
+            return None
+
+        payload = results[0]["payload"]
+        # Đưa vào L1 để các câu hỏi lặp lại trong worker này không phải gọi Qdrant
+        self._store_entry(
+            payload["query_text"], query_embedding, payload["response"], datetime.now(timezone.utc)
+        )
+        # Hit ở L2 được tính là hit (lookup RAM phía trên đã tính miss)
+        self._stats["misses"] -= 1
+        self._stats["hits"] += 1
+        logger.info(f"Cache Hit (Qdrant shared)! Similarity: {results[0]['score']:.4f}")
+        return {
+            "response": payload["response"],
+            "similarity": results[0]["score"],
+            "original_query": payload["query_text"],
+        }
+
+    async def add_async(
+        self,
+        query_text: str,
+        query_embedding: np.ndarray,
+        response: Dict,
+    ):
+        """Async add: L1 RAM + Redis + Qdrant (shared)."""
+        await super().add_async(query_text, query_embedding, response)
+
+        now = time.time()
+        try:
+            qdrant = await self._get_qdrant()
+            await qdrant.upsert_vectors(
+                collection_name=self._collection,
+                vectors=[np.asarray(query_embedding, dtype=np.float32).tolist()],
+                payloads=[{
+                    "query_text": query_text,
+                    "response": response,
+                    "corpus": self.namespace(),
+                    "created_at": now,
+                    "expires_at": now + self._ttl_hours * 3600,
+                }],
+                ids=[self._point_id(query_text)],
+            )
+            if now - self._last_purge > _PURGE_INTERVAL_SECONDS:
+                self._last_purge = now
+                await self.purge_expired()
+        except Exception as e:
+            logger.debug(f"Shared cache add error: {e}")
+
+    async def evict(self, query_text: str, query_embedding: Optional[np.ndarray] = None) -> int:
+        """Xóa entry ở L1 + Redis + các points đủ giống trên Qdrant."""
+        removed = await super().evict(query_text, query_embedding)
+        try:
+            qdrant = await self._get_qdrant()
+            point_ids = [self._point_id(query_text)]
+            results = []
+            if query_embedding is not None:
+                results = await qdrant.search_with_filter(
+                    collection_name=self._collection,
+                    query_vector=np.asarray(query_embedding, dtype=np.float32).tolist(),
+                    must_conditions=[{"key": "corpus", "match": {"value": self.namespace()}}],
+                    limit=10,
+                    score_threshold=self._threshold,
+                )
+                point_ids += [r["id"] for r in results]
+            await qdrant.delete_points(self._collection, point_ids=point_ids)
+            removed += len(results)
+        except Exception as e:
+            logger.debug(f"Shared cache evict error: {e}")
+        return removed
+
+    async def flush(self) -> Dict[str, int]:
+        """Xóa L1 + Redis + collection cache trên Qdrant."""
+        result = await super().flush()
+        try:
+            qdrant = await self._get_qdrant()
+            result["shared_entries"] = await qdrant.count_points(self._collection)
+            await qdrant.delete_collection(self._collection)
+            self._collection_ready = False
+        except Exception as e:
+            logger.warning(f"Shared cache flush failed: {e}")
+        return result
+
+    async def purge_expired(self) -> int:
+        """Xóa các points đã hết hạn khỏi collection cache."""
+        qdrant = await self._get_qdrant()
+        removed = await qdrant.delete_by_filter(
+            collection_name=self._collection,
+            filter_condition={"key": "expires_at", "range": {"lt": time.time()}},
+        )
+        if removed:
+            logger.info(f"Shared cache: purged {removed} expired entries")
+        return removed
@@ -4,10 +4,12 @@ Complements Qdrant (dense search) with in-memory chunk_map for
 parent/child/sibling navigation and BM25 sparse search.
 """
 
+import hashlib
 import json
 import logging
 import uuid
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Dict, List, Optional
 
 import numpy as np
@@ -32,12 +34,18 @@ def _to_qdrant_id(chunk_id: str) -> str:
 
 
 # Global vector store state
+# chunks / chunk_map are shared read-only by all requests after load;
+# per-request scores live in components.overlay.RequestOverlay.
 _store: Dict[str, Any] = {
     "chunks": [],
     "embeddings": None,
-    "chunk_map": {},
+    "chunk_map": MappingProxyType({}),
+    "chunk_index": MappingProxyType({}),
+    "chunk_features": MappingProxyType({}),
     "semantic_cache": [],
     "loaded": False,
+    "corpus_version": 0,  # tăng mỗi lần load/reindex → invalidate caches phụ thuộc corpus
+    "corpus_fingerprint": "",  # hash nội dung corpus → namespace cho caches dùng chung (Redis/Qdrant)
 }
 
 
@@ -46,13 +54,27 @@ def get_store() -> Dict[str, Any]:
     return _store
 
 
+def get_corpus_version() -> int:
+    """Current corpus version (incremented every time chunks are (re)loaded)."""
+    return _store["corpus_version"]
+
+
+def get_corpus_fingerprint() -> str:
+    """Content hash of the loaded corpus (giống nhau giữa các workers đã load cùng dữ liệu)."""
+    return _store["corpus_fingerprint"]
+
+
 def clear_store():
     """Clear all data from the store."""
     _store["chunks"] = []
     _store["embeddings"] = None
-    _store["chunk_map"] = {}
+    _store["chunk_map"] = MappingProxyType({})
+    _store["chunk_index"] = MappingProxyType({})
+    _store["chunk_features"] = MappingProxyType({})
     _store["semantic_cache"] = []
     _store["loaded"] = False
+    _store["corpus_version"] += 1
+    _store["corpus_fingerprint"] = ""
 
 
 def build_enriched_text_for_embedding(chunk: Dict) -> str:
@@ -94,14 +116,20 @@ def build_enriched_text_for_embedding(chunk: Dict) -> str:
 def _build_chunk_map(chunks: List[Dict]):
     """Build chunk_map for hierarchy navigation.
 
+    Also builds chunk_index (chunk_id → position in ``chunks``) used by
+    RequestOverlay and chunk_features (precomputed reranker inputs).
+    All mappings are exposed read-only.
+
     Args:
         chunks: List of chunk dictionaries.
     """
     chunk_map = {}
-    for chunk in chunks:
+    chunk_index = {}
+    for position, chunk in enumerate(chunks):
         chunk_id = chunk.get("id") or chunk.get("metadata", {}).get("chunk_id")
         if chunk_id:
             chunk_map[chunk_id] = chunk
+            chunk_index.setdefault(str(chunk_id), position)
 
     # Build parent-children relationships
     for chunk_id, chunk in chunk_map.items():
@@ -114,8 +142,34 @@ def _build_chunk_map(chunks: List[Dict]):
             if chunk_id not in parent["children_ids"]:
                 parent["children_ids"].append(chunk_id)
 
-    _store["chunk_map"] = chunk_map
-    logger.info(f"Built chunk_map with {len(chunk_map)} entries")
+    # Precompute reranker inputs (legal path, title, parent snippet, ...)
+    from src.agents.components.hierarchy import build_chunk_features
+    chunk_features = {
+        str(chunk_id): build_chunk_features(chunk, chunk_map)
+        for chunk_id, chunk in chunk_map.items()
+    }
+
+    _store["chunk_map"] = MappingProxyType(chunk_map)
+    _store["chunk_index"] = MappingProxyType(chunk_index)
+    _store["chunk_features"] = MappingProxyType(chunk_features)
+    _store["corpus_version"] += 1
+    _store["corpus_fingerprint"] = _corpus_fingerprint(chunks)
+    logger.info(
+        f"Built chunk_map with {len(chunk_map)} entries "
+        f"(corpus {_store['corpus_fingerprint']}, version {_store['corpus_version']})"
+    )
+
+
+def _corpus_fingerprint(chunks: List[Dict]) -> str:
+    """Short hash of chunk ids + content."""
+    digest = hashlib.md5()
+    for chunk in chunks:
+        chunk_id = chunk.get("id") or chunk.get("metadata", {}).get("chunk_id") or ""
+        digest.update(str(chunk_id).encode())
+        digest.update(b"\0")
+        digest.update(chunk.get("content", "").encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
 
 
 def load_from_json(json_path: Optional[str] = None) -> Dict[str, Any]:
@@ -167,6 +221,11 @@ def load_from_json(json_path: Optional[str] = None) -> Dict[str, Any]:
     _store["embeddings"] = embeddings
     logger.info(f"Generated embeddings shape: {embeddings.shape}")
 
+    # Late-interaction reranker: token vectors tính 1 lần lúc index
+    if settings.reranker_mode == "late_interaction":
+        from src.agents.components.late_interaction import build_token_index
+        build_token_index(chunks)
+
     # Upsert to Qdrant
     _upsert_to_qdrant(chunks, embeddings)
 
@@ -284,6 +343,11 @@ async def async_load_from_json(json_path: Optional[str] = None) -> Dict[str, Any
     _store["embeddings"] = embeddings
     logger.info(f"Generated embeddings shape: {embeddings.shape}")
 
+    # Late-interaction reranker: token vectors tính 1 lần lúc index
+    if settings.reranker_mode == "late_interaction":
+        from src.agents.components.late_interaction import build_token_index
+        build_token_index(chunks)
+
     # Upsert to Qdrant
     from src.database.qdrant import get_qdrant_db
     qdrant = get_qdrant_db()
@@ -1,10 +1,16 @@
 """Legal RAG Agent with Advanced 10-step pipeline (Hybrid Search + RRF + Hierarchy-aware)."""
 
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+import uuid
+from collections import OrderedDict
+from typing import Any, ClassVar, Dict, List, Optional
 
 import numpy as np
+from pydantic import BaseModel, Field
 
+from src.agents.components.overlay import RequestOverlay
+from src.core.admission import Priority
 from src.core.config import settings
 from src.core.embeddings import get_embedding_service
 from src.core.llm import get_llm_service
@@ -57,6 +63,13 @@ INTENT_INSTRUCTIONS = {
     "general": "Trả lời tổng quan các khía cạnh liên quan.",
 }
 
+_MAX_PENDING_VERIFICATIONS = 256  # faithfulness checks chờ caller lên lịch (process_query defer)
+
+FAITHFULNESS_DISCLAIMER = (
+    "\n\n> ⚠️ *Lưu ý: Câu trả lời này có thể chứa thông tin ngoài phạm vi tài liệu. "
+    "Vui lòng xác nhận với cơ quan tuyển sinh có thẩm quyền.*"
+)
+
 # Faithfulness verification prompt
 FAITHFULNESS_CHECK_PROMPT = """Kiểm tra xem câu trả lời có được hỗ trợ bởi ngữ cảnh cho sẵn hay không.
 
@@ -71,6 +84,16 @@ Câu trả lời cần kiểm tra:
 Trả về JSON: {{"faithful": true/false, "score": 0.0-1.0, "reason": "lý do ngắn"}}"""
 
 
+class FaithfulnessCheck(BaseModel):
+    """Structured output của FAITHFULNESS_CHECK_PROMPT."""
+
+    MAX_TOKENS: ClassVar[int] = 120
+
+    faithful: bool
+    score: float
+    reason: str = Field("", json_schema_extra={"maxLength": 200})
+
+
 # LLM Reranking prompt
 LLM_RERANK_PROMPT = """Đánh giá mức độ liên quan của đoạn văn bản sau với câu hỏi.
 
@@ -87,6 +110,15 @@ Cho điểm từ 0 đến 10, trong đó:
 Trả về JSON: {{"score": <số>, "reason": "<lý do ngắn>"}}"""
 
 
+class RelevanceScore(BaseModel):
+    """Structured output của LLM_RERANK_PROMPT (score 0-10)."""
+
+    MAX_TOKENS: ClassVar[int] = 100
+
+    score: float
+    reason: str = Field("", json_schema_extra={"maxLength": 150})
+
+
 class RAGAgent:
     """Legal RAG Agent implementing Advanced 10-step pipeline."""
 
@@ -99,8 +131,10 @@ class RAGAgent:
         self.analyzer = None
         self.expander = None
         self.cache = None
+        self.retrieval_cache = None
         self.reranker = None
         self.bm25 = None
+        self._pending_verifications: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
 
         self._init_components()
 
@@ -114,13 +148,22 @@ class RAGAgent:
 
         # Semantic cache
         if settings.use_semantic_cache:
-            from src.agents.components.cache import SemanticCache
-            self.cache = SemanticCache()
+            from src.agents.components.cache import get_semantic_cache
+            self.cache = get_semantic_cache()
+
+        # Retrieval-stage cache (context + sources)
+        if settings.use_retrieval_cache:
+            from src.agents.components.cache import get_retrieval_cache
+            self.retrieval_cache = get_retrieval_cache()
 
         # Reranker
         if settings.use_hybrid_search:
-            from src.agents.components.reranker import HybridReranker
-            self.reranker = HybridReranker()
+            if settings.reranker_mode == "late_interaction":
+                from src.agents.components.late_interaction import LateInteractionReranker
+                self.reranker = LateInteractionReranker()
+            else:
+                from src.agents.components.reranker import HybridReranker
+                self.reranker = HybridReranker()
 
         # BM25
         if settings.use_hybrid_search:
@@ -152,6 +195,7 @@ class RAGAgent:
         query: str,
         context: Optional[dict] = None,
         stream: bool = False,
+        defer_verification: bool = False,
     ) -> Dict[str, Any]:
         """Process a query using the 10-step Advanced RAG pipeline.
 
@@ -167,7 +211,12 @@ class RAGAgent:
         7. Multi-chunk Smart Merging
         8. Build Context with Adaptive Settings
         9. Generate Answer
+        9.5. Faithfulness verification
         10. Update Cache
+
+        Với ``defer_verification=True`` (API caller), Steps 9.5 và 10 không chạy
+        ở đây: result chứa ``verification_id`` để caller gọi verify_and_flag
+        sau khi đã trả lời; câu trả lời chỉ được cache nếu qua kiểm tra.
         """
         logger.info(f"[RAG] Processing query: {query}")
 
@@ -177,7 +226,7 @@ class RAGAgent:
 
         # Step 1: Semantic Cache check
         if self.cache:
-            cached_result = self.cache.lookup(query_embedding)
+            cached_result = await self.cache.lookup_async(query, query_embedding)
             if cached_result:
                 logger.info("[RAG] Step 1: CACHE HIT")
                 return cached_result["response"]
@@ -193,6 +242,73 @@ class RAGAgent:
         # Get adaptive context settings
         ctx_settings = settings.context_settings.get(intent, settings.context_settings["general"])
 
+        # Steps 3-8: Retrieval (cached per query/intent/corpus version)
+        retrieval = self.retrieval_cache.get(query, intent) if self.retrieval_cache else None
+        if retrieval is not None:
+            logger.info(f"[RAG] Steps 3-8: RETRIEVAL CACHE HIT ({len(retrieval['context'])} chars)")
+        else:
+            retrieval = await self._retrieve(query, query_embedding, intent, ctx_settings)
+            if retrieval is None:
+                return self._empty_result(query, intent)
+            if self.retrieval_cache:
+                self.retrieval_cache.put(query, intent, retrieval)
+
+        context_text = retrieval["context"]
+        sources = retrieval["sources"]
+
+        # Stream mode: skip LLM answer generation, return context for supervisor streaming
+        if stream:
+            logger.info(f"[RAG] Stream mode: returning context ({len(context_text)} chars) for supervisor")
+            return {
+                "query": query,
+                **retrieval,
+                "intent": intent,
+                # Để supervisor đưa câu trả lời đã stream qua verify_and_flag rồi mới cache
+                "query_embedding": query_embedding,
+            }
+
+        # Step 9: Generate Answer
+        answer = await self._generate_answer(query, context_text, intent)
+        logger.info(f"[RAG] Step 9: Answer generated ({len(answer)} chars)")
+
+        result = {
+            "query": query,
+            "answer": answer,
+            "sources": sources,
+            "intent": intent,
+            "documents_retrieved": retrieval["documents_retrieved"],
+            "documents_relevant": retrieval["documents_relevant"],
+        }
+
+        # Steps 9.5 + 10 chạy sau khi trả lời (verify_and_flag)
+        if defer_verification:
+            verification_id = self._defer_verification(query, query_embedding, context_text, result)
+            return {**result, "verification_id": verification_id}
+
+        # Step 9.5: Faithfulness verification
+        faith_score = await self._verify_faithfulness(answer, context_text)
+        if faith_score < settings.faithfulness_threshold:
+            logger.warning(f"[RAG] Low faithfulness score ({faith_score:.2f}) — appending disclaimer")
+            result["answer"] = answer + FAITHFULNESS_DISCLAIMER
+
+        # Step 10: Update Cache
+        await self.cache_answer(query, query_embedding, result)
+
+        return result
+
+    async def _retrieve(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        intent: str,
+        ctx_settings: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """Steps 3-8: expansion → hybrid search → ... → context building.
+
+        Returns:
+            Dict with context, sources, documents_retrieved, documents_relevant
+            (None if nothing relevant was found).
+        """
         # Step 3: Query Expansion
         search_queries = [query]
         if self.expander:
@@ -200,12 +316,16 @@ class RAGAgent:
             logger.info(f"[RAG] Step 3: Expanded to {len(search_queries)} variations")
 
         # Step 4: Hybrid Search (Qdrant + BM25 + RRF)
+        # Corpus chunks are shared; all per-request scores go to the overlay
         self._ensure_bm25()
-        candidates = await self._hybrid_search(search_queries, query_embedding, intent=intent)
+        overlay = RequestOverlay.for_store()
+        candidates = await self._hybrid_search(
+            search_queries, query_embedding, intent=intent, overlay=overlay,
+        )
         logger.info(f"[RAG] Step 4: Hybrid search returned {len(candidates)} candidates")
 
         if not candidates:
-            return self._empty_result(query, intent)
+            return None
 
         # Step 5: Deduplication
         from src.agents.components.bm25 import deduplicate_chunks
@@ -215,7 +335,9 @@ class RAGAgent:
         # Step 5.5: Sibling Enrichment (intent-aware)
         if settings.use_smart_retrieval:
             from src.agents.components.hierarchy import enrich_with_all_siblings
-            candidates = enrich_with_all_siblings(candidates, query, query_embedding, intent=intent)
+            candidates = enrich_with_all_siblings(
+                candidates, query, query_embedding, intent=intent, overlay=overlay,
+            )
             logger.info(f"[RAG] Step 5.5: After sibling enrichment: {len(candidates)} chunks")
 
         # Step 5.6: Parent Promotion (chỉ cho "list" intent)
@@ -228,16 +350,17 @@ class RAGAgent:
 
         # Step 6: Reranking
         if self.reranker and len(candidates) > 1:
-            reranked = self.reranker.rerank(
+            reranked = await self.reranker.arerank(
                 query=query,
                 chunks=candidates,
                 top_k=settings.reranker_top_k * 2,
                 use_ensemble=settings.reranker_ensemble,
                 intent=intent,
+                overlay=overlay,
             )
         else:
             # Fallback: LLM reranking or simple score sort
-            reranked = await self._llm_rerank_fallback(query, candidates)
+            reranked = await self._llm_rerank_fallback(query, candidates, overlay)
         logger.info(f"[RAG] Step 6: After reranking: {len(reranked)} chunks")
 
         # Step 7: Smart Merging
@@ -246,62 +369,53 @@ class RAGAgent:
         logger.info(f"[RAG] Step 7: After merging: {len(merged)} chunks")
 
         if not merged:
-            return self._empty_result(query, intent)
+            return None
 
         # Step 8: Build Context
         from src.agents.components.hierarchy import build_multi_chunk_context
-        context_text = build_multi_chunk_context(merged, query, query_embedding, ctx_settings)
+        context_text = build_multi_chunk_context(
+            merged, query, query_embedding, ctx_settings, overlay=overlay,
+        )
         logger.info(f"[RAG] Step 8: Context built ({len(context_text)} chars)")
 
-        sources = self._format_sources(merged)
-
-        # Stream mode: skip LLM answer generation, return context for supervisor streaming
-        if stream:
-            logger.info(f"[RAG] Stream mode: returning context ({len(context_text)} chars) for supervisor")
-            return {
-                "query": query,
-                "context": context_text,
-                "sources": sources,
-                "intent": intent,
-                "documents_retrieved": len(candidates),
-                "documents_relevant": len(merged),
-            }
-
-        # Step 9: Generate Answer
-        answer = await self._generate_answer(query, context_text, intent)
-        logger.info(f"[RAG] Step 9: Answer generated ({len(answer)} chars)")
-
-        # Step 9.5: Faithfulness verification
-        faith_score = await self._verify_faithfulness(answer, context_text)
-        if faith_score < 0.5:
-            logger.warning(f"[RAG] Low faithfulness score ({faith_score:.2f}) — appending disclaimer")
-            answer = (
-                answer
-                + "\n\n> ⚠️ *Lưu ý: Câu trả lời này có thể chứa thông tin ngoài phạm vi tài liệu. "
-                "Vui lòng xác nhận với cơ quan tuyển sinh có thẩm quyền.*"
-            )
+        sources = self._format_sources(merged, overlay)
 
-        result = {
-            "query": query,
-            "answer": answer,
+        return {
+            "context": context_text,
             "sources": sources,
-            "intent": intent,
             "documents_retrieved": len(candidates),
             "documents_relevant": len(merged),
         }
 
-        # Step 10: Update Cache
-        if self.cache and merged and len(answer) > 50:
-            self.cache.add(query, query_embedding, result)
-            logger.info("[RAG] Step 10: Cache updated")
+    async def cache_answer(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        result: Dict[str, Any],
+    ) -> bool:
+        """Step 10: ghi câu trả lời vào semantic cache.
 
-        return result
+        Dùng cho non-stream inline (cuối process_query) và cho câu trả lời đã
+        qua faithfulness check ở ``verify_and_flag`` (deferred + stream).
+
+        Returns:
+            True nếu đã ghi vào cache.
+        """
+        answer = result.get("answer", "")
+        if not self.cache or not result.get("documents_relevant") or len(answer) <= 50:
+            return False
+
+        entry = {k: v for k, v in result.items() if k not in ("context", "query_embedding")}
+        await self.cache.add_async(query, query_embedding, entry)
+        logger.info("[RAG] Step 10: Cache updated")
+        return True
 
     async def _hybrid_search(
         self,
         queries: List[str],
         query_embedding: np.ndarray,
         intent: str = "general",
+        overlay: Optional[RequestOverlay] = None,
     ) -> List[Dict]:
         """Execute hybrid search: Qdrant dense + BM25 sparse + RRF fusion.
 
@@ -309,9 +423,10 @@ class RAGAgent:
             queries: List of query variations.
             query_embedding: Embedding of the original query.
             intent: Detected query intent for adaptive RRF weights.
+            overlay: Request overlay receiving fused retrieval scores.
 
         Returns:
-            Fused list of candidate chunks.
+            Fused list of candidate chunks (shared corpus chunks, unmodified).
         """
         from src.agents.components.bm25 import reciprocal_rank_fusion
         from src.agents.components.vector_store import get_store
@@ -319,6 +434,8 @@ class RAGAgent:
         store = get_store()
         all_chunks = store.get("chunks", [])
         top_k = settings.rag_top_k
+        if overlay is None:
+            overlay = RequestOverlay.for_store()
 
         all_dense_results = []
         all_bm25_results = []
@@ -351,11 +468,7 @@ class RAGAgent:
         if all_dense_results and all_bm25_results:
             # Convert to indexed format for RRF
             # Map Qdrant results to indices in all_chunks by matching chunk_id
-            chunk_id_to_idx = {}
-            for idx, chunk in enumerate(all_chunks):
-                cid = chunk.get("id") or chunk.get("metadata", {}).get("chunk_id")
-                if cid:
-                    chunk_id_to_idx[str(cid)] = idx
+            chunk_id_to_idx = store.get("chunk_index", {})
 
             dense_for_rrf = []
             dense_score_map = {}
@@ -381,9 +494,8 @@ class RAGAgent:
                 if doc_idx in seen or doc_idx >= len(all_chunks):
                     continue
                 seen.add(doc_idx)
-                chunk = dict(all_chunks[doc_idx])
-                chunk["score"] = dense_score_map.get(doc_idx, rrf_score)
-                chunk["_rrf_score"] = rrf_score
+                chunk = all_chunks[doc_idx]
+                overlay.set_retrieval(chunk, dense_score_map.get(doc_idx, rrf_score))
                 candidates.append(chunk)
 
             return candidates
@@ -415,36 +527,62 @@ class RAGAgent:
         self,
         query: str,
         chunks: List[Dict],
+        overlay: Optional[RequestOverlay] = None,
     ) -> List[Dict]:
         """LLM-based reranking fallback when Cross-Encoder is unavailable.
 
         Args:
             query: User query.
             chunks: Candidate chunks.
+            overlay: Request overlay holding retrieval/rerank scores.
 
         Returns:
             Reranked chunks.
         """
         top_k = settings.reranker_top_k
-
-        # Simple: try LLM scoring for top candidates
-        scored = []
-        for chunk in chunks[:top_k * 2]:
-            content = chunk.get("content", "")
-            try:
-                prompt = LLM_RERANK_PROMPT.format(query=query, content=content[:500])
-                response = await self.llm_service.generate_with_json(
+        if overlay is None:
+            overlay = RequestOverlay.for_store()
+
+        # Chấm điểm song song (giới hạn concurrency) trong một timeout chung:
+        # degraded mode chỉ tốn xấp xỉ latency của một LLM call
+        candidates = chunks[:top_k * 2]
+        semaphore = asyncio.Semaphore(settings.llm_rerank_concurrency)
+
+        async def llm_score(chunk: Dict) -> float:
+            prompt = LLM_RERANK_PROMPT.format(query=query, content=chunk.get("content", "")[:500])
+            async with semaphore:
+                result = await self.llm_service.generate_structured(
                     prompt=prompt,
+                    schema=RelevanceScore,
                     use_grader=True,
+                    priority=Priority.PLANNING,
+                )
+            return max(0.0, min(1.0, result.score / 10.0))
+
+        tasks = [asyncio.create_task(llm_score(chunk)) for chunk in candidates]
+        done: set = set()
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=settings.llm_rerank_timeout_seconds)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(
+                    f"[RAG] LLM rerank fallback: {len(pending)}/{len(tasks)} chunks not scored "
+                    f"within {settings.llm_rerank_timeout_seconds}s, using retrieval score"
                 )
-                llm_score = float(response.get("score", 5)) / 10.0
-                chunk["_rerank_score"] = llm_score * 0.6 + chunk.get("score", 0) * 0.4
-            except Exception:
-                chunk["_rerank_score"] = chunk.get("score", 0)
-            scored.append(chunk)
 
-        scored.sort(key=lambda x: x.get("_rerank_score", 0), reverse=True)
-        return scored[:top_k]
+        scored = []
+        for chunk, task in zip(candidates, tasks):
+            retrieval_score = overlay.retrieval_score(chunk)
+            if task in done and task.exception() is None:
+                rerank_score = task.result() * 0.6 + retrieval_score * 0.4
+            else:
+                rerank_score = retrieval_score
+            overlay.set_rerank(chunk, rerank_score)
+            scored.append((rerank_score, chunk))
+
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [chunk for _, chunk in scored[:top_k]]
 
     async def _verify_faithfulness(self, answer: str, context: str) -> float:
         """Verify that answer is grounded in the retrieved context.
@@ -464,14 +602,89 @@ class RAGAgent:
                 context=context[:1500],
                 answer=answer[:800],
             )
-            result = await self.llm_service.generate_with_json(prompt=prompt, use_grader=True)
-            score = float(result.get("score", 0.8))
-            logger.debug(f"[RAG] Faithfulness score={score:.2f}, reason={result.get('reason', '')}")
+            result = await self.llm_service.generate_structured(
+                prompt=prompt, schema=FaithfulnessCheck, use_grader=True
+            )
+            score = result.score
+            logger.debug(f"[RAG] Faithfulness score={score:.2f}, reason={result.reason}")
             return max(0.0, min(1.0, score))
         except Exception as e:
             logger.warning(f"[RAG] Faithfulness check failed: {e}")
             return 0.8  # Default: assume faithful on error
 
+    def _defer_verification(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        context: str,
+        result: Dict[str, Any],
+    ) -> str:
+        """Giữ dữ liệu cho faithfulness check chạy sau; trả về verification_id."""
+        verification_id = uuid.uuid4().hex
+        self._pending_verifications[verification_id] = {
+            "query": query,
+            "query_embedding": query_embedding,
+            "context": context,
+            "result": dict(result),
+        }
+        while len(self._pending_verifications) > _MAX_PENDING_VERIFICATIONS:
+            dropped, _ = self._pending_verifications.popitem(last=False)
+            logger.warning(f"[RAG] Dropped unscheduled faithfulness check {dropped}")
+        return verification_id
+
+    async def verify_and_flag(
+        self,
+        verification_id: str,
+        session_id: str,
+        message_id: Optional[int] = None,
+    ) -> Optional[float]:
+        """Steps 9.5 + 10 cho câu trả lời đã gửi cho user (chạy nền).
+
+        Score đạt ngưỡng → ghi câu trả lời vào semantic cache. Score thấp →
+        không cache, tạo FlaggedConversation (``faithfulness_fail``) để admin
+        review; disclaimer được thêm vào message khi lấy lại history.
+
+        Args:
+            verification_id: ``result["verification_id"]`` từ process_query.
+            session_id: Chat session của câu trả lời.
+            message_id: ChatHistory id của assistant message (nếu đã lưu).
+
+        Returns:
+            Faithfulness score (None nếu verification_id không còn).
+        """
+        pending = self._pending_verifications.pop(verification_id, None)
+        if pending is None:
+            logger.warning(f"[RAG] Unknown or expired verification_id {verification_id}")
+            return None
+
+        query = pending["query"]
+        result = pending["result"]
+        score = await self._verify_faithfulness(result["answer"], pending["context"])
+        if score >= settings.faithfulness_threshold:
+            await self.cache_answer(query, pending["query_embedding"], result)
+            return score
+
+        logger.warning(
+            f"[RAG] Low faithfulness score ({score:.2f}) — flagging session={session_id}, message_id={message_id}"
+        )
+        try:
+            from src.database.models import FlaggedConversation
+            from src.database.postgres import get_postgres_db
+
+            async with get_postgres_db().get_session() as session:
+                session.add(FlaggedConversation(
+                    session_id=session_id,
+                    message_id=message_id,
+                    question=query,
+                    answer=result["answer"][:2000],
+                    flag_reason="faithfulness_fail",
+                    status="pending",
+                    admin_note=f"faithfulness score={score:.2f}",
+                ))
+        except Exception as e:
+            logger.error(f"[RAG] Failed to flag unfaithful answer: {e}")
+        return score
+
     async def _generate_answer(
         self,
         query: str,
@@ -500,15 +713,22 @@ class RAGAgent:
         answer = await self.llm_service.generate(prompt=prompt)
         return answer
 
-    def _format_sources(self, chunks: List[Dict]) -> List[Dict]:
+    def _format_sources(
+        self,
+        chunks: List[Dict],
+        overlay: Optional[RequestOverlay] = None,
+    ) -> List[Dict]:
         """Format source citations from chunks.
 
         Args:
             chunks: List of chunk dictionaries.
+            overlay: Request overlay holding retrieval scores.
 
         Returns:
             List of source citation dictionaries.
         """
+        if overlay is None:
+            overlay = RequestOverlay.for_store()
         sources = []
         for chunk in chunks:
             metadata = chunk.get("metadata", {})
@@ -517,7 +737,7 @@ class RAGAgent:
             source = {
                 "content_preview": content[:200] + "..." if len(content) > 200 else content,
                 "content": content,
-                "score": round(chunk.get("score", 0), 3),
+                "score": round(overlay.retrieval_score(chunk), 3),
             }
 
             from src.agents.components.hierarchy import build_legal_hierarchy_path
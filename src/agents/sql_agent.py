@@ -3,11 +3,13 @@
 import json
 import logging
 import re
-from typing import Any, Optional
+from typing import Any, ClassVar, Optional
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
 
+from src.core.admission import Priority
 from src.core.config import settings
 from src.core.embeddings import get_embedding_service
 from src.core.llm import get_llm_service
@@ -101,6 +103,16 @@ Kiểm tra:
 4. Có LIMIT để tránh quá nhiều kết quả"""
 
 
+class SQLValidation(BaseModel):
+    """Structured output của SQL_VALIDATION_PROMPT."""
+
+    MAX_TOKENS: ClassVar[int] = 200
+
+    valid: bool
+    error: str = Field("", json_schema_extra={"maxLength": 200})
+    suggestion: str = Field("", json_schema_extra={"maxLength": 200})
+
+
 class SQLAgent:
     """SQL Agent with dynamic few-shot example selection."""
 
@@ -398,6 +410,8 @@ LIMIT 50;""",
         response = await self.llm_service.generate(
             prompt=prompt,
             system_prompt=SQL_SYSTEM_PROMPT,
+            priority=Priority.PLANNING,
+            hedge_class="sql",
         )
 
         # Extract SQL from response
@@ -495,13 +509,14 @@ LIMIT 50;""",
         # Use LLM for deeper validation
         try:
             prompt = SQL_VALIDATION_PROMPT.format(sql=sql)
-            response = await self.llm_service.generate_with_json(
+            check = await self.llm_service.generate_structured(
                 prompt=prompt,
+                schema=SQLValidation,
                 use_grader=True,
             )
 
-            if not response.get("valid", False):
-                return False, response.get("error", "Validation failed")
+            if not check.valid:
+                return False, check.error or "Validation failed"
 
             return True, None
 
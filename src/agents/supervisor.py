@@ -1,17 +1,21 @@
 """Supervisor Agent using LangGraph for orchestrating multi-agent system."""
 
+import asyncio
 import json
 import logging
 import operator
+import re
 import time
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Annotated, Any, AsyncGenerator, Optional, TypedDict
+from typing import Annotated, Any, AsyncGenerator, ClassVar, Literal, Optional, TypedDict
 
 from langgraph.graph import END, StateGraph
+from pydantic import BaseModel, Field
 
 from src.agents.rag_agent import RAGAgent, get_rag_agent
 from src.agents.sql_agent import SQLAgent, get_sql_agent
+from src.core.admission import Priority
 from src.core.llm import get_llm_service
 from src.database.postgres import get_postgres_db
 from src.routers.semantic_router import SemanticRouter, get_semantic_router
@@ -53,6 +57,7 @@ class ConversationState(TypedDict):
     needs_clarification: bool
     error: Optional[str]
     iteration: int
+    defer_verification: bool  # RAG faithfulness check chạy sau khi trả lời (API callers)
 
 
 # Prompts
@@ -101,6 +106,17 @@ Trả về JSON:
 }}"""
 
 
+class RoutingPlan(BaseModel):
+    """Structured output của PLANNING_PROMPT."""
+
+    MAX_TOKENS: ClassVar[int] = 200
+
+    agent: Literal["sql", "rag", "school_info", "general", "clarification"]
+    confidence: float = 0.5
+    reason: str = Field("", json_schema_extra={"maxLength": 200})
+    clarification_question: str = Field("", json_schema_extra={"maxLength": 200})
+
+
 COMBINE_PROMPT = """Tổng hợp kết quả từ các nguồn sau để trả lời câu hỏi người dùng.
 
 Câu hỏi: {query}
@@ -388,20 +404,16 @@ class SupervisorAgent:
         prompt = PLANNING_PROMPT.format(query=query, history=history_text)
 
         try:
-            response = await self.llm_service.generate_with_json(
+            plan = await self.llm_service.generate_structured(
                 prompt=prompt,
+                schema=RoutingPlan,
                 use_grader=False,
+                priority=Priority.PLANNING,
+                hedge_class="routing",
             )
-            logger.debug(f"LLM planning response: {response}")
+            logger.debug(f"LLM planning response: {plan}")
 
-            if response is None:
-                logger.warning("LLM returned None response, defaulting to GENERAL")
-                return {
-                    "intent": "general",
-                    "agent_type": AgentType.GENERAL,
-                }
-
-            agent_str = response.get("agent", "general") if isinstance(response, dict) else "general"
+            agent_str = plan.agent
             agent_type = {
                 "sql": AgentType.SQL,
                 "rag": AgentType.RAG,
@@ -500,7 +512,9 @@ class SupervisorAgent:
         logger.info(f"Hybrid node: running SQL + RAG in parallel for '{query[:50]}'")
 
         sql_task = _asyncio.create_task(self.sql_agent.process_query(query))
-        rag_task = _asyncio.create_task(self.rag_agent.process_query(query))
+        rag_task = _asyncio.create_task(self.rag_agent.process_query(
+            query, defer_verification=state.get("defer_verification", False)
+        ))
         results = await _asyncio.gather(sql_task, rag_task, return_exceptions=True)
 
         sql_result = results[0] if not isinstance(results[0], Exception) else {"error": str(results[0])}
@@ -565,7 +579,9 @@ class SupervisorAgent:
         query = state["current_query"]
 
         try:
-            result = await self.rag_agent.process_query(query)
+            result = await self.rag_agent.process_query(
+                query, defer_verification=state.get("defer_verification", False)
+            )
             answer = result.get("answer", "")
             sources = result.get("sources", [])
 
@@ -821,7 +837,9 @@ class SupervisorAgent:
         )
 
         try:
-            resolved = await self.llm_service.generate(prompt=prompt, use_grader=False)
+            resolved = await self.llm_service.generate(
+                prompt=prompt, use_grader=False, priority=Priority.PLANNING, hedge_class="followup",
+            )
             if resolved and len(resolved.strip()) > 5:
                 resolved = resolved.strip().strip('"').strip("'")
                 logger.info(f"Follow-up rewrite: '{query}' → '{resolved[:80]}'")
@@ -837,6 +855,7 @@ class SupervisorAgent:
         session_id: str = "default",
         context: Optional[dict] = None,
         conversation_history: Optional[list[dict]] = None,
+        defer_verification: bool = False,
     ) -> dict[str, Any]:
         """Process a user query through the supervisor.
 
@@ -845,6 +864,8 @@ class SupervisorAgent:
             session_id: Session ID for memory.
             context: Optional additional context.
             conversation_history: Recent messages from DB (list of {role, content}).
+            defer_verification: RAG faithfulness check + cache write chạy sau;
+                caller phải gọi ``schedule_verification`` khi đã lưu message.
 
         Returns:
             Response dictionary.
@@ -875,10 +896,12 @@ class SupervisorAgent:
             "needs_clarification": False,
             "error": None,
             "iteration": 0,
+            "defer_verification": defer_verification,
         }
 
         try:
             final_state = await self.graph.ainvoke(initial_state)
+            rag_result = final_state.get("rag_result") or {}
 
             return {
                 "query": query,
@@ -887,6 +910,8 @@ class SupervisorAgent:
                 "sources": final_state.get("sources", []),
                 "chart_data": final_state.get("chart_data"),
                 "error": final_state.get("error"),
+                # Faithfulness check chưa chạy → caller gọi schedule_verification sau khi lưu message
+                "verification_id": rag_result.get("verification_id"),
             }
 
         except Exception as e:
@@ -897,6 +922,30 @@ class SupervisorAgent:
                 "error": str(e),
             }
 
+    def schedule_verification(self, result: dict, session_id: str, message_id: Optional[int] = None) -> None:
+        """Chạy faithfulness check của câu trả lời RAG ở background (sau khi đã trả lời)."""
+        verification_id = result.get("verification_id")
+        if not verification_id:
+            return
+
+        task = asyncio.create_task(self.rag_agent.verify_and_flag(verification_id, session_id, message_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    def _defer_stream_verification(self, query: str, rag_raw: dict, answer: str) -> Optional[str]:
+        """Giữ câu trả lời đã stream cho faithfulness check; trả về verification_id.
+
+        Caller (chat stream endpoint) gọi ``schedule_verification`` sau khi lưu
+        message: đạt ngưỡng mới ghi vào semantic cache, không đạt thì flag.
+        """
+        query_embedding = rag_raw.get("query_embedding")
+        if query_embedding is None:
+            return None
+
+        result = {k: v for k, v in rag_raw.items() if k not in ("context", "query_embedding")}
+        result["answer"] = answer
+        return self.rag_agent._defer_verification(query, query_embedding, rag_raw.get("context", ""), result)
+
     async def process_stream(
         self,
         query: str,
@@ -908,7 +957,7 @@ class SupervisorAgent:
         Yields SSE events:
           {"type": "meta",  "intent": str, "sources": list}
           {"type": "token", "content": str}
-          {"type": "done",  "chart_data": dict|None}
+          {"type": "done",  "chart_data": dict|None, "verification_id": str (RAG stream)}
           {"type": "error", "message": str}
         """
         from src.core.llm import ServiceUnavailableError
@@ -936,6 +985,7 @@ class SupervisorAgent:
             "needs_clarification": False,
             "error": None,
             "iteration": 0,
+            "defer_verification": False,
         }
 
         try:
@@ -1059,7 +1109,8 @@ class SupervisorAgent:
             # Cache hit: rag_agent trả về 'answer' thay vì 'context'
             cached_answer = rag_raw.get("answer")
             if cached_answer:
-                yield {"type": "token", "content": cached_answer}
+                async for token in _replay_tokens(cached_answer):
+                    yield {"type": "token", "content": token}
                 yield {"type": "done", "chart_data": None}
                 return
 
@@ -1075,9 +1126,14 @@ class SupervisorAgent:
                 question=query,
                 intent_instruction=intent_instruction,
             )
+            answer_tokens = []
             async for token in self.llm_service.generate_stream(prompt=answer_prompt):
+                answer_tokens.append(token)
                 yield {"type": "token", "content": token}
-            yield {"type": "done", "chart_data": None}
+
+            # Stream hoàn tất (client không ngắt giữa chừng) → faithfulness check trước khi cache
+            verification_id = self._defer_stream_verification(query, rag_raw, "".join(answer_tokens))
+            yield {"type": "done", "chart_data": None, "verification_id": verification_id}
 
         except ServiceUnavailableError as e:
             yield {"type": "error", "message": "Hệ thống AI đang tạm thời bận. Vui lòng thử lại sau ít phút."}
@@ -1086,6 +1142,19 @@ class SupervisorAgent:
             yield {"type": "error", "message": "Đã xảy ra lỗi khi xử lý yêu cầu. Vui lòng thử lại."}
 
 
+# ── Streaming helpers ───────────────────────────────────────────────────────
+_background_tasks: set = set()  # giữ reference tới các task nền (ghi cache, faithfulness check)
+_REPLAY_WORDS_PER_TOKEN = 4
+
+
+async def _replay_tokens(text: str) -> AsyncGenerator[str, None]:
+    """Phát lại câu trả lời đã cache thành các token nhỏ (giữ nguyên whitespace)."""
+    words = re.findall(r"\s*\S+\s*", text) or [text]
+    for i in range(0, len(words), _REPLAY_WORDS_PER_TOKEN):
+        yield "".join(words[i:i + _REPLAY_WORDS_PER_TOKEN])
+        await asyncio.sleep(0)
+
+
 # ── Schools cache (tránh fetch toàn bộ trường mỗi request) ──────────────────
 _schools_cache: Optional[list] = None
 _schools_cache_ts: float = 0.0
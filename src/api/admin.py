@@ -1112,6 +1112,9 @@ async def get_stats(
     except:
         doc_count = 0
 
+    from src.agents.components.reranker import get_score_cache
+    from src.core.llm import get_llm_service
+
     return {
         "total_schools": truong_count or 0,
         "total_majors": nganh_count or 0,
@@ -1120,9 +1123,71 @@ async def get_stats(
         "total_chats": 0,
         "recent_chats": 0,
         "latest_year": latest_year,
+        "reranker_score_cache": get_score_cache().stats(),
+        "grader_cache": get_llm_service().grader_cache.stats(),
+    }
+
+
+# ── Semantic cache ──────────────────────────────────────────────────────────
+
+
+@router.get("/cache")
+async def get_cache_stats(
+    current_user: User = Depends(get_current_user),
+) -> dict:
+    """Kích thước, hit rate, memory của semantic cache dùng chung."""
+    if not settings.use_semantic_cache:
+        return {"enabled": False}
+
+    from src.agents.components.cache import get_retrieval_cache, get_semantic_cache
+
+    return {
+        "enabled": True,
+        **get_semantic_cache().stats(),
+        "retrieval_cache": get_retrieval_cache().stats(),
     }
 
 
+@router.post("/cache/warmup")
+async def warmup_cache(
+    max_entries: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+) -> dict:
+    """Preload semantic cache từ Redis (SCAN + pipeline, có ngân sách thời gian)."""
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Chỉ admin mới có thể warmup cache",
+        )
+
+    from src.agents.components.cache import get_semantic_cache
+
+    cache = get_semantic_cache()
+    before = len(cache)
+    await cache.preload_from_redis(max_entries=max_entries)
+    logger.info(f"Cache warmup triggered by {current_user.username}")
+    return {"success": True, "loaded": len(cache) - before, **cache.stats()}
+
+
+@router.delete("/cache")
+async def flush_cache(
+    current_user: User = Depends(get_current_user),
+) -> dict:
+    """Xóa toàn bộ semantic cache (RAM + Redis + shared backend) và retrieval cache."""
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Chỉ admin mới có thể xóa cache",
+        )
+
+    from src.agents.components.cache import get_retrieval_cache, get_semantic_cache
+
+    removed = await get_semantic_cache().flush()
+    get_retrieval_cache().clear()
+    logger.info(f"Cache flushed by {current_user.username}: {removed}")
+    return {"success": True, **removed}
+
+
 # ── Human-in-the-Loop: Flagged Conversations ────────────────────────────────
 
 
@@ -14,8 +14,10 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.agents.rag_agent import FAITHFULNESS_DISCLAIMER
 from src.agents.supervisor import get_supervisor_agent
 from src.api._limiter import limiter
+from src.core.config import settings
 from src.core.llm import ServiceUnavailableError
 from src.database.models import ChatHistory, Feedback, FlaggedConversation
 from src.database.postgres import get_db_session
@@ -140,6 +142,7 @@ async def chat(
                     query=body.message,
                     session_id=session_id,
                     conversation_history=conversation_history,
+                    defer_verification=settings.faithfulness_check_background,
                 ),
                 timeout=60.0,
             )
@@ -161,6 +164,8 @@ async def chat(
         session.add(assistant_history)
         await session.commit()
 
+        supervisor.schedule_verification(result, session_id, assistant_history.id)
+
         return ChatResponse(
             response=result.get("response", "Xin lỗi, đã xảy ra lỗi."),
             session_id=session_id,
@@ -237,6 +242,7 @@ async def chat_stream(
         final_chart_data = None
         final_intent = None
         final_sources: list = []
+        verification_id = None
 
         try:
             async for event in supervisor.process_stream(
@@ -259,6 +265,7 @@ async def chat_stream(
 
                 elif event_type == "done":
                     final_chart_data = event.get("chart_data")
+                    verification_id = event.pop("verification_id", None)
                     yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
 
                 elif event_type == "error":
@@ -272,9 +279,10 @@ async def chat_stream(
 
         # Phase 3: Save assistant response — mở connection mới, đóng ngay sau khi xong
         if accumulated_content:
+            message_id = None
             try:
                 async with db.get_session() as session:
-                    session.add(ChatHistory(
+                    assistant_history = ChatHistory(
                         session_id=session_id,
                         role="assistant",
                         content=accumulated_content,
@@ -282,10 +290,17 @@ async def chat_stream(
                             "intent": final_intent,
                             "sources": final_sources,
                         }, ensure_ascii=False),
-                    ))
+                    )
+                    session.add(assistant_history)
+                    await session.flush()
+                    message_id = assistant_history.id
             except Exception as e:
+                message_id = None
                 logger.error(f"Stream DB save error: {e}", exc_info=True)
 
+            # Faithfulness check nền: đạt → ghi semantic cache, không đạt → flag message
+            supervisor.schedule_verification({"verification_id": verification_id}, session_id, message_id)
+
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
@@ -364,6 +379,17 @@ async def submit_feedback(
 
         await session.commit()
 
+        # Câu trả lời bị báo sai → không tiếp tục phục vụ từ semantic cache
+        if body.feedback_type == "incorrect" and question_text and settings.use_semantic_cache:
+            try:
+                from src.agents.components.cache import get_semantic_cache
+                from src.core.embeddings import get_embedding_service
+
+                query_embedding = get_embedding_service().encode_query(question_text)
+                await get_semantic_cache().evict(question_text, query_embedding)
+            except Exception as e:
+                logger.warning(f"Cache eviction after feedback failed: {e}")
+
         logger.info(f"Feedback received: session={body.session_id}, type={body.feedback_type}")
 
         return FeedbackResponse(
@@ -500,12 +526,29 @@ async def get_chat_history(
     )
     messages = result.scalars().all()
 
+    # Câu trả lời bị faithfulness check (chạy nền) đánh dấu → thêm disclaimer
+    # (trừ khi admin đã dismiss flag)
+    flagged_ids: set[int] = set()
+    assistant_ids = [msg.id for msg in messages if msg.role == "assistant"]
+    if assistant_ids:
+        flag_result = await session.execute(
+            select(FlaggedConversation.message_id).where(
+                FlaggedConversation.message_id.in_(assistant_ids),
+                FlaggedConversation.flag_reason == "faithfulness_fail",
+                FlaggedConversation.status != "dismissed",
+            )
+        )
+        flagged_ids = set(flag_result.scalars().all())
+
     history = []
     for msg in messages:
+        content = msg.content
+        if msg.id in flagged_ids and FAITHFULNESS_DISCLAIMER not in content:
+            content += FAITHFULNESS_DISCLAIMER
         entry: dict[str, Any] = {
             "id": msg.id,
             "role": msg.role,
-            "content": msg.content,
+            "content": content,
             "timestamp": msg.created_at.isoformat(),
         }
 
@@ -617,6 +660,7 @@ async def websocket_chat(
                         query=message,
                         session_id=session_id,
                         conversation_history=conversation_history,
+                        defer_verification=settings.faithfulness_check_background,
                     )
 
                     # Save assistant response
@@ -636,6 +680,8 @@ async def websocket_chat(
                     await db_session.rollback()
                     raise
 
+            supervisor.schedule_verification(result, session_id, assistant_history.id)
+
             # Send response
             await manager.send_message(session_id, {
                 "type": "response",
@@ -1,5 +1,6 @@
 """FastAPI application entry point."""
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -92,20 +93,37 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning("Auto-load chunks failed", error=str(e))
 
-    # Preload Redis cache → warm up RAM cosine-similarity cache
+    # Preload cross-encoder trên reranker executor: request đầu tiên của worker
+    # không phải chờ load model trong reranker_timeout_seconds
+    if (
+        settings.use_hybrid_search
+        and settings.use_cross_encoder
+        and settings.reranker_mode != "late_interaction"
+    ):
+        from src.agents.components.reranker import preload_cross_encoder
+        if not await preload_cross_encoder():
+            logger.warning("Cross-encoder preload failed - reranking falls back to retrieval scores")
+
+    # Preload Redis cache → warm up RAM cosine-similarity cache (background,
+    # không chặn readiness)
+    warmup_task = None
     if settings.use_semantic_cache and getattr(settings, "use_redis_cache", False):
-        from src.agents.components.cache import SemanticCache
-        try:
-            cache = SemanticCache()
-            await cache.preload_from_redis()
-        except Exception as e:
-            logger.warning("Redis cache preload failed", error=str(e))
+        from src.agents.components.cache import get_semantic_cache
+        cache = get_semantic_cache()
+        warmup_task = asyncio.create_task(cache.preload_from_redis())
+
+    # Background health probes cho các vLLM endpoints
+    from src.core.llm import get_llm_service
+    get_llm_service().start_health_probes()
 
     yield
 
     logger.info("Shutting down TSBot application")
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
     await db.close()
     await qdrant.close()
+    await get_llm_service().aclose()
 
 
 # Tạo FastAPI app
@@ -172,8 +190,12 @@ async def health_check():
             "main_model": "ready" if llm_status.get("main_model") else "not_loaded",
             "grader_model": "ready" if llm_status.get("grader_model") else "not_loaded",
             "embeddings": "up" if embed_ok else "down",
-            "vllm_circuit_breaker": llm._circuit_breaker.state,
+            "vllm_circuit_breaker": {role: pool.state() for role, pool in llm.pools.items()},
         },
+        "vllm_endpoints": {role: pool.stats() for role, pool in llm.pools.items()},
+        "vllm_pool": llm.pool_stats(),
+        "vllm_admission": llm.limiter.stats(),
+        "vllm_hedging": llm.hedges.stats(),
     }
 
 
@@ -0,0 +1,177 @@
+"""Adaptive admission control cho các requests tới vLLM.
+
+Giới hạn số requests đang chạy (in-flight) tới vLLM bằng AIMD theo TTFT quan
+sát được: TTFT ≤ target (hoặc call không stream thành công) → tăng limit dần
+(+1 mỗi "vòng" limit requests), TTFT > target hoặc lỗi → giảm nhân
+(× ``llm_limit_backoff``). Requests vượt
+limit xếp hàng theo priority class, có deadline; hàng đợi đầy hoặc hết
+deadline → shed sớm với OverloadedError thay vì dồn lên vLLM.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailableError(Exception):
+    """vLLM server không khả dụng (circuit breaker open)."""
+
+
+class OverloadedError(ServiceUnavailableError):
+    """Request bị shed bởi admission controller (quá tải)."""
+
+
+class Priority(IntEnum):
+    """Priority classes (nhỏ hơn = ưu tiên hơn)."""
+
+    INTERACTIVE = 0  # câu trả lời cho user (stream / chat)
+    PLANNING = 1  # routing, follow-up rewrite, sinh SQL
+    BACKGROUND = 2  # grading, validation, evaluation
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit + priority queue có deadline."""
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 2,
+        max_limit: int = 64,
+        ttft_target: float = 1.5,
+        backoff: float = 0.8,
+        max_queue: int = 100,
+    ):
+        self.limit = float(initial_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._ttft_target = ttft_target
+        self._backoff = backoff
+        self._max_queue = max_queue
+
+        self.inflight = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self.stats_counters = {"admitted": 0, "queued": 0, "shed": 0, "timeouts": 0}
+
+    # ── Limit adjustment (AIMD) ────────────────────────────────────────────
+
+    def record_ttft(self, ttft: float):
+        """Cập nhật limit theo time-to-first-token vừa đo."""
+        if ttft <= self._ttft_target:
+            self.record_success()
+        else:
+            self._decrease(f"TTFT {ttft:.2f}s > {self._ttft_target:.2f}s")
+
+    def record_success(self):
+        """Request thành công → tăng limit (+1 mỗi "vòng" limit requests).
+
+        Dùng trực tiếp cho calls không stream (grading, routing, ...): latency
+        toàn phần của chúng không so được với TTFT target.
+        """
+        self.limit = min(self._max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def record_failure(self):
+        self._decrease("request failed")
+
+    def _decrease(self, reason: str):
+        # Tối đa 1 lần giảm mỗi giây: một đợt chậm không kéo limit về min ngay
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        new_limit = max(self._min_limit, self.limit * self._backoff)
+        if int(new_limit) < int(self.limit):
+            logger.info(f"LLM concurrency limit {self.limit:.1f} → {new_limit:.1f} ({reason})")
+        self.limit = new_limit
+
+    # ── Admission ──────────────────────────────────────────────────────────
+
+    def _has_capacity(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    def saturated(self) -> bool:
+        """Đã hết capacity hoặc có requests đang chờ (không nên gửi thêm hedge)."""
+        return not self._has_capacity() or bool(self._queue)
+
+    def _discard(self, future: asyncio.Future):
+        """Bỏ entry của waiter đã timeout/cancel khỏi hàng đợi."""
+        self._queue = [entry for entry in self._queue if entry[2] is not future]
+        heapq.heapify(self._queue)
+
+    def _wake(self):
+        """Admit requests đang chờ (theo priority) khi còn capacity."""
+        while self._queue and self._has_capacity():
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self.inflight += 1
+            future.set_result(True)
+
+    async def acquire(self, priority: Priority, timeout: float):
+        """Chờ tới lượt; raise OverloadedError nếu bị shed / quá deadline."""
+        if self._has_capacity() and not self._queue:
+            self.inflight += 1
+            self.stats_counters["admitted"] += 1
+            return
+
+        if len(self._queue) >= self._max_queue:
+            self.stats_counters["shed"] += 1
+            raise OverloadedError("Hàng đợi LLM đã đầy")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (int(priority), next(self._seq), future))
+        self.stats_counters["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                self.release()  # admitted đúng lúc timeout → trả slot
+            future.cancel()
+            self._discard(future)
+            self.stats_counters["timeouts"] += 1
+            raise OverloadedError(f"Chờ LLM quá {timeout:.0f}s")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            future.cancel()
+            self._discard(future)
+            raise
+        self.stats_counters["admitted"] += 1
+
+    def release(self):
+        self.inflight = max(0, self.inflight - 1)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """``async with limiter.slot(priority):`` — giữ 1 slot trong suốt request."""
+        if timeout is None:
+            timeout = settings.llm_queue_timeout_seconds.get(priority.name.lower(), 5.0)
+        await self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waiting: Dict[str, int] = {p.name.lower(): 0 for p in Priority}
+        for priority, _, future in self._queue:
+            if not future.done():
+                waiting[Priority(priority).name.lower()] += 1
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "waiting": waiting,
+            **self.stats_counters,
+        }
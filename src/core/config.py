@@ -74,6 +74,7 @@ class Settings(BaseSettings):
     qdrant_legal_collection: str = "legal_documents"
     qdrant_sql_examples_collection: str = "sql_examples"
     qdrant_intents_collection: str = "intents"
+    qdrant_cache_collection: str = "semantic_cache"
 
     # vLLM (OpenAI-compatible inference server trên máy A100)
     vllm_base_url: str = "http://localhost:8001/v1"
@@ -83,12 +84,61 @@ class Settings(BaseSettings):
     vllm_grader_model: str = "Qwen/Qwen2.5-1.5B-Instruct"
     vllm_grader_temperature: float = 0.0
     vllm_api_key: str = "EMPTY"  # vLLM không cần real API key
+    # HTTP client dùng chung tới vLLM (connection pool + keep-alive)
+    vllm_http2: bool = False  # cần package h2 (pip install "httpx[http2]")
+    vllm_max_connections: int = 64
+    vllm_max_keepalive_connections: int = 32
+    vllm_keepalive_expiry: float = 60.0  # giây giữ connection idle
+    vllm_connect_timeout: float = 5.0
+    vllm_read_timeout: float = 120.0  # giữa 2 chunks (stream) / toàn bộ response
+    # Nhiều vLLM servers (load balancing + failover); rỗng → chỉ dùng vllm_base_url
+    vllm_main_endpoints: List[str] = Field(default=[])
+    vllm_grader_endpoints: List[str] = Field(default=[])  # rỗng → dùng chung endpoints của main
+    vllm_lb_strategy: str = "least_outstanding"  # "least_outstanding" | "latency" (EWMA)
+    vllm_lb_ewma_alpha: float = 0.3
+    vllm_health_probe_interval: float = 15.0  # giây giữa 2 lần GET /health mỗi endpoint (0 = tắt)
+    # Hedging cho calls ngắn không stream (follow-up, routing, SQL): quá p95 của
+    # prompt class mà chưa xong → gửi bản sao tới endpoint khác, lấy kết quả về trước
+    llm_hedging: bool = True  # chỉ có tác dụng khi role có ≥ 2 endpoints
+    llm_hedge_quantile: float = 0.95
+    llm_hedge_window: int = 200  # số latencies gần nhất giữ cho mỗi prompt class
+    llm_hedge_min_samples: int = 20  # chưa đủ samples → dùng llm_hedge_default_delay_seconds
+    llm_hedge_default_delay_seconds: float = 2.0
+    llm_single_flight: bool = True  # gộp các stream giống hệt nhau đang chạy thành 1 request vLLM
+
+    # Admission control tới vLLM (AIMD concurrency limit theo TTFT + priority queue)
+    llm_admission_control: bool = True
+    llm_initial_concurrency: int = 16
+    llm_min_concurrency: int = 2
+    llm_max_concurrency: int = 64
+    llm_ttft_target_seconds: float = 1.5  # TTFT vượt mức này → giảm limit
+    llm_max_queue: int = 100  # quá số requests chờ → shed ngay
+    llm_queue_timeout_seconds: dict = {  # deadline chờ trong hàng đợi theo priority class
+        "interactive": 10.0,
+        "planning": 5.0,
+        "background": 3.0,
+    }
+    # Structured output (generate_structured): vLLM guided decoding theo JSON schema
+    llm_guided_decoding: bool = True  # tắt nếu vLLM server không hỗ trợ response_format json_schema
+    llm_structured_max_tokens: int = 256  # mặc định khi schema không khai báo MAX_TOKENS
+    grader_cache_enabled: bool = True  # cache JSON của grader (temperature 0 → deterministic)
+    grader_cache_size: int = 5000  # số responses giữ trong LRU (in-process)
+    grader_cache_ttl_hours: int = 24  # TTL trên Redis (khi use_redis_cache)
 
     # Embeddings (sentence-transformers chạy local trên máy application)
     embedding_model: str = "BAAI/bge-m3"
     embedding_dimension: int = 1024
     embedding_device: str = "auto"  # "cuda", "cpu", hoặc "auto" (tự detect GPU)
 
+    # Inference backend cho embedding + cross-encoder
+    # "torch" (mặc định) hoặc "onnx" (ONNX Runtime int8, cho replica chỉ có CPU)
+    embedding_backend: str = "torch"
+    reranker_backend: str = "torch"
+    onnx_model_dir: str = "data/onnx_models"
+    onnx_quantization_config: str = "avx512_vnni"  # avx2 | avx512 | avx512_vnni | arm64
+    onnx_intra_op_threads: int = 0  # 0 = để ONNX Runtime tự chọn
+    onnx_inter_op_threads: int = 0
+
     # Redis (optional - dùng cho persistent semantic cache)
     redis_url: str = "redis://localhost:6379"
     use_redis_cache: bool = False  # bật khi có Redis
@@ -105,15 +155,46 @@ class Settings(BaseSettings):
     use_query_analysis: bool = True
     use_query_expansion: bool = True
     use_smart_retrieval: bool = True
+    faithfulness_threshold: float = 0.5  # score thấp hơn → disclaimer + flag cho admin review
+    faithfulness_check_background: bool = True  # kiểm tra sau khi trả lời (không chặn response)
 
     # Cache
     cache_similarity_threshold: float = 0.92
     cache_ttl_hours: int = 24
+    cache_max_entries: int = 200  # số entries tối đa trong RAM (matrix preallocate)
+    cache_ann_threshold: int = 5000  # > N entries → HNSW index (cần hnswlib); 0 = tắt
+    cache_max_memory_mb: int = 64  # giới hạn RAM (embeddings + responses)
+    cache_eviction_policy: str = "tinylfu"  # lru | lfu | tinylfu (W-TinyLFU: LRU window + main)
+    cache_warmup_max_entries: int = 0  # số entries preload từ Redis lúc startup (0 = cache_max_entries)
+    cache_warmup_timeout_seconds: float = 10.0  # ngân sách thời gian warmup (chạy background)
+    cache_warmup_batch_size: int = 200  # số keys mỗi lần SCAN/MGET
+    cache_backend: str = "local"  # local (RAM mỗi worker + Redis exact) | qdrant (dùng chung giữa workers)
+    cache_l1_ttl_seconds: float = 60.0  # TTL của RAM L1 khi cache_backend = "qdrant"
+    use_retrieval_cache: bool = True  # cache context + sources (Steps 3-8) theo query/intent/corpus
+    retrieval_cache_size: int = 1000
+    retrieval_cache_ttl_seconds: float = 3600.0
 
     # Reranker
     reranker_model: str = "namdp-ptit/ViRanker"
     reranker_device: str = "cpu"  # cpu để tránh tranh VRAM với embedding model
     reranker_top_k: int = 3
+    reranker_batch_max_pairs: int = 64  # max (query, passage) pairs per micro-batch
+    reranker_batch_wait_ms: int = 5  # cửa sổ gom requests đồng thời
+    reranker_executor_workers: int = 1
+    reranker_timeout_seconds: float = 3.0  # quá hạn → fallback retrieval score
+    llm_rerank_concurrency: int = 8  # LLM rerank fallback (không có cross-encoder): số grader calls song song
+    llm_rerank_timeout_seconds: float = 5.0  # hết hạn → chunks chưa chấm xong dùng retrieval score
+    reranker_score_cache_size: int = 50000  # số (query, chunk) CE scores giữ trong LRU
+    # "cross_encoder" (mặc định) hoặc "late_interaction" (MaxSim trên bge-m3 token vectors)
+    reranker_mode: str = "cross_encoder"
+    colbert_index_dir: str = "data/colbert_index"
+    # Cascade: stage-1 (retrieval + metadata) lọc bớt candidates trước cross-encoder
+    reranker_cascade: bool = True
+    reranker_cascade_budget: dict = {
+        "specific": 8, "comparison": 12, "list": 16, "explanation": 10, "general": 10,
+    }
+    reranker_cascade_gap: float = 0.15  # gap stage-1 đủ lớn → cắt tại đó
+    reranker_cascade_skip_margin: float = 0.35  # top-1 dẫn cách biệt → bỏ qua cross-encoder
     reranker_weights: dict = {"cross_encoder": 0.55, "retrieval": 0.35, "metadata": 0.10}
     reranker_weights_by_intent: dict = {
         "specific":    {"cross_encoder": 0.65, "retrieval": 0.25, "metadata": 0.10},
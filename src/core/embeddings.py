@@ -40,8 +40,17 @@ class EmbeddingService:
 
         self.device = resolved_device
 
-        logger.info(f"Loading embedding model '{self.model_name}' on device '{self.device}'")
-        self._model = SentenceTransformer(self.model_name, device=self.device)
+        self.backend = settings.embedding_backend
+        self._colbert_linear: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+        if self.backend == "onnx":
+            from src.core.onnx_backend import load_sentence_transformer
+            self.device = "cpu"
+            logger.info(f"Loading embedding model '{self.model_name}' (ONNX Runtime int8)")
+            self._model = load_sentence_transformer(self.model_name)
+        else:
+            logger.info(f"Loading embedding model '{self.model_name}' on device '{self.device}'")
+            self._model = SentenceTransformer(self.model_name, device=self.device)
         logger.info(f"Embedding model loaded. Dimension: {self._model.get_sentence_embedding_dimension()}")
 
     @property
@@ -118,6 +127,58 @@ class EmbeddingService:
         """Encode nhiều documents. Trả về 2D array (N, dimension)."""
         return self.encode(documents, batch_size=batch_size, show_progress=show_progress)
 
+    def _colbert_projection(self) -> tuple[np.ndarray, np.ndarray]:
+        """Load colbert_linear (bge-m3 multi-vector head) → (weight^T, bias)."""
+        if self._colbert_linear is None:
+            from pathlib import Path
+
+            import torch
+
+            local_path = Path(self.model_name) / "colbert_linear.pt"
+            if local_path.exists():
+                path = str(local_path)
+            else:
+                from huggingface_hub import hf_hub_download
+                path = hf_hub_download(self.model_name, "colbert_linear.pt")
+
+            state = torch.load(path, map_location="cpu")
+            self._colbert_linear = (
+                state["weight"].float().numpy().T.copy(),
+                state["bias"].float().numpy(),
+            )
+            logger.info(f"Loaded colbert_linear head from {path}")
+        return self._colbert_linear
+
+    def encode_token_vectors(
+        self,
+        texts: list[str],
+        batch_size: int = 16,
+    ) -> list[np.ndarray]:
+        """Multi-vector (ColBERT-style) embeddings của bge-m3.
+
+        Token embeddings (bỏ [CLS]) → colbert_linear → L2 normalize,
+        giống BGEM3FlagModel(return_colbert_vecs=True).
+
+        Returns:
+            List các array shape (n_tokens, dimension), float32.
+        """
+        weight, bias = self._colbert_projection()
+        token_embeddings = self._model.encode(
+            texts,
+            output_value="token_embeddings",
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=False,
+        )
+
+        results = []
+        for emb in token_embeddings:
+            hidden = emb.detach().float().cpu().numpy()[1:]
+            vecs = hidden @ weight + bias
+            vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+            results.append(vecs.astype(np.float32))
+        return results
+
     def similarity(
         self,
         query_embedding: np.ndarray,
@@ -144,6 +205,7 @@ class EmbeddingService:
         return {
             "model_name": self.model_name,
             "device": self.device,
+            "backend": self.backend,
             "dimension": self.dimension,
         }
 
@@ -0,0 +1,122 @@
+"""Load balancing giữa nhiều vLLM endpoints cho cùng một model role.
+
+Mỗi endpoint có circuit breaker riêng, số requests đang chạy (outstanding),
+EWMA latency và cờ ``healthy`` từ background health probes. ``EndpointPool``
+chọn endpoint theo ``vllm_lb_strategy``:
+
+- ``least_outstanding``: ít requests đang chạy nhất (hòa → EWMA thấp hơn)
+- ``latency``:           EWMA latency × (outstanding + 1) nhỏ nhất
+
+Endpoint chưa có số đo latency được ưu tiên để nhanh chóng có dữ liệu.
+"""
+
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """Một vLLM server (base_url dạng ``http://host:port/v1``)."""
+
+    def __init__(self, base_url: str, breaker: Any):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def server_url(self) -> str:
+        """``http://host:8001/v1`` → ``http://host:8001`` (cho GET /health)."""
+        return self.base_url.removesuffix("/v1")
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.can_attempt()
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Đếm request đang chạy trên endpoint này."""
+        self.outstanding += 1
+        self.requests += 1
+        try:
+            yield
+        finally:
+            self.outstanding -= 1
+
+    def record_success(self, latency: float):
+        self.breaker.record_success()
+        alpha = settings.vllm_lb_ewma_alpha
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+
+    def record_failure(self):
+        self.breaker.record_failure()
+        self.failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "circuit_breaker": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EndpointPool:
+    """Các endpoints phục vụ một model role ("main" / "grader")."""
+
+    def __init__(self, role: str, endpoints: List[Endpoint], strategy: Optional[str] = None):
+        self.role = role
+        self.endpoints = endpoints
+        self.strategy = strategy or settings.vllm_lb_strategy
+        if self.strategy not in ("least_outstanding", "latency"):
+            logger.warning(f"Unknown vLLM LB strategy '{self.strategy}', using least_outstanding")
+            self.strategy = "least_outstanding"
+
+    def _score(self, endpoint: Endpoint) -> tuple:
+        latency = endpoint.latency_ewma or 0.0
+        if self.strategy == "latency":
+            return (latency * (endpoint.outstanding + 1), endpoint.outstanding)
+        return (endpoint.outstanding, latency)
+
+    def pick(self, exclude: Optional[Set[Endpoint]] = None) -> Optional[Endpoint]:
+        """Endpoint tốt nhất chưa thử; None nếu không còn endpoint khả dụng.
+
+        Endpoints bị health probe đánh dấu down chỉ được dùng khi mọi endpoint
+        khác đều không dùng được (probe có thể trễ hơn thực tế).
+        """
+        exclude = exclude or set()
+        remaining = [e for e in self.endpoints if e not in exclude]
+        candidates = [e for e in remaining if e.available()]
+        if not candidates:
+            candidates = [e for e in remaining if e.breaker.can_attempt()]
+        if not candidates:
+            return None
+        return min(candidates, key=self._score)
+
+    def has_available(self) -> bool:
+        return any(e.breaker.can_attempt() for e in self.endpoints)
+
+    def state(self) -> str:
+        """Trạng thái tổng hợp: closed nếu còn ít nhất 1 endpoint breaker closed."""
+        states = {e.breaker.state for e in self.endpoints}
+        for state in ("closed", "half_open"):
+            if state in states:
+                return state
+        return "open"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "endpoints": {e.base_url: e.stats() for e in self.endpoints},
+        }
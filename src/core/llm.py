@@ -4,30 +4,71 @@ vLLM chạy trên máy A100, expose OpenAI-compatible API.
 Dùng ChatOpenAI từ langchain-openai để giao tiếp.
 """
 
+import asyncio
+import contextlib
+import hashlib
+import json
 import logging
 import time
-from typing import Any, AsyncGenerator, Literal, Optional
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Literal, Optional, Type, TypeVar
 
 import httpx
 from langchain_openai import ChatOpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
-
+from openai import APITimeoutError
+from pydantic import BaseModel, ValidationError
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+from src.core.admission import (  # noqa: F401 — re-export exceptions
+    AdaptiveConcurrencyLimiter,
+    OverloadedError,
+    Priority,
+    ServiceUnavailableError,
+)
 from src.core.config import settings
+from src.core.endpoints import Endpoint, EndpointPool
 
 logger = logging.getLogger(__name__)
 
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+JSON_ONLY_SUFFIX = "\n\nRespond with valid JSON only. Do not include thinking tags."
+
+
+def parse_json_response(response: str) -> Any:
+    """Parse JSON từ output tự do của LLM (bỏ thinking tags, code fences)."""
+    import re
+
+    response = response.strip()
+
+    # Loại bỏ thinking tags
+    response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL)
+    response = response.strip()
+
+    # Xử lý markdown code blocks
+    if response.startswith("```json"):
+        response = response[7:]
+    if response.startswith("```"):
+        response = response[3:]
+    if response.endswith("```"):
+        response = response[:-3]
 
-class ServiceUnavailableError(Exception):
-    """vLLM server không khả dụng (circuit breaker open)."""
+    response = response.strip()
+    json_match = re.search(r"\{.*\}", response, re.DOTALL)
+    if json_match:
+        response = json_match.group()
+
+    return json.loads(response.strip())
 
 
 class CircuitBreaker:
-    """Circuit breaker cho vLLM requests."""
+    """Circuit breaker cho vLLM requests (một instance cho mỗi endpoint)."""
 
     FAILURE_THRESHOLD = 5
     RECOVERY_TIMEOUT = 60  # seconds
 
-    def __init__(self):
+    def __init__(self, name: str = "vLLM"):
+        self.name = name
         self.state: Literal["closed", "open", "half_open"] = "closed"
         self.failure_count: int = 0
         self.last_failure_time: float = 0.0
@@ -38,14 +79,14 @@ class CircuitBreaker:
         if self.state == "open":
             if time.time() - self.last_failure_time > self.RECOVERY_TIMEOUT:
                 self.state = "half_open"
-                logger.info("Circuit breaker → half_open (trying recovery)")
+                logger.info(f"Circuit breaker [{self.name}] → half_open (trying recovery)")
                 return True
             return False
         return True  # half_open: cho phép 1 thử
 
     def record_success(self):
         if self.state != "closed":
-            logger.info(f"Circuit breaker → closed (recovered from {self.state})")
+            logger.info(f"Circuit breaker [{self.name}] → closed (recovered from {self.state})")
         self.state = "closed"
         self.failure_count = 0
 
@@ -54,62 +95,406 @@ class CircuitBreaker:
         self.last_failure_time = time.time()
         if self.failure_count >= self.FAILURE_THRESHOLD:
             if self.state != "open":
-                logger.error(f"Circuit breaker → open ({self.failure_count} failures)")
+                logger.error(f"Circuit breaker [{self.name}] → open ({self.failure_count} failures)")
             self.state = "open"
         elif self.state == "half_open":
             self.state = "open"
-            logger.warning("Circuit breaker → open (half_open attempt failed)")
+            logger.warning(f"Circuit breaker [{self.name}] → open (half_open attempt failed)")
+
+
+class GraderResponseCache:
+    """Cache JSON responses của grader model (in-process LRU + Redis).
+
+    Grader chạy với temperature 0 nên output là hàm xác định của (model,
+    prompt). Keyed by model + SHA-256 of the full prompt; values are the
+    parsed JSON, stored serialized so callers never share mutable objects.
+    """
+
+    KEY_PREFIX = "tsbot:grader"
+
+    def __init__(self, max_size: int = 5000, ttl_hours: int = 24):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_hours * 3600
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._redis: Optional[Any] = None
+        self._redis_initialized = False
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def key(self, model: str, system_prompt: Optional[str], prompt: str) -> str:
+        digest = hashlib.sha256(f"{system_prompt or ''}\0{prompt}".encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{model}:{digest}"
+
+    async def _get_redis(self) -> Optional[Any]:
+        """Lazy init Redis connection (chỉ khi use_redis_cache)."""
+        if self._redis_initialized:
+            return self._redis
+        self._redis_initialized = True
+        if not settings.use_redis_cache:
+            return None
+        try:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(
+                settings.redis_url,
+                decode_responses=True,
+                socket_connect_timeout=2,
+                socket_timeout=2,
+            )
+            await self._redis.ping()
+        except Exception as e:
+            logger.warning(f"Grader cache: Redis unavailable: {e}")
+            self._redis = None
+        return self._redis
+
+    def _remember(self, key: str, raw: str):
+        self._entries[key] = raw
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = self._entries.get(key)
+        if raw is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(raw)
+
+        r = await self._get_redis()
+        if r:
+            try:
+                raw = await r.get(key)
+            except Exception as e:
+                logger.debug(f"Grader cache Redis get error: {e}")
+            if raw is not None:
+                self._remember(key, raw)
+                self.redis_hits += 1
+                return json.loads(raw)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: dict):
+        raw = json.dumps(value, ensure_ascii=False)
+        self._remember(key, raw)
+        r = await self._get_redis()
+        if r:
+            try:
+                await r.setex(key, self._ttl_seconds, raw)
+            except Exception as e:
+                logger.debug(f"Grader cache Redis set error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+class HedgeTracker:
+    """Latency theo prompt class → ngưỡng hedge (quantile) + thống kê hedge.
+
+    Mỗi class giữ ``window`` latencies gần nhất; ngưỡng là quantile
+    ``llm_hedge_quantile`` của cửa sổ, hoặc ``default_delay`` khi chưa đủ
+    ``min_samples``. Samples là latency của lần gọi chính (không phải bản
+    hedge), chặn trên ở ``max_latency``; timeout được ghi bằng đúng giá trị chặn.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+        default_delay: float = 2.0,
+        max_latency: float = 60.0,
+    ):
+        self._quantile = quantile
+        self._window = window
+        self._min_samples = min_samples
+        self._default_delay = default_delay
+        self._max_latency = max_latency
+        self._latencies: Dict[str, deque] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def delay(self, prompt_class: str) -> float:
+        samples = self._latencies.get(prompt_class)
+        if not samples or len(samples) < self._min_samples:
+            return self._default_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self._quantile * len(ordered)))]
+
+    def _counters_for(self, prompt_class: str) -> Dict[str, int]:
+        return self._counters.setdefault(prompt_class, {"calls": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0})
+
+    def add_sample(self, prompt_class: str, latency: float):
+        samples = self._latencies.setdefault(prompt_class, deque(maxlen=self._window))
+        samples.append(min(latency, self._max_latency))
+
+    def record(self, prompt_class: str, latency: Optional[float], hedged: bool, hedge_won: bool):
+        """Ghi một call thành công; ``latency`` là của lần gọi chính (None = không đo được)."""
+        if latency is not None:
+            self.add_sample(prompt_class, latency)
+        counters = self._counters_for(prompt_class)
+        counters["calls"] += 1
+        counters["hedged"] += int(hedged)
+        counters["hedge_wins"] += int(hedge_won)
+
+    def record_timeout(self, prompt_class: str):
+        """Lần gọi chính bị timeout → ghi sample bằng giá trị chặn trên."""
+        self.add_sample(prompt_class, self._max_latency)
+        self._counters_for(prompt_class)["timeouts"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for prompt_class, counters in self._counters.items():
+            calls = counters["calls"]
+            result[prompt_class] = {
+                **counters,
+                "hedge_rate": round(counters["hedged"] / calls, 4) if calls else 0.0,
+                "hedge_win_rate": (
+                    round(counters["hedge_wins"] / counters["hedged"], 4) if counters["hedged"] else 0.0
+                ),
+                "threshold_seconds": round(self.delay(prompt_class), 3),
+            }
+        return result
+
+
+class StreamFlight:
+    """Một stream LLM đang chạy, chia sẻ cho nhiều subscribers (single-flight).
+
+    Producer task đọc source và lưu tokens; mỗi subscriber nhận lại các tokens
+    đã phát rồi theo tiếp phần còn lại. Lỗi của source được raise cho mọi
+    subscriber. Khi subscriber cuối cùng rời đi trước khi xong, source bị hủy.
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_done: Optional[Callable[["StreamFlight"], None]] = None):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._pump(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for token in source:
+                self.tokens.append(token)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = ServiceUnavailableError("Stream bị hủy")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            if self._on_done:
+                self._on_done(self)
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Replay tokens đã phát, rồi theo live tail tới khi stream kết thúc."""
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(self.tokens):
+                    position += 1
+                    yield self.tokens[position - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self._task.cancel()
 
 
 class LLMService:
-    """vLLM service wrapper với OpenAI-compatible API."""
+    """vLLM service wrapper với OpenAI-compatible API.
+
+    Main và grader model có thể chạy trên nhiều vLLM servers
+    (``vllm_main_endpoints`` / ``vllm_grader_endpoints``); mỗi request được
+    route tới endpoint tốt nhất của role tương ứng và failover sang endpoint
+    khác khi lỗi (stream: chỉ trước token đầu tiên).
+    """
 
     def __init__(
         self,
         base_url: Optional[str] = None,
         main_model: Optional[str] = None,
         grader_model: Optional[str] = None,
+        main_endpoints: Optional[List[str]] = None,
+        grader_endpoints: Optional[List[str]] = None,
     ):
-        self.base_url = base_url or settings.vllm_base_url
+        main_urls = (
+            main_endpoints
+            or ([base_url] if base_url else settings.vllm_main_endpoints)
+            or [settings.vllm_base_url]
+        )
+        grader_urls = grader_endpoints or settings.vllm_grader_endpoints or main_urls
+
         self.main_model = main_model or settings.vllm_main_model
         self.grader_model = grader_model or settings.vllm_grader_model
 
-        self._main_llm: Optional[ChatOpenAI] = None
-        self._grader_llm: Optional[ChatOpenAI] = None
-        self._circuit_breaker = CircuitBreaker()
+        self.pools: Dict[str, EndpointPool] = {
+            "main": self._make_pool("main", main_urls),
+            "grader": self._make_pool("grader", grader_urls),
+        }
+        self.base_url = self.pools["main"].endpoints[0].base_url
+        self._endpoint_llms: Dict[tuple, ChatOpenAI] = {}
+        self._custom_llms: Dict[tuple, ChatOpenAI] = {}
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=settings.llm_initial_concurrency,
+            min_limit=settings.llm_min_concurrency,
+            max_limit=settings.llm_max_concurrency,
+            ttft_target=settings.llm_ttft_target_seconds,
+            max_queue=settings.llm_max_queue,
+        )
+        self._flights: Dict[str, StreamFlight] = {}
+        self.single_flight_stats = {"leaders": 0, "followers": 0}
+        self.grader_cache = GraderResponseCache(
+            max_size=settings.grader_cache_size,
+            ttl_hours=settings.grader_cache_ttl_hours,
+        )
+        self.hedges = HedgeTracker(
+            quantile=settings.llm_hedge_quantile,
+            window=settings.llm_hedge_window,
+            min_samples=settings.llm_hedge_min_samples,
+            default_delay=settings.llm_hedge_default_delay_seconds,
+            max_latency=settings.vllm_read_timeout,
+        )
+
+    def http_client(self, base_url: Optional[str] = None) -> httpx.AsyncClient:
+        """Shared async HTTP client (connection pool) cho một vLLM endpoint."""
+        base_url = base_url or self.base_url
+        client = self._http_clients.get(base_url)
+        if client is None or client.is_closed:
+            kwargs: dict[str, Any] = {
+                "limits": httpx.Limits(
+                    max_connections=settings.vllm_max_connections,
+                    max_keepalive_connections=settings.vllm_max_keepalive_connections,
+                    keepalive_expiry=settings.vllm_keepalive_expiry,
+                ),
+                "timeout": httpx.Timeout(
+                    settings.vllm_read_timeout,
+                    connect=settings.vllm_connect_timeout,
+                    pool=settings.vllm_connect_timeout,
+                ),
+            }
+            try:
+                client = httpx.AsyncClient(http2=settings.vllm_http2, **kwargs)
+            except ImportError:
+                logger.warning("HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+                client = httpx.AsyncClient(**kwargs)
+            self._http_clients[base_url] = client
+        return client
+
+    def pool_stats(self) -> dict[str, Any]:
+        """Giới hạn connection pool đã cấu hình + số requests đang chạy mỗi endpoint."""
+        outstanding = {
+            endpoint.base_url: endpoint.outstanding
+            for pool in self.pools.values()
+            for endpoint in pool.endpoints
+        }
+        return {
+            "limits": {
+                "max_connections": settings.vllm_max_connections,
+                "max_keepalive_connections": settings.vllm_max_keepalive_connections,
+                "keepalive_expiry": settings.vllm_keepalive_expiry,
+                "http2": settings.vllm_http2,
+            },
+            "endpoints": {
+                base_url: {
+                    "outstanding": count,
+                    "client_open": base_url in self._http_clients,
+                }
+                for base_url, count in outstanding.items()
+            },
+        }
 
-    def _make_llm(self, model: str, temperature: float, top_p: Optional[float] = None) -> ChatOpenAI:
-        """Tạo ChatOpenAI instance trỏ vào vLLM server."""
+    async def aclose(self):
+        """Dừng health probes và đóng các HTTP clients (gọi khi shutdown)."""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        for client in self._http_clients.values():
+            await client.aclose()
+        self._http_clients.clear()
+
+    @staticmethod
+    def _make_pool(role: str, urls: List[str]) -> EndpointPool:
+        endpoints = [
+            Endpoint(url, CircuitBreaker(name=f"{role}@{url}"))
+            for url in dict.fromkeys(urls)  # bỏ trùng, giữ thứ tự
+        ]
+        return EndpointPool(role, endpoints)
+
+    def _pool(self, use_grader: bool) -> EndpointPool:
+        return self.pools["grader" if use_grader else "main"]
+
+    def _make_llm(
+        self,
+        model: str,
+        temperature: float,
+        top_p: Optional[float] = None,
+        base_url: Optional[str] = None,
+    ) -> ChatOpenAI:
+        """Tạo ChatOpenAI instance trỏ vào một vLLM server (dùng shared HTTP client)."""
+        base_url = base_url or self.base_url
         kwargs: dict[str, Any] = {
-            "base_url": self.base_url,
+            "base_url": base_url,
             "api_key": settings.vllm_api_key,
             "model": model,
-            "temperature": temperature
+            "temperature": temperature,
+            "http_async_client": self.http_client(base_url),
+            "timeout": httpx.Timeout(
+                settings.vllm_read_timeout,
+                connect=settings.vllm_connect_timeout,
+            ),
         }
         if top_p is not None:
             kwargs["top_p"] = top_p
         return ChatOpenAI(**kwargs)
 
+    def _llm_for(self, endpoint: Endpoint, use_grader: bool) -> ChatOpenAI:
+        """ChatOpenAI của main/grader model trên một endpoint (cached)."""
+        if use_grader:
+            key = (endpoint.base_url, self.grader_model, settings.vllm_grader_temperature, None)
+        else:
+            key = (endpoint.base_url, self.main_model, settings.vllm_main_temperature, settings.vllm_main_top_p)
+        llm = self._endpoint_llms.get(key)
+        if llm is None:
+            llm = self._make_llm(model=key[1], temperature=key[2], top_p=key[3], base_url=endpoint.base_url)
+            self._endpoint_llms[key] = llm
+        return llm
+
+    def _best_endpoint(self, use_grader: bool) -> Endpoint:
+        pool = self._pool(use_grader)
+        return pool.pick() or pool.endpoints[0]
+
     @property
     def main_llm(self) -> ChatOpenAI:
-        """LLM chính cho generation tasks."""
-        if self._main_llm is None:
-            self._main_llm = self._make_llm(
-                model=self.main_model,
-                temperature=settings.vllm_main_temperature,
-                top_p=settings.vllm_main_top_p,
-            )
-        return self._main_llm
+        """LLM chính cho generation tasks (trên endpoint tốt nhất hiện tại)."""
+        return self._llm_for(self._best_endpoint(use_grader=False), use_grader=False)
 
     @property
     def grader_llm(self) -> ChatOpenAI:
-        """LLM nhỏ hơn cho grading/evaluation tasks."""
-        if self._grader_llm is None:
-            self._grader_llm = self._make_llm(
-                model=self.grader_model,
-                temperature=settings.vllm_grader_temperature,
-            )
-        return self._grader_llm
+        """LLM nhỏ hơn cho grading/evaluation tasks (trên endpoint tốt nhất hiện tại)."""
+        return self._llm_for(self._best_endpoint(use_grader=True), use_grader=True)
 
     def get_llm(
         self,
@@ -117,42 +502,98 @@ class LLMService:
         temperature: float = 0.1,
         **kwargs: Any,
     ) -> ChatOpenAI:
-        """Tạo custom LLM instance."""
-        return self._make_llm(
-            model=model or self.main_model,
-            temperature=temperature,
-        )
+        """Custom LLM instance (cached theo endpoint + model + temperature)."""
+        base_url = self._best_endpoint(use_grader=False).base_url
+        key = (base_url, model or self.main_model, temperature)
+        if key not in self._custom_llms:
+            self._custom_llms[key] = self._make_llm(model=key[1], temperature=temperature, base_url=base_url)
+        return self._custom_llms[key]
+
+    # ── Endpoint health probes ─────────────────────────────────────────────
+
+    def start_health_probes(self):
+        """Chạy background task probe GET /health của mọi endpoints."""
+        if self._probe_task is None and settings.vllm_health_probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await self.probe_endpoints()
+            except Exception as e:
+                logger.debug(f"vLLM health probe error: {e}")
+            await asyncio.sleep(settings.vllm_health_probe_interval)
+
+    async def probe_endpoints(self) -> Dict[str, bool]:
+        """GET /health song song trên từng vLLM server; cập nhật ``Endpoint.healthy``."""
+        by_url: Dict[str, List[Endpoint]] = {}
+        for pool in self.pools.values():
+            for endpoint in pool.endpoints:
+                by_url.setdefault(endpoint.base_url, []).append(endpoint)
+
+        async def probe(endpoint: Endpoint) -> bool:
+            try:
+                resp = await self.http_client(endpoint.base_url).get(
+                    f"{endpoint.server_url}/health", timeout=5.0
+                )
+                return resp.status_code == 200
+            except Exception:
+                return False
+
+        urls = list(by_url)
+        results = await asyncio.gather(*(probe(by_url[url][0]) for url in urls))
+        for url, ok in zip(urls, results):
+            for endpoint in by_url[url]:
+                if endpoint.healthy != ok:
+                    logger.warning(f"vLLM endpoint {url} → {'healthy' if ok else 'DOWN'}")
+                endpoint.healthy = ok
+        return dict(zip(urls, results))
+
+    def _slot(self, priority: Priority):
+        """Admission slot (no-op khi tắt llm_admission_control)."""
+        if not settings.llm_admission_control:
+            return contextlib.nullcontext()
+        return self.limiter.slot(priority)
 
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=10),
+        retry=retry_if_not_exception_type(ServiceUnavailableError),
     )
     async def generate(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         use_grader: bool = False,
+        priority: Optional[Priority] = None,
+        hedge_class: Optional[str] = None,
         **kwargs: Any,
     ) -> str:
-        """Gọi LLM và trả về text response."""
+        """Gọi LLM và trả về text response.
+
+        ``priority`` mặc định: grader → BACKGROUND, main model → INTERACTIVE.
+        ``hedge_class`` (vd. "followup", "routing", "sql") bật hedging cho call
+        ngắn nằm trên critical path; latency được theo dõi riêng theo class.
+        """
         import re
 
-        if not self._circuit_breaker.can_attempt():
-            raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
+        if priority is None:
+            priority = Priority.BACKGROUND if use_grader else Priority.INTERACTIVE
 
-        llm = self.grader_llm if use_grader else self.main_llm
+        pool = self._pool(use_grader)
+        if not pool.has_available():
+            raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
 
         messages = []
         if system_prompt:
             messages.append(("system", system_prompt))
         messages.append(("human", prompt))
 
-        try:
-            response = await llm.ainvoke(messages, **kwargs)
-            self._circuit_breaker.record_success()
-        except Exception as e:
-            self._circuit_breaker.record_failure()
-            raise
+        async with self._slot(priority):
+            if hedge_class and settings.llm_hedging and len(pool.endpoints) > 1:
+                response = await self._invoke_hedged(pool, use_grader, messages, hedge_class, **kwargs)
+            else:
+                response = await self._invoke_with_failover(pool, use_grader, messages, **kwargs)
 
         content = response.content
 
@@ -162,126 +603,334 @@ class LLMService:
 
         return content.strip()
 
+    async def _invoke_on(self, endpoint: Endpoint, use_grader: bool, messages: list, **kwargs: Any) -> Any:
+        """ainvoke trên một endpoint, cập nhật breaker + EWMA của endpoint đó."""
+        started = time.monotonic()
+        try:
+            with endpoint.track():
+                response = await self._llm_for(endpoint, use_grader).ainvoke(messages, **kwargs)
+        except Exception as e:
+            endpoint.record_failure()
+            self.limiter.record_failure()
+            logger.warning(f"vLLM {'grader' if use_grader else 'main'}@{endpoint.base_url} failed: {e}")
+            raise
+        endpoint.record_success(time.monotonic() - started)
+        self.limiter.record_success()
+        return response
+
+    async def _invoke_with_failover(
+        self,
+        pool: EndpointPool,
+        use_grader: bool,
+        messages: list,
+        exclude: Optional[set] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """ainvoke trên endpoint tốt nhất; lỗi → thử lần lượt các endpoint còn lại."""
+        tried: set = set(exclude or ())
+        last_error: Optional[Exception] = None
+        while (endpoint := pool.pick(exclude=tried)) is not None:
+            tried.add(endpoint)
+            try:
+                return await self._invoke_on(endpoint, use_grader, messages, **kwargs)
+            except Exception as e:
+                last_error = e
+
+        if last_error is not None:
+            raise last_error
+        raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
+
+    async def _invoke_hedged(
+        self,
+        pool: EndpointPool,
+        use_grader: bool,
+        messages: list,
+        hedge_class: str,
+        **kwargs: Any,
+    ) -> Any:
+        """ainvoke có hedging: quá ngưỡng p95 của ``hedge_class`` mà chưa xong →
+        gửi bản sao tới endpoint khác; response về trước thắng, call còn lại bị hủy.
+
+        Không hedge khi admission limiter đã bão hòa (bản sao chỉ làm tải nặng
+        thêm). Cả hai đều lỗi → failover sang các endpoints còn lại.
+
+        Ngưỡng hedge học từ latency của lần gọi chính: bản hedge thắng thì lần
+        gọi chính bị hủy và được ghi bằng thời gian đã chờ (cận dưới); lần gọi
+        chính timeout thì ghi sample chặn trên.
+        """
+        primary = pool.pick()
+        if primary is None:
+            raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
+
+        started = time.monotonic()
+        primary_task = asyncio.create_task(self._invoke_on(primary, use_grader, messages, **kwargs))
+        tasks = {primary_task: primary}
+        primary_latency: Optional[float] = None
+        hedged = False
+        errors: List[Exception] = []
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedges.delay(hedge_class))
+            if not done and not self.limiter.saturated():
+                backup = pool.pick(exclude={primary})
+                if backup is not None:
+                    hedged = True
+                    logger.info(f"Hedging '{hedge_class}' call: {primary.base_url} → {backup.base_url}")
+                    tasks[asyncio.create_task(self._invoke_on(backup, use_grader, messages, **kwargs))] = backup
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if task is primary_task:
+                        if error is None:
+                            primary_latency = time.monotonic() - started
+                        elif isinstance(error, (APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+                            self.hedges.record_timeout(hedge_class)
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    if not primary_task.done():
+                        primary_latency = time.monotonic() - started  # sắp bị hủy: cận dưới
+                    self.hedges.record(
+                        hedge_class, primary_latency, hedged=hedged, hedge_won=task is not primary_task
+                    )
+                    return task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # tránh "exception was never retrieved" cho call thua
+
+        if pool.pick(exclude=set(tasks.values())) is None:
+            raise errors[-1]
+        return await self._invoke_with_failover(pool, use_grader, messages, exclude=set(tasks.values()), **kwargs)
+
     async def generate_stream(
         self,
         prompt: str,
         system_prompt: Optional[str] = None,
         use_grader: bool = False,
+        priority: Priority = Priority.INTERACTIVE,
         **kwargs: Any,
     ) -> AsyncGenerator[str, None]:
-        """Stream generate responses từ LLM."""
-        if not self._circuit_breaker.can_attempt():
+        """Stream generate responses từ LLM.
+
+        Khi ``llm_single_flight`` bật, các requests giống hệt nhau (model,
+        prompt, params) đang chạy đồng thời dùng chung một stream vLLM:
+        request đến sau nhận lại tokens đã phát rồi theo tiếp phần còn lại.
+        """
+        if not self._pool(use_grader).has_available():
             raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
 
-        llm = self.grader_llm if use_grader else self.main_llm
+        if not settings.llm_single_flight:
+            async for token in self._stream_tokens(prompt, system_prompt, use_grader, priority, **kwargs):
+                yield token
+            return
+
+        model = self.grader_model if use_grader else self.main_model
+        key = hashlib.sha256(
+            json.dumps([model, system_prompt, prompt, kwargs], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = StreamFlight(
+                self._stream_tokens(prompt, system_prompt, use_grader, priority, **kwargs),
+                on_done=lambda f: self._flights.pop(key, None) if self._flights.get(key) is f else None,
+            )
+            self._flights[key] = flight
+            self.single_flight_stats["leaders"] += 1
+        else:
+            self.single_flight_stats["followers"] += 1
+            logger.info(
+                f"Single-flight: attached to in-flight stream "
+                f"({len(flight.tokens)} tokens replayed, {flight.subscribers + 1} subscribers)"
+            )
+
+        async for token in flight.subscribe():
+            yield token
 
+    async def _stream_tokens(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        use_grader: bool = False,
+        priority: Priority = Priority.INTERACTIVE,
+        **kwargs: Any,
+    ) -> AsyncGenerator[str, None]:
+        """Stream tokens từ vLLM (lọc thinking tags), giữ admission slot tới khi xong."""
+        async with self._slot(priority):
+            async for token in self._astream_filtered(prompt, system_prompt, use_grader, **kwargs):
+                yield token
+
+    async def _astream_filtered(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        use_grader: bool = False,
+        **kwargs: Any,
+    ) -> AsyncGenerator[str, None]:
+        """Stream tokens từ vLLM, lọc thinking tags."""
         messages = []
         if system_prompt:
             messages.append(("system", system_prompt))
         messages.append(("human", prompt))
 
-        first_token = True
         buffer = ""
         in_think = False
 
-        try:
-            async for chunk in llm.astream(messages, **kwargs):
-                if not (hasattr(chunk, "content") and chunk.content):
-                    continue
-
-                if first_token:
-                    self._circuit_breaker.record_success()
-                    first_token = False
-
-                buffer += chunk.content
-
-                # Lọc <think>...</think> tags (reasoning models: qwen3, deepseek-r1)
-                while True:
-                    if in_think:
-                        end = buffer.find("</think>")
-                        if end == -1:
-                            end = buffer.find("</thinking>")
-                            tag_len = len("</thinking>")
-                        else:
-                            tag_len = len("</think>")
-
-                        if end != -1:
-                            buffer = buffer[end + tag_len:]
-                            in_think = False
-                        else:
-                            buffer = ""  # discard — vẫn trong think block
-                            break
+        async for content in self._astream_with_failover(self._pool(use_grader), use_grader, messages, **kwargs):
+            buffer += content
+
+            # Lọc <think>...</think> tags (reasoning models: qwen3, deepseek-r1)
+            while True:
+                if in_think:
+                    end = buffer.find("</think>")
+                    if end == -1:
+                        end = buffer.find("</thinking>")
+                        tag_len = len("</thinking>")
                     else:
-                        start = buffer.find("<think>")
-                        if start == -1:
-                            start = buffer.find("<thinking>")
-                        if start != -1:
-                            # Yield phần trước think tag
-                            if start > 0:
-                                yield buffer[:start]
-                            buffer = buffer[start:]
-                            in_think = True
-                        else:
-                            # Không có think tag — yield an toàn trừ tail có thể là đầu tag
-                            safe = max(0, len(buffer) - 12)  # len("<thinking>") + 2
-                            if safe > 0:
-                                yield buffer[:safe]
-                                buffer = buffer[safe:]
-                            break
-
-            # Flush phần còn lại sau khi stream kết thúc
-            if buffer and not in_think:
-                yield buffer
+                        tag_len = len("</think>")
 
-        except Exception as e:
-            self._circuit_breaker.record_failure()
-            raise
+                    if end != -1:
+                        buffer = buffer[end + tag_len:]
+                        in_think = False
+                    else:
+                        buffer = ""  # discard — vẫn trong think block
+                        break
+                else:
+                    start = buffer.find("<think>")
+                    if start == -1:
+                        start = buffer.find("<thinking>")
+                    if start != -1:
+                        # Yield phần trước think tag
+                        if start > 0:
+                            yield buffer[:start]
+                        buffer = buffer[start:]
+                        in_think = True
+                    else:
+                        # Không có think tag — yield an toàn trừ tail có thể là đầu tag
+                        safe = max(0, len(buffer) - 12)  # len("<thinking>") + 2
+                        if safe > 0:
+                            yield buffer[:safe]
+                            buffer = buffer[safe:]
+                        break
+
+        # Flush phần còn lại sau khi stream kết thúc
+        if buffer and not in_think:
+            yield buffer
+
+    async def _astream_with_failover(
+        self,
+        pool: EndpointPool,
+        use_grader: bool,
+        messages: list,
+        **kwargs: Any,
+    ) -> AsyncGenerator[str, None]:
+        """Raw content chunks từ endpoint tốt nhất.
 
-    async def generate_with_json(
+        Endpoint lỗi trước token đầu tiên → chuyển sang endpoint kế tiếp (user
+        không thấy lỗi). Đã phát token rồi thì không thể failover → raise.
+        """
+        tried: set = set()
+        last_error: Optional[Exception] = None
+        while (endpoint := pool.pick(exclude=tried)) is not None:
+            tried.add(endpoint)
+            llm = self._llm_for(endpoint, use_grader)
+            started = time.monotonic()
+            first_token = True
+            try:
+                with endpoint.track():
+                    async for chunk in llm.astream(messages, **kwargs):
+                        if not (hasattr(chunk, "content") and chunk.content):
+                            continue
+                        if first_token:
+                            ttft = time.monotonic() - started
+                            endpoint.record_success(ttft)
+                            self.limiter.record_ttft(ttft)
+                            first_token = False
+                        yield chunk.content
+                return
+            except Exception as e:
+                endpoint.record_failure()
+                self.limiter.record_failure()
+                if not first_token:
+                    raise
+                last_error = e
+                logger.warning(f"vLLM stream {pool.role}@{endpoint.base_url} failed before first token: {e}")
+
+        if last_error is not None:
+            raise last_error
+        raise ServiceUnavailableError("vLLM không khả dụng (circuit breaker open)")
+
+    async def generate_structured(
         self,
         prompt: str,
+        schema: Type[SchemaT],
         system_prompt: Optional[str] = None,
         use_grader: bool = False,
-    ) -> dict:
-        """Gọi LLM và parse JSON từ response."""
-        import json
-        import re
-
-        full_prompt = prompt + "\n\nRespond with valid JSON only. Do not include thinking tags."
+        priority: Optional[Priority] = None,
+        hedge_class: Optional[str] = None,
+    ) -> SchemaT:
+        """Gọi LLM với guided decoding theo JSON schema, trả về instance của ``schema``.
+
+        Khi ``llm_guided_decoding`` bật, vLLM ràng buộc output theo
+        ``schema.model_json_schema()`` (``response_format`` json_schema) nên
+        response luôn parse được, không cần regex hay retry vì lỗi format.
+        ``max_tokens`` giới hạn theo ``schema.MAX_TOKENS``. Với grader
+        (temperature 0) kết quả được cache theo (model, schema, prompt).
+
+        Raises:
+            ValidationError: Output không khớp schema (chỉ xảy ra khi tắt
+                guided decoding hoặc server không hỗ trợ).
+        """
+        guided = settings.llm_guided_decoding
+        full_prompt = prompt if guided else prompt + JSON_ONLY_SUFFIX
+
+        cache_key = None
+        if use_grader and settings.grader_cache_enabled and settings.vllm_grader_temperature == 0.0:
+            cache_key = self.grader_cache.key(f"{self.grader_model}:{schema.__name__}", system_prompt, full_prompt)
+            cached = await self.grader_cache.get(cache_key)
+            if cached is not None:
+                return schema.model_validate(cached)
+
+        kwargs: Dict[str, Any] = {"max_tokens": getattr(schema, "MAX_TOKENS", settings.llm_structured_max_tokens)}
+        if guided:
+            kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()},
+            }
 
         response = await self.generate(
             prompt=full_prompt,
             system_prompt=system_prompt,
             use_grader=use_grader,
+            priority=priority,
+            hedge_class=hedge_class,
+            **kwargs,
         )
 
-        response = response.strip()
-
-        # Loại bỏ thinking tags
-        response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL)
-        response = response.strip()
-
-        # Xử lý markdown code blocks
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-
-        response = response.strip()
-        json_match = re.search(r"\{.*\}", response, re.DOTALL)
-        if json_match:
-            response = json_match.group()
+        try:
+            result = schema.model_validate_json(response)
+        except ValidationError:
+            # Không có guided decoding → output tự do, thử bóc JSON trước khi validate
+            result = schema.model_validate(parse_json_response(response))
 
-        return json.loads(response.strip())
+        if cache_key is not None:
+            await self.grader_cache.put(cache_key, result.model_dump())
+        return result
 
     async def health_check(self) -> dict[str, bool]:
-        """Kiểm tra kết nối tới vLLM server.
+        """Kiểm tra kết nối tới các vLLM servers.
 
         vLLM expose:
           - GET /health → {"status": "healthy"}
           - GET /v1/models → danh sách models
+
+        ``vllm_server`` True nếu ít nhất một endpoint healthy; model "ready"
+        nếu ít nhất một endpoint của role đó đang serve model.
         """
         results = {
             "vllm_server": False,
@@ -289,54 +938,40 @@ class LLMService:
             "grader_model": False,
         }
 
-        # base_url dạng "http://host:8001/v1" → server_url = "http://host:8001"
-        server_url = self.base_url.rstrip("/").removesuffix("/v1")
-
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                # Kiểm tra /health endpoint
-                health_resp = await client.get(f"{server_url}/health")
-                if health_resp.status_code == 200:
-                    results["vllm_server"] = True
-
-                # Lấy danh sách models đang serve
-                models_resp = await client.get(
-                    f"{self.base_url}/models",
-                    headers={"Authorization": f"Bearer {settings.vllm_api_key}"},
-                )
-                if models_resp.status_code == 200:
-                    data = models_resp.json()
-                    available = [m["id"] for m in data.get("data", [])]
-
-                    # So sánh tên model (có thể là tên ngắn hoặc full path)
-                    main_base = self.main_model.split("/")[-1].lower()
-                    grader_base = self.grader_model.split("/")[-1].lower()
-
-                    for model_id in available:
-                        model_lower = model_id.lower()
-                        if main_base in model_lower or model_lower in main_base:
-                            results["main_model"] = True
-                        if grader_base in model_lower or model_lower in grader_base:
-                            results["grader_model"] = True
+            probes = await self.probe_endpoints()
+            results["vllm_server"] = any(probes.values())
+
+            for role, model in (("main", self.main_model), ("grader", self.grader_model)):
+                # So sánh tên model (có thể là tên ngắn hoặc full path)
+                model_base = model.split("/")[-1].lower()
+                for endpoint in self.pools[role].endpoints:
+                    if not probes.get(endpoint.base_url):
+                        continue
+                    available = [m.lower() for m in await self.list_models(endpoint.base_url)]
+                    if any(model_base in m or m in model_base for m in available):
+                        results[f"{role}_model"] = True
+                        break
 
         except Exception as e:
             logger.error(f"vLLM health check failed: {e}")
 
         return results
 
-    async def list_models(self) -> list[str]:
-        """Liệt kê models đang available trên vLLM server."""
+    async def list_models(self, base_url: Optional[str] = None) -> list[str]:
+        """Liệt kê models đang available trên một vLLM server (mặc định: endpoint đầu tiên)."""
+        base_url = base_url or self.base_url
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/models",
-                    headers={"Authorization": f"Bearer {settings.vllm_api_key}"},
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    return [m["id"] for m in data.get("data", [])]
+            response = await self.http_client(base_url).get(
+                f"{base_url}/models",
+                headers={"Authorization": f"Bearer {settings.vllm_api_key}"},
+                timeout=5.0,
+            )
+            if response.status_code == 200:
+                data = response.json()
+                return [m["id"] for m in data.get("data", [])]
         except Exception as e:
-            logger.error(f"Failed to list vLLM models: {e}")
+            logger.error(f"Failed to list vLLM models ({base_url}): {e}")
         return []
 
 
@@ -0,0 +1,96 @@
+"""ONNX Runtime backend (int8 dynamic quantization) cho embedding + cross-encoder.
+
+Dùng cho các replica chỉ có CPU: model được export sang ONNX một lần, quantize
+int8 (dynamic) và lưu vào ``settings.onnx_model_dir``; các lần khởi động sau
+load trực tiếp file đã quantize. Cần extra ``onnx``:
+
+    pip install -e ".[onnx]"
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Dict
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _quantized_file_name() -> str:
+    """Tên file ONNX đã quantize theo sentence-transformers convention."""
+    return f"onnx/model_qint8_{settings.onnx_quantization_config}.onnx"
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Thư mục lưu model ONNX của một HuggingFace model."""
+    return Path(settings.onnx_model_dir) / model_name.replace("/", "__")
+
+
+def _model_kwargs(file_name: str) -> Dict[str, Any]:
+    """model_kwargs cho ORTModel: provider CPU + giới hạn số threads."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if settings.onnx_intra_op_threads > 0:
+        options.intra_op_num_threads = settings.onnx_intra_op_threads
+    if settings.onnx_inter_op_threads > 0:
+        options.inter_op_num_threads = settings.onnx_inter_op_threads
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    return {
+        "file_name": file_name,
+        "provider": "CPUExecutionProvider",
+        "session_options": options,
+    }
+
+
+def _export_quantized(model_cls: Any, model_name: str, out_dir: Path, **init_kwargs: Any):
+    """Export model sang ONNX rồi quantize int8 (dynamic) vào out_dir."""
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    logger.info(f"Exporting '{model_name}' to ONNX → {out_dir}")
+    model = model_cls(model_name, backend="onnx", device="cpu", **init_kwargs)
+    model.save(str(out_dir))
+
+    config_factory = getattr(AutoQuantizationConfig, settings.onnx_quantization_config)
+    export_dynamic_quantized_onnx_model(
+        model,
+        quantization_config=config_factory(is_static=False, per_channel=False),
+        model_name_or_path=str(out_dir),
+        # Với config object, mặc định suffix là "qint8_quantized" → phải khớp _quantized_file_name()
+        file_suffix=f"qint8_{settings.onnx_quantization_config}",
+    )
+    logger.info(f"Quantized ONNX model saved: {out_dir / _quantized_file_name()}")
+
+
+def _load(model_cls: Any, model_name: str, **init_kwargs: Any) -> Any:
+    """Load model ONNX int8 (export + quantize nếu chưa có)."""
+    out_dir = onnx_model_dir(model_name)
+    file_name = _quantized_file_name()
+
+    if not (out_dir / file_name).exists():
+        _export_quantized(model_cls, model_name, out_dir, **init_kwargs)
+
+    logger.info(f"Loading ONNX model '{out_dir / file_name}'")
+    return model_cls(
+        str(out_dir),
+        backend="onnx",
+        device="cpu",
+        model_kwargs=_model_kwargs(file_name),
+        **init_kwargs,
+    )
+
+
+def load_sentence_transformer(model_name: str) -> Any:
+    """SentenceTransformer chạy ONNX Runtime int8."""
+    from sentence_transformers import SentenceTransformer
+
+    return _load(SentenceTransformer, model_name)
+
+
+def load_cross_encoder(model_name: str, max_length: int = 512) -> Any:
+    """CrossEncoder chạy ONNX Runtime int8."""
+    from sentence_transformers import CrossEncoder
+
+    return _load(CrossEncoder, model_name, max_length=max_length)
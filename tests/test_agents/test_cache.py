@@ -0,0 +1,158 @@
+"""Tests for the slot-based semantic cache and the retrieval-stage cache."""
+
+import time
+
+import numpy as np
+import pytest
+
+from src.agents.components import cache as cache_module
+from src.agents.components.cache import RetrievalCache, SemanticCache
+from src.agents.components.vector_store import get_store
+from src.core.config import settings
+
+
+def _unit(*values: float) -> np.ndarray:
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+@pytest.fixture
+def lru_cache(monkeypatch) -> SemanticCache:
+    """SemanticCache 2 slots, LRU, không Redis / ANN."""
+    monkeypatch.setattr(settings, "cache_eviction_policy", "lru")
+    monkeypatch.setattr(settings, "cache_ann_threshold", 0)
+    return SemanticCache(max_entries=2)
+
+
+def test_lookup_hits_similar_query(lru_cache: SemanticCache):
+    """Test cosine hit trên câu hỏi gần giống và miss trên câu khác."""
+    lru_cache.add("học phí", _unit(1, 0, 0), {"answer": "a"})
+
+    hit = lru_cache.lookup(_unit(1, 0.01, 0))
+    assert hit is not None
+    assert hit["response"] == {"answer": "a"}
+    assert hit["original_query"] == "học phí"
+
+    assert lru_cache.lookup(_unit(0, 1, 0)) is None
+    stats = lru_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_full_cache_reuses_evicted_slot(lru_cache: SemanticCache):
+    """Test cache đầy → slot của entry LRU được dùng lại cho entry mới."""
+    lru_cache.add("q1", _unit(1, 0, 0), {"answer": "1"})
+    lru_cache.add("q2", _unit(0, 1, 0), {"answer": "2"})
+    assert lru_cache.lookup(_unit(1, 0, 0)) is not None  # q1 vừa được dùng → q2 là LRU
+    q2_slot = next(i for i, e in enumerate(lru_cache._entries) if e and e["query_text"] == "q2")
+
+    lru_cache.add("q3", _unit(0, 0, 1), {"answer": "3"})
+
+    assert len(lru_cache) == 2
+    assert lru_cache._entries[q2_slot]["query_text"] == "q3"
+    assert lru_cache.lookup(_unit(0, 1, 0)) is None
+    assert lru_cache.lookup(_unit(0, 0, 1))["response"] == {"answer": "3"}
+    assert lru_cache.stats()["evictions"] == 1
+
+
+def test_tinylfu_full_cache_admits_new_question(monkeypatch):
+    """Test W-TinyLFU: cache đầy vẫn nhận câu hỏi mới, entry hay hỏi không bị đẩy ra."""
+    monkeypatch.setattr(settings, "cache_eviction_policy", "tinylfu")
+    monkeypatch.setattr(settings, "cache_ann_threshold", 0)
+    tinylfu_cache = SemanticCache(max_entries=3)
+    vectors = {name: _unit(*row) for name, row in zip(["q1", "q2", "q3", "q4"], np.eye(4))}
+
+    for name in ["q1", "q2", "q3"]:
+        assert tinylfu_cache.lookup(vectors[name], query_text=name) is None
+        tinylfu_cache.add(name, vectors[name], {"answer": name})
+    for _ in range(3):
+        assert tinylfu_cache.lookup(vectors["q1"], query_text="q1") is not None
+
+    assert tinylfu_cache.lookup(vectors["q4"], query_text="q4") is None
+    tinylfu_cache.add("q4", vectors["q4"], {"answer": "q4"})
+
+    assert tinylfu_cache.lookup(vectors["q4"])["response"] == {"answer": "q4"}
+    assert tinylfu_cache.lookup(vectors["q1"]) is not None
+    assert len(tinylfu_cache) == 3
+    assert tinylfu_cache.stats()["rejected"] == 0
+
+
+def test_expired_entries_are_dropped(lru_cache: SemanticCache):
+    """Test entry quá TTL không còn hit và slot được trả lại."""
+    lru_cache._ram_ttl_seconds = 0.05
+    lru_cache.add("q1", _unit(1, 0, 0), {"answer": "1"})
+    time.sleep(0.1)
+
+    assert lru_cache.lookup(_unit(1, 0, 0)) is None
+    assert len(lru_cache) == 0
+    assert lru_cache.stats()["expirations"] == 1
+
+
+def test_corpus_version_change_resets_slots(lru_cache: SemanticCache, monkeypatch):
+    """Test reindex (corpus_version tăng) xóa toàn bộ RAM slots."""
+    lru_cache.add("q1", _unit(1, 0, 0), {"answer": "1"})
+    assert lru_cache.lookup(_unit(1, 0, 0)) is not None
+
+    monkeypatch.setitem(get_store(), "corpus_version", get_store()["corpus_version"] + 1)
+
+    assert lru_cache.lookup(_unit(1, 0, 0)) is None
+    assert len(lru_cache) == 0
+
+
+async def test_redis_exact_hit_is_counted_and_promoted(lru_cache: SemanticCache):
+    """Test Redis exact hit được tính vào stats và đưa vào RAM slots."""
+    vec = _unit(1, 0, 0)
+    packed = SemanticCache._pack_entry("q1", vec, {"answer": "1"})
+
+    class FakeRedis:
+        async def hmget(self, key, *fields):
+            return [packed["q"], packed["resp"], packed["ts"]]
+
+    async def fake_get_redis():
+        return FakeRedis()
+
+    lru_cache._get_redis = fake_get_redis
+
+    for _ in range(2):
+        hit = await lru_cache.lookup_async("q1", vec)
+        assert hit["response"] == {"answer": "1"}
+        assert hit["similarity"] == 1.0
+
+    assert len(lru_cache) == 1  # lần 2 không chèn trùng
+    assert lru_cache.stats()["hits"] == 2
+    assert lru_cache.lookup(vec) is not None
+
+
+def test_retrieval_cache_hit_normalizes_query():
+    """Test retrieval cache khớp query sau khi chuẩn hóa hoa/thường, khoảng trắng."""
+    retrieval_cache = RetrievalCache(max_size=10)
+    retrieval_cache.put("Học phí  HVKTQS", "general", {"context": "ctx", "sources": [{"id": 1}]})
+
+    result = retrieval_cache.get("học phí hvktqs", "general")
+    assert result["context"] == "ctx"
+    result["sources"].append({"id": 2})  # caller sửa list không ảnh hưởng cache
+
+    assert retrieval_cache.get("học phí hvktqs", "general")["sources"] == [{"id": 1}]
+    assert retrieval_cache.get("học phí hvktqs", "list") is None
+    assert retrieval_cache.stats()["hits"] == 2
+
+
+def test_retrieval_cache_ttl_lru_and_corpus_version(monkeypatch):
+    """Test retrieval cache: hết TTL, bỏ LRU khi đầy, xóa khi corpus đổi."""
+    retrieval_cache = RetrievalCache(max_size=2, ttl_seconds=3600)
+    retrieval_cache.put("q1", "general", {"context": "1"})
+    retrieval_cache.put("q2", "general", {"context": "2"})
+    retrieval_cache.get("q1", "general")
+    retrieval_cache.put("q3", "general", {"context": "3"})
+    assert retrieval_cache.get("q2", "general") is None  # LRU bị bỏ
+    assert retrieval_cache.get("q1", "general") is not None
+
+    now = time.monotonic()
+    with monkeypatch.context() as m:
+        m.setattr(cache_module.time, "monotonic", lambda: now + 7200)
+        assert retrieval_cache.get("q1", "general") is None
+
+    retrieval_cache.put("q4", "general", {"context": "4"})
+    monkeypatch.setitem(get_store(), "corpus_version", get_store()["corpus_version"] + 1)
+    assert retrieval_cache.get("q4", "general") is None
+    assert retrieval_cache.stats()["invalidations"] == 1
@@ -0,0 +1,99 @@
+"""Tests for semantic cache eviction policies (LRU / LFU / W-TinyLFU)."""
+
+import numpy as np
+
+from src.agents.components.eviction import (
+    CountMinSketch,
+    EvictionPolicy,
+    LFUPolicy,
+    TinyLFUPolicy,
+    make_policy,
+)
+
+
+def test_count_min_sketch_estimates_counts():
+    """Test count-min sketch không bao giờ đếm thiếu."""
+    sketch = CountMinSketch(width=1024, sample_size=10_000)
+    for _ in range(5):
+        sketch.increment("hot")
+    sketch.increment("cold")
+
+    assert sketch.estimate("hot") >= 5
+    assert sketch.estimate("cold") >= 1
+    assert sketch.estimate("hot") > sketch.estimate("cold")
+    assert sketch.estimate("never") <= 1
+
+
+def test_count_min_sketch_ages_counts():
+    """Test sau ``sample_size`` increments mọi bộ đếm bị chia đôi."""
+    sketch = CountMinSketch(width=1024, sample_size=8)
+    for _ in range(7):
+        sketch.increment("hot")
+    assert sketch.estimate("hot") == 7
+
+    sketch.increment("hot")  # increment thứ 8 → halving
+    assert sketch.estimate("hot") == 4
+
+
+def test_tinylfu_new_entries_enter_the_window():
+    """Test W-TinyLFU luôn admit entry mới; window tràn → entry cũ nhất sang main."""
+    policy = TinyLFUPolicy(capacity=4)
+    assert policy.admit("one-off", "popular")
+    for slot, key in enumerate(["a", "b", "c"]):
+        policy.on_insert(slot, key)
+
+    assert policy._in_window.tolist() == [False, False, True, False]
+
+
+def test_tinylfu_window_candidate_competes_with_main_victim():
+    """Test candidate rời window chỉ thay LRU của main khi được hỏi nhiều hơn."""
+    policy = TinyLFUPolicy(capacity=3)
+    for _ in range(3):
+        policy.record_request("popular")
+    policy.record_request("one-off")
+    policy.on_insert(0, "popular")
+    policy.on_insert(1, "other")
+    policy.on_insert(2, "one-off")  # window = {one-off}, main = {popular, other}
+    occupied = np.array([True, True, True])
+
+    policy.record_request("other")
+    assert policy.victim(occupied) == 2  # one-off không hơn "other" (hòa) → bị loại
+
+    policy.on_remove(2)
+    policy.on_insert(2, "popular-later")
+    for _ in range(5):
+        policy.record_request("popular-later")
+    assert policy.victim(occupied) == 0  # candidate thắng → LRU của main bị loại
+    assert not policy._in_window[2]
+
+
+def test_lru_victim_is_least_recently_used():
+    """Test LRU chọn slot lâu không truy cập nhất."""
+    policy = EvictionPolicy(capacity=3)
+    for slot in range(3):
+        policy.on_insert(slot)
+    policy.on_hit(0)
+
+    occupied = np.array([True, True, True])
+    assert policy.victim(occupied) == 1
+    assert policy.victim(np.array([True, False, True])) == 2
+
+
+def test_lfu_victim_is_least_frequently_used():
+    """Test LFU chọn slot ít hit nhất, hòa thì slot cũ hơn."""
+    policy = LFUPolicy(capacity=3)
+    for slot in range(3):
+        policy.on_insert(slot)
+    policy.on_hit(0)
+    policy.on_hit(0)
+    policy.on_hit(2)
+
+    assert policy.victim(np.array([True, True, True])) == 1
+    policy.on_hit(1)
+    assert policy.victim(np.array([True, True, True])) == 2  # hòa 1 hit → slot 2 truy cập trước
+
+
+def test_make_policy_falls_back_to_lru():
+    """Test tên policy không hợp lệ → LRU."""
+    assert make_policy("TinyLFU", 4).name == "tinylfu"
+    assert make_policy("fifo", 4).name == "lru"
@@ -0,0 +1,109 @@
+"""Tests for the late-interaction (MaxSim) token vector index."""
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+from src.agents.components import late_interaction
+from src.agents.components.late_interaction import LateInteractionReranker, TokenVectorIndex
+from src.core.config import settings
+
+
+def _normalized(rng: np.random.Generator, rows: int, dim: int = 8) -> np.ndarray:
+    vecs = rng.standard_normal((rows, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def token_index(tmp_path):
+    """Index 3 chunks (2, 3, 1 tokens) ghi ra đĩa như ``build``."""
+    rng = np.random.default_rng(0)
+    docs = {"c1": _normalized(rng, 2), "c2": _normalized(rng, 3), "c3": _normalized(rng, 1)}
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([v.shape[0] for v in docs.values()])
+    np.save(tmp_path / "tokens.npy", np.concatenate(list(docs.values())).astype(np.float16))
+    np.save(tmp_path / "offsets.npy", offsets)
+    (tmp_path / "meta.json").write_text(json.dumps({"chunk_ids": list(docs), "fingerprint": "f"}))
+
+    index = TokenVectorIndex(index_dir=str(tmp_path))
+    assert index.load()
+    return index, docs
+
+
+def test_maxsim_matches_brute_force(token_index):
+    """Test MaxSim gộp (1 phép nhân ma trận) khớp tính riêng từng chunk."""
+    index, docs = token_index
+    query = _normalized(np.random.default_rng(1), 4)
+
+    scores = index.maxsim(query, ["c3", "c1", "missing", None, "c2"])
+
+    for cid, score in zip(["c3", "c1", None, None, "c2"], scores):
+        if cid is None:
+            assert score is None
+            continue
+        doc = docs[cid].astype(np.float16).astype(np.float32)
+        expected = float((doc @ query.T).max(axis=0).mean())
+        assert score == pytest.approx(expected, abs=1e-5)
+
+
+def test_maxsim_without_index_returns_none(tmp_path):
+    """Test chưa có index trên đĩa → mọi score là None."""
+    index = TokenVectorIndex(index_dir=str(tmp_path))
+    assert not index.load()
+    assert index.maxsim(np.ones((2, 8), dtype=np.float32), ["c1", "c2"]) == [None, None]
+
+
+def test_fingerprint_changes_with_content():
+    """Test fingerprint phụ thuộc cả chunk id lẫn nội dung."""
+    base = TokenVectorIndex.fingerprint(["c1", "c2"], ["a", "b"])
+    assert base == TokenVectorIndex.fingerprint(["c1", "c2"], ["a", "b"])
+    assert base != TokenVectorIndex.fingerprint(["c1", "c2"], ["a", "c"])
+    assert base != TokenVectorIndex.fingerprint(["c1", "c3"], ["a", "b"])
+
+
+def test_rebuild_swaps_generation_without_touching_mapped_files(tmp_path, monkeypatch):
+    """Test rebuild ghi generation mới; snapshot cũ đang dùng vẫn đọc được."""
+
+    class FakeEmbeddingService:
+        def encode_token_vectors(self, texts, batch_size=16):
+            return [np.full((len(text), 4), len(text) / 10, dtype=np.float32) for text in texts]
+
+    monkeypatch.setattr(late_interaction, "get_embedding_service", lambda: FakeEmbeddingService())
+    index = TokenVectorIndex(index_dir=str(tmp_path))
+
+    index.build(["c1", "c2"], ["ab", "abc"])
+    old_snapshot = index._snapshot
+    old_tokens = np.array(old_snapshot.tokens)
+    first_generation = (tmp_path / "CURRENT").read_text()
+
+    index.build(["c1"], ["abcd"])
+
+    assert (tmp_path / "CURRENT").read_text() != first_generation
+    assert not (tmp_path / first_generation).exists()
+    assert [p.name for p in tmp_path.glob("gen-*")] == [(tmp_path / "CURRENT").read_text()]
+    np.testing.assert_array_equal(np.array(old_snapshot.tokens), old_tokens)  # mmap cũ còn nguyên
+    assert index._snapshot.positions == {"c1": 0}
+    assert index.maxsim(np.ones((1, 4), dtype=np.float32), ["c1", "c2"])[1] is None
+
+    reloaded = TokenVectorIndex(index_dir=str(tmp_path))
+    assert reloaded.load()
+    assert reloaded._snapshot.fingerprint == index._snapshot.fingerprint
+
+
+async def test_late_interaction_scoring_times_out(monkeypatch):
+    """Test scoring quá ``reranker_timeout_seconds`` → None (fallback retrieval scores)."""
+    monkeypatch.setattr(settings, "reranker_timeout_seconds", 0.05)
+    reranker = LateInteractionReranker()
+
+    def slow_scores(query, chunks):
+        time.sleep(0.3)
+        return [1.0] * len(chunks)
+
+    monkeypatch.setattr(reranker, "_cross_encoder_scores", slow_scores)
+    assert await reranker._across_encoder_scores("q", [{"id": "c1"}]) is None
+
+    monkeypatch.setattr(settings, "reranker_timeout_seconds", 2.0)  # chờ cả call chậm còn trong executor
+    monkeypatch.setattr(reranker, "_cross_encoder_scores", lambda query, chunks: [0.5])
+    assert await reranker._across_encoder_scores("q", [{"id": "c1"}]) == [0.5]
@@ -0,0 +1,134 @@
+"""Tests for cross-encoder micro-batching and the CE score cache."""
+
+import asyncio
+import sys
+import threading
+import types
+
+import pytest
+
+from src.agents.components import reranker as reranker_module
+from src.agents.components.reranker import (
+    CrossEncoderBatcher,
+    CrossEncoderScoreCache,
+    HybridReranker,
+    preload_cross_encoder,
+)
+from src.agents.components.vector_store import get_store
+from src.core.config import settings
+
+
+class RecordingPredictor:
+    """Fake cross-encoder: score = độ dài passage, ghi lại từng batch."""
+
+    def __init__(self):
+        self.batches = []
+        self.threads = set()
+
+    def __call__(self, pairs):
+        self.batches.append(list(pairs))
+        self.threads.add(threading.current_thread().name)
+        return [float(len(passage)) for _, passage in pairs]
+
+
+async def test_batcher_merges_concurrent_requests():
+    """Test các requests đồng thời gộp vào 1 lần predict, kết quả đúng thứ tự."""
+    predictor = RecordingPredictor()
+    batcher = CrossEncoderBatcher(predictor, max_pairs=64, max_wait_ms=20)
+
+    first, second = await asyncio.gather(
+        batcher.submit([("q", "aaaa"), ("q", "a")]),
+        batcher.submit([("q", "aaa")]),
+    )
+
+    assert first == [4.0, 1.0]
+    assert second == [3.0]
+    assert len(predictor.batches) == 1
+    # Pairs được sort theo độ dài trước khi predict
+    assert [passage for _, passage in predictor.batches[0]] == ["a", "aaa", "aaaa"]
+    assert all(name.startswith("reranker") for name in predictor.threads)
+
+
+async def test_batcher_splits_at_max_pairs():
+    """Test batch không vượt quá ``max_pairs``."""
+    predictor = RecordingPredictor()
+    batcher = CrossEncoderBatcher(predictor, max_pairs=2, max_wait_ms=20)
+
+    await asyncio.gather(*(batcher.submit([("q", "x" * i)] * 2) for i in range(1, 4)))
+
+    assert [len(batch) for batch in predictor.batches] == [2, 2, 2]
+
+
+async def test_batcher_propagates_predict_errors():
+    """Test lỗi predict được raise cho mọi request trong batch."""
+
+    def failing_predict(pairs):
+        raise RuntimeError("model unavailable")
+
+    batcher = CrossEncoderBatcher(failing_predict, max_wait_ms=5)
+
+    results = await asyncio.gather(
+        batcher.submit([("q", "a")]),
+        batcher.submit([("q", "b")]),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert await batcher.submit([]) == []
+
+
+def test_score_cache_get_many_and_put_many():
+    """Test CE score cache: hit/miss theo (query, chunk, model), bỏ qua chunk không id."""
+    score_cache = CrossEncoderScoreCache(max_size=10)
+    fingerprint = CrossEncoderScoreCache.query_fingerprint("Học phí  HVKTQS")
+    assert fingerprint == CrossEncoderScoreCache.query_fingerprint("học phí hvktqs")
+
+    score_cache.put_many(fingerprint, ["c1", None, "c2"], "ce", [0.9, 0.5, 0.1])
+
+    scores = score_cache.get_many(fingerprint, ["c1", "c2", None, "c3"], "ce")
+    assert scores == [0.9, 0.1, None, None]
+    assert score_cache.get_many(fingerprint, ["c1"], "other-model") == [None]
+    stats = score_cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+
+
+def test_score_cache_lru_bound_and_corpus_invalidation(monkeypatch):
+    """Test CE score cache bỏ entry LRU khi đầy và xóa khi corpus đổi."""
+    score_cache = CrossEncoderScoreCache(max_size=2)
+    score_cache.put_many("q", ["c1", "c2"], "ce", [0.1, 0.2])
+    score_cache.get_many("q", ["c1"], "ce")
+    score_cache.put_many("q", ["c3"], "ce", [0.3])
+
+    assert score_cache.get_many("q", ["c1", "c2", "c3"], "ce") == [0.1, None, 0.3]
+
+    monkeypatch.setitem(get_store(), "corpus_version", get_store()["corpus_version"] + 1)
+    assert score_cache.get_many("q", ["c1", "c3"], "ce") == [None, None]
+    assert score_cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("raw, expected", [(-20.0, 0.0), (0.0, 0.5), (10.0, 1.0)])
+def test_normalize_ce_clamps_logits(raw, expected):
+    """Test logits cross-encoder được đưa về [0, 1]."""
+    assert HybridReranker._normalize_ce([raw]) == [expected]
+
+
+async def test_preload_shares_one_cross_encoder_per_process(monkeypatch):
+    """Test preload load model 1 lần trên reranker executor, mọi reranker dùng chung."""
+    loads = []
+
+    class FakeCrossEncoder:
+        def __init__(self, model_name, **kwargs):
+            loads.append((model_name, threading.current_thread().name))
+
+    fake_module = types.SimpleNamespace(CrossEncoder=FakeCrossEncoder)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake_module)
+    monkeypatch.setattr(settings, "reranker_backend", "torch")
+    monkeypatch.setattr(reranker_module, "_cross_encoders", {})
+
+    assert await preload_cross_encoder("fake/ce")
+    assert loads[0][1].startswith("reranker")
+
+    monkeypatch.setattr(settings, "cross_encoder_model", "fake/ce")
+    assert HybridReranker().model is HybridReranker().model
+    assert len(loads) == 1
@@ -0,0 +1,96 @@
+"""Tests for the adaptive admission controller in front of vLLM."""
+
+import asyncio
+
+import pytest
+
+from src.core.admission import AdaptiveConcurrencyLimiter, OverloadedError, Priority
+
+
+async def test_waiters_are_admitted_by_priority():
+    """Test khi có slot trống, request ưu tiên cao hơn được admit trước."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1)
+    await limiter.acquire(Priority.INTERACTIVE, timeout=1)  # giữ slot duy nhất
+
+    order = []
+
+    async def worker(priority: Priority):
+        await limiter.acquire(priority, timeout=1)
+        order.append(priority)
+        limiter.release()
+
+    tasks = [
+        asyncio.create_task(worker(priority))
+        for priority in (Priority.BACKGROUND, Priority.PLANNING, Priority.INTERACTIVE)
+    ]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == {"interactive": 1, "planning": 1, "background": 1}
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == [Priority.INTERACTIVE, Priority.PLANNING, Priority.BACKGROUND]
+    assert limiter.inflight == 0
+
+
+async def test_timed_out_waiter_is_removed_from_queue():
+    """Test waiter quá deadline bị shed và không còn chiếm chỗ trong hàng đợi."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1)
+    await limiter.acquire(Priority.INTERACTIVE, timeout=1)
+
+    with pytest.raises(OverloadedError):
+        await limiter.acquire(Priority.BACKGROUND, timeout=0.01)
+
+    assert limiter._queue == []
+    assert limiter.stats()["timeouts"] == 1
+    limiter.release()
+    assert not limiter.saturated()
+
+
+async def test_cancelled_waiter_is_removed_from_queue():
+    """Test waiter bị cancel được bỏ khỏi hàng đợi."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1)
+    await limiter.acquire(Priority.INTERACTIVE, timeout=1)
+
+    task = asyncio.create_task(limiter.acquire(Priority.PLANNING, timeout=1))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert limiter._queue == []
+
+
+async def test_full_queue_sheds_immediately():
+    """Test hàng đợi đầy → OverloadedError ngay, không chờ."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_queue=1)
+    await limiter.acquire(Priority.INTERACTIVE, timeout=1)
+    waiter = asyncio.create_task(limiter.acquire(Priority.PLANNING, timeout=1))
+    await asyncio.sleep(0)
+
+    with pytest.raises(OverloadedError):
+        await limiter.acquire(Priority.INTERACTIVE, timeout=1)
+    assert limiter.stats()["shed"] == 1
+
+    limiter.release()
+    await waiter
+
+
+def test_aimd_limit_adjustment():
+    """Test limit tăng cộng khi thành công, giảm nhân khi TTFT vượt target."""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=4, min_limit=2, max_limit=5, ttft_target=1.0, backoff=0.5
+    )
+
+    limiter.record_success()
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.record_ttft(0.2)
+    assert limiter.limit > 4.25
+
+    limiter.record_ttft(3.0)
+    assert limiter.limit == pytest.approx(2.2, abs=0.05)
+    limiter.record_failure()  # < 1s sau lần giảm trước → bỏ qua
+    assert limiter.limit == pytest.approx(2.2, abs=0.05)
+
+    for _ in range(100):
+        limiter.record_success()
+    assert limiter.limit == 5
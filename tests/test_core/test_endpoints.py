@@ -0,0 +1,80 @@
+"""Tests for vLLM endpoint load balancing."""
+
+from src.core.endpoints import Endpoint, EndpointPool
+from src.core.llm import CircuitBreaker
+
+
+def _pool(*urls: str, strategy: str = "least_outstanding") -> EndpointPool:
+    endpoints = [Endpoint(url, CircuitBreaker(name=url)) for url in urls]
+    return EndpointPool("main", endpoints, strategy=strategy)
+
+
+def _open_breaker(endpoint: Endpoint):
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD):
+        endpoint.record_failure()
+
+
+def test_pick_prefers_least_outstanding():
+    """Test chọn endpoint ít requests đang chạy nhất, hòa → EWMA thấp hơn."""
+    pool = _pool("http://a:8001/v1", "http://b:8001/v1/")
+    a, b = pool.endpoints
+    assert b.base_url == "http://b:8001/v1"
+    assert b.server_url == "http://b:8001"
+
+    a.record_success(0.5)
+    b.record_success(0.1)
+    assert pool.pick() is b
+
+    with b.track():
+        assert b.outstanding == 1
+        assert pool.pick() is a
+    assert b.outstanding == 0
+    assert pool.pick(exclude={b}) is a
+
+
+def test_latency_strategy_weights_by_outstanding():
+    """Test strategy latency: EWMA × (outstanding + 1)."""
+    pool = _pool("http://a/v1", "http://b/v1", strategy="latency")
+    a, b = pool.endpoints
+    a.record_success(1.0)
+    b.record_success(0.4)
+    assert pool.pick() is b
+
+    with b.track(), b.track():  # 0.4 × 3 > 1.0 × 1
+        assert pool.pick() is a
+
+
+def test_unhealthy_endpoint_used_only_as_last_resort():
+    """Test endpoint bị health probe đánh dấu down chỉ được chọn khi không còn lựa chọn."""
+    pool = _pool("http://a/v1", "http://b/v1")
+    a, b = pool.endpoints
+    a.healthy = False
+
+    assert pool.pick() is b
+    assert pool.pick(exclude={b}) is a
+
+    a.healthy = True
+    a.record_success(0.01)
+    b.record_success(1.0)
+    assert pool.pick() is a
+
+
+def test_open_breakers_exclude_endpoints():
+    """Test breaker open → endpoint bị loại; hết endpoint → None."""
+    pool = _pool("http://a/v1", "http://b/v1")
+    a, b = pool.endpoints
+
+    _open_breaker(a)
+    assert pool.pick() is b
+    assert pool.state() == "closed"
+    assert a.stats()["failures"] == CircuitBreaker.FAILURE_THRESHOLD
+
+    _open_breaker(b)
+    assert pool.pick() is None
+    assert not pool.has_available()
+    assert pool.state() == "open"
+
+
+def test_unknown_strategy_falls_back():
+    """Test strategy không hợp lệ → least_outstanding."""
+    assert _pool("http://a/v1", strategy="random").strategy == "least_outstanding"
@@ -0,0 +1,181 @@
+"""Tests for LLM service helpers."""
+
+import asyncio
+from typing import Optional
+
+import pytest
+
+from src.core.config import settings
+from src.core.llm import (
+    HedgeTracker,
+    LLMService,
+    ServiceUnavailableError,
+    StreamFlight,
+    parse_json_response,
+)
+
+
+async def _tokens(*tokens: str, delay: float = 0.0, error: Optional[Exception] = None):
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+    if error is not None:
+        raise error
+
+
+async def _collect(stream) -> list:
+    return [token async for token in stream]
+
+
+async def test_stream_flight_replays_tokens_to_late_subscriber():
+    """Test subscriber vào sau nhận lại các tokens đã phát rồi theo tiếp."""
+    finished = []
+    flight = StreamFlight(_tokens("a", "b", "c", delay=0.01), on_done=finished.append)
+
+    first = flight.subscribe()
+    assert await first.__anext__() == "a"
+    late = asyncio.create_task(_collect(flight.subscribe()))
+
+    assert ["a", *await _collect(first)] == ["a", "b", "c"]
+    assert await late == ["a", "b", "c"]
+    assert finished == [flight]
+    assert flight.subscribers == 0
+
+
+async def test_stream_flight_raises_source_error_to_all_subscribers():
+    """Test lỗi của source được raise cho mọi subscriber."""
+    flight = StreamFlight(_tokens("a", error=RuntimeError("vLLM down")))
+
+    results = await asyncio.gather(
+        _collect(flight.subscribe()),
+        _collect(flight.subscribe()),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_stream_flight_cancels_source_when_last_subscriber_leaves():
+    """Test subscriber cuối rời đi trước khi xong → source bị hủy."""
+    cancelled = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        finally:
+            cancelled.set()
+
+    flight = StreamFlight(endless())
+    first, second = flight.subscribe(), flight.subscribe()
+    assert await first.__anext__() == "x"
+    assert await second.__anext__() == "x"
+
+    await first.aclose()
+    await asyncio.sleep(0.03)
+    assert not cancelled.is_set()  # vẫn còn 1 subscriber
+
+    await second.aclose()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert flight.done
+    assert isinstance(flight.error, ServiceUnavailableError)
+    with pytest.raises(ServiceUnavailableError):
+        await _collect(flight.subscribe())
+
+
+def test_hedge_delay_uses_default_until_enough_samples():
+    """Test ngưỡng hedge = default_delay khi chưa đủ ``min_samples``."""
+    tracker = HedgeTracker(quantile=0.95, window=100, min_samples=5, default_delay=2.0)
+    for _ in range(4):
+        tracker.record("routing", 0.1, hedged=False, hedge_won=False)
+    assert tracker.delay("routing") == 2.0
+    assert tracker.delay("unknown") == 2.0
+
+
+def test_hedge_delay_is_p95_of_window():
+    """Test ngưỡng hedge là p95 latency trong cửa sổ, theo từng prompt class."""
+    tracker = HedgeTracker(quantile=0.95, window=100, min_samples=20)
+    for i in range(1, 101):
+        tracker.record("routing", i / 100, hedged=False, hedge_won=False)
+    tracker.record("sql", 3.0, hedged=False, hedge_won=False)
+
+    assert tracker.delay("routing") == pytest.approx(0.96)
+    assert tracker.delay("sql") == tracker._default_delay
+
+    for _ in range(100):  # cửa sổ trượt: samples cũ bị thay
+        tracker.record("routing", 0.2, hedged=False, hedge_won=False)
+    assert tracker.delay("routing") == pytest.approx(0.2)
+
+
+def test_hedge_timeouts_are_capped_samples():
+    """Test timeout và latency quá lớn được ghi bằng giá trị chặn trên."""
+    tracker = HedgeTracker(quantile=0.5, window=10, min_samples=2, max_latency=5.0)
+    tracker.record("grading", 30.0, hedged=True, hedge_won=True)
+    tracker.record_timeout("grading")
+    tracker.record("grading", None, hedged=True, hedge_won=True)  # primary lỗi nhanh
+
+    assert list(tracker._latencies["grading"]) == [5.0, 5.0]
+    stats = tracker.stats()["grading"]
+    assert stats["calls"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["hedge_rate"] == 1.0
+    assert stats["hedge_win_rate"] == 1.0
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeChat:
+    """ChatOpenAI giả: trả lời sau ``delay`` giây."""
+
+    def __init__(self, base_url: str, delay: float):
+        self.base_url = base_url
+        self.delay = delay
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self.delay)
+        return _Message(f"from {self.base_url}")
+
+
+async def test_hedged_call_records_primary_latency(monkeypatch):
+    """Test hedge thắng → sample là thời gian đã chờ lần gọi chính (không phải bản hedge)."""
+    monkeypatch.setattr(settings, "llm_hedge_default_delay_seconds", 0.05)
+    service = LLMService(main_endpoints=["http://a/v1", "http://b/v1"])
+    delays = {"http://a/v1": 1.0, "http://b/v1": 0.01}
+
+    def fake_llm_for(endpoint, use_grader):
+        return _FakeChat(endpoint.base_url, delays[endpoint.base_url])
+
+    monkeypatch.setattr(service, "_llm_for", fake_llm_for)
+
+    answer = await service.generate("câu hỏi", hedge_class="followup")
+
+    assert answer == "from http://b/v1"
+    [sample] = service.hedges._latencies["followup"]
+    assert sample >= 0.05
+    stats = service.hedges.stats()["followup"]
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        '{"intent": "rag", "confidence": 0.9}',
+        '<think>cần tra cứu tài liệu</think>\n{"intent": "rag", "confidence": 0.9}',
+        '```json\n{"intent": "rag", "confidence": 0.9}\n```',
+        'Kết quả: {"intent": "rag", "confidence": 0.9} — hết.',
+    ],
+)
+def test_parse_json_response_strips_wrappers(response):
+    """Test parse JSON từ output có thinking tags, code fences hoặc text thừa."""
+    assert parse_json_response(response) == {"intent": "rag", "confidence": 0.9}
+
+
+def test_parse_json_response_rejects_non_json():
+    """Test output không có JSON → ValueError (json.JSONDecodeError)."""
+    with pytest.raises(ValueError):
+        parse_json_response("Tôi không biết.")